@@ -0,0 +1,13 @@
+"""
+Micro-benchmarks, run from the root of the repository. For instance:
+
+    python -m benchmarks.notification_parsing
+"""
+import os
+
+import django
+
+
+def setup() -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    django.setup()
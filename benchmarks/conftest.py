@@ -0,0 +1,5 @@
+from . import setup
+
+
+def pytest_configure(config):
+    setup()
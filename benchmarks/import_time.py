@@ -0,0 +1,34 @@
+"""
+Measures what a process pays to load the app: the time to set up django and import the modules of datatrans
+(as a management command does), in a fresh interpreter each time, and the third party packages it imports.
+"""
+import os
+import subprocess
+import sys
+from statistics import median
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import datatrans.admin, datatrans.gateway, datatrans.urls
+print(time.perf_counter() - start)
+print(' '.join(m for m in ('requests', 'defusedxml', 'lxml', 'httpx', 'moneyed') if m in sys.modules))
+"""
+
+
+def main(number: int = 20) -> None:
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='tests.settings')
+    durations = []
+    for _ in range(number):
+        out = subprocess.run([sys.executable, '-c', SCRIPT], env=env, check=True, stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout.splitlines()
+        durations.append(float(out[0]))
+    print('{:<30} {:8.1f} ms (median of {} processes)'.format(
+        'django.setup and imports', median(durations) * 1e3, number))
+    print('{:<30} {}'.format('third party packages loaded', out[1] if len(out) > 1 else 'none'))
+
+
+if __name__ == '__main__':
+    main()
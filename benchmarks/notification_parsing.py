@@ -0,0 +1,72 @@
+"""
+Compares the lookup of the notification user parameters: one xpath search per parameter name (as
+parse_notification_xml used to do) against indexing all the parameters in a single pass (as it does now).
+
+The notifications are the fixtures of tests/gateway/test_notification.py.
+"""
+import ast
+import os
+import timeit
+from typing import List
+
+from . import setup
+
+# The names that parse_notification_xml looks up, in the order it looks them up for an alias registration.
+LOOKED_UP_NAMES = ['useAlias', 'returnCustomerCountry', 'expm', 'expy', 'maskedCC', 'aliasCC', 'sign2',
+                   'acqErrorCode', 'cardno']
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'tests', 'gateway', 'test_notification.py')
+
+
+def load_fixtures() -> List[str]:
+    with open(FIXTURES) as f:
+        tree = ast.parse(f.read())
+    return [node.value.value for node in ast.walk(tree)
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant)
+            and isinstance(node.value.value, str)
+            and any(isinstance(t, ast.Name) and t.id == 'xml' for t in node.targets)]
+
+
+def xpath_per_name(transaction) -> dict:
+    user_parameters = transaction.find('userParameters')
+    found = {}
+    for name in LOOKED_UP_NAMES:
+        parameter = user_parameters.find("parameter[@name='" + name + "']")
+        if parameter is not None:
+            found[name] = parameter.text
+    return found
+
+
+def single_pass(transaction) -> dict:
+    parameters = {p.get('name'): p.text for p in transaction.iterfind('userParameters/parameter')}
+    return {name: parameters[name] for name in LOOKED_UP_NAMES if name in parameters}
+
+
+def main(number: int = 20000) -> None:
+    setup()
+    from defusedxml.ElementTree import fromstring
+    from datatrans.gateway.notification import parse_notification_xml
+
+    fixtures = load_fixtures()
+    transactions = [fromstring(xml).find('body/transaction') for xml in fixtures]
+    for transaction in transactions:
+        assert xpath_per_name(transaction) == single_pass(transaction)
+
+    def parse_all():
+        for xml in fixtures:
+            try:
+                parse_notification_xml(xml)
+            except ValueError:
+                pass  # The fixture with a wrong sign2
+
+    print('{} notification fixtures, {} iterations'.format(len(fixtures), number))
+    for name, lookup in [('xpath per name', xpath_per_name), ('single pass', single_pass)]:
+        seconds = timeit.timeit(lambda: [lookup(t) for t in transactions], number=number)
+        print('{:<30} {:8.2f} us per notification'.format(name, seconds / number / len(fixtures) * 1e6))
+    seconds = timeit.timeit(parse_all, number=number // 10)
+    print('{:<30} {:8.2f} us per notification'.format(
+        'parse_notification_xml', seconds / (number // 10) / len(fixtures) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Compares the throughput of signing with a new hmac per signature (as datatrans.config used to do),
+with a copy of a pre-keyed hmac (sign_web), and with the batch api (sign_many).
+"""
+import hashlib
+import hmac
+import timeit
+
+from . import setup
+
+ROWS = [('1111111111', amount, 'CHF', 'ref-{}'.format(amount)) for amount in range(1000)]
+
+
+def main(number: int = 200) -> None:
+    setup()
+    from django.conf import settings
+    from datatrans.config import sign_many, sign_web
+
+    key = bytearray.fromhex(settings.DATATRANS['WEB_HMAC_KEY'])
+
+    def sign_with_new_hmac(*values):
+        return hmac.new(key=key, msg=''.join(map(str, values)).encode('utf-8'), digestmod=hashlib.sha256).hexdigest()
+
+    assert [sign_with_new_hmac(*row) for row in ROWS] == [sign_web(*row) for row in ROWS] == sign_many(ROWS)
+
+    candidates = [
+        ('new hmac per signature', lambda: [sign_with_new_hmac(*row) for row in ROWS]),
+        ('sign_web', lambda: [sign_web(*row) for row in ROWS]),
+        ('sign_many', lambda: sign_many(ROWS)),
+    ]
+    for name, sign_all in candidates:
+        seconds = timeit.timeit(sign_all, number=number)
+        print('{:<30} {:10.0f} signatures per second'.format(name, number * len(ROWS) / seconds))
+
+
+if __name__ == '__main__':
+    main()
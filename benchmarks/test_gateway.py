@@ -0,0 +1,166 @@
+"""
+Benchmarks of the gateway hot paths. Run them with:
+
+    pip install pytest-benchmark
+    pytest benchmarks --benchmark-json=benchmark.json
+
+Two json exports can be compared with `pytest-benchmark compare`, to catch regressions between releases.
+"""
+from itertools import count
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+from moneyed import Money
+
+from datatrans.config import config, sign_web
+from datatrans.gateway import build_payment_parameters
+from datatrans.gateway.notification import parse_notification_record, parse_notification_xml
+from datatrans.gateway.payment_with_alias import (build_pay_with_alias_request_tree_xml,
+                                                  build_pay_with_alias_request_xml, parse_pay_with_alias_response_xml)
+from datatrans.gateway.refunding import (build_refund_request_tree_xml, build_refund_request_xml,
+                                         parse_refund_response_xml)
+from datatrans.models import AliasRegistration
+from tests.gateway.fixtures import ALIAS_REGISTRATION_NOTIFICATION
+
+
+PAY_WITH_ALIAS_RESPONSE = b"""<?xml version='1.0' encoding='utf8'?>
+<authorizationService version='3'>
+  <body merchantId='2222222222' status='accepted'>
+    <transaction refno='1234' trxStatus='response'>
+      <request>
+        <amount>1000</amount>
+        <currency>CHF</currency>
+        <aliasCC>70119122433810042</aliasCC>
+        <expm>12</expm>
+        <expy>18</expy>
+        <reqtype>CAA</reqtype>
+        <sign>redacted</sign>
+      </request>
+      <response>
+        <responseCode>01</responseCode>
+        <responseMessage>Authorized</responseMessage>
+        <uppTransactionId>170717104749732144</uppTransactionId>
+        <authorizationCode>749762145</authorizationCode>
+        <acqAuthorizationCode>104749</acqAuthorizationCode>
+        <maskedCC>424242xxxxxx4242</maskedCC>
+        <returnCustomerCountry>CHE</returnCustomerCountry>
+      </response>
+    </transaction>
+  </body>
+</authorizationService>"""
+
+REFUND_RESPONSE = b"""<?xml version='1.0' encoding='utf8'?>
+<paymentService version='1'>
+  <body merchantId='2222222222' status='accepted'>
+    <transaction refno='1234-r' trxStatus='response'>
+      <request>
+        <amount>500</amount>
+        <currency>CHF</currency>
+        <uppTransactionId>170717104749732144</uppTransactionId>
+        <transtype>06</transtype>
+        <sign>redacted</sign>
+        <reqtype>COA</reqtype>
+      </request>
+      <response>
+        <responseCode>01</responseCode>
+        <responseMessage>credit succeeded</responseMessage>
+        <uppTransactionId>171015120225118036</uppTransactionId>
+        <authorizationCode>225128037</authorizationCode>
+        <acqAuthorizationCode>120225</acqAuthorizationCode>
+      </response>
+    </transaction>
+  </body>
+</paymentService>"""
+
+transaction_ids = count(170707111922838874)
+
+
+def notification() -> str:
+    """ A valid alias registration notification, with a new transaction id. """
+    transaction_id = str(next(transaction_ids))
+    return ALIAS_REGISTRATION_NOTIFICATION.format(
+        transaction_id=transaction_id, sign2=sign_web('1111111111', '0', 'CHF', transaction_id))
+
+
+ALIAS_REGISTRATION = AliasRegistration(
+    success=True,
+    transaction_id='170707111922838874',
+    merchant_id='1111111111',
+    request_type='CAA',
+    masked_card_number='424242xxxxxx4242',
+    card_alias='70119122433810042',
+    expiry_month=12,
+    expiry_year=18,
+    client_ref='1234',
+    amount=Money(0, 'CHF'),
+    payment_method='VIS',
+)
+
+
+def test_parse_notification_xml(benchmark):
+    benchmark(parse_notification_xml, notification())
+
+
+def test_parse_notification_record(benchmark):
+    """ Parsing only, without instantiating the model (as for a duplicate notification). """
+    benchmark(parse_notification_record, notification())
+
+
+def test_build_pay_with_alias_request_xml(benchmark):
+    benchmark(build_pay_with_alias_request_xml, Money(123, 'CHF'), 'abcdef', ALIAS_REGISTRATION)
+
+
+def test_build_pay_with_alias_request_tree_xml(benchmark):
+    """ The ElementTree builder, used when the byte template does not apply. """
+    benchmark(build_pay_with_alias_request_tree_xml, merchant_id='2222222222', client_ref='abcdef', amount='12300',
+              currency='CHF', card_alias='70119122433810042', expiry_month='12', expiry_year='18', sign='redacted')
+
+
+def test_parse_pay_with_alias_response_xml(benchmark):
+    benchmark(parse_pay_with_alias_response_xml, PAY_WITH_ALIAS_RESPONSE)
+
+
+def test_build_refund_request_xml(benchmark):
+    benchmark(build_refund_request_xml, Money(123, 'CHF'), 'abcdef-r', '170717104749732144', '2222222222')
+
+
+def test_build_refund_request_tree_xml(benchmark):
+    """ The ElementTree builder, used when the byte template does not apply. """
+    benchmark(build_refund_request_tree_xml, merchant_id='2222222222', client_ref='abcdef-r', amount='12300',
+              currency='CHF', original_transaction_id='170717104749732144', sign='redacted')
+
+
+def test_parse_refund_response_xml(benchmark):
+    benchmark(parse_refund_response_xml, REFUND_RESPONSE)
+
+
+def test_sign_web(benchmark):
+    benchmark(sign_web, '1111111111', 850, 'CHF', '91827364')
+
+
+def test_sign_with_merchant_lookup(benchmark):
+    """ As the notifications are verified: the key is looked up by the merchantId of the document. """
+    benchmark(lambda: config.merchant('1111111111').sign('1111111111', 850, 'CHF', '91827364'))
+
+
+def test_build_payment_parameters(benchmark):
+    benchmark(build_payment_parameters, Money(8.50, 'CHF'), '91827364')
+
+
+@pytest.mark.django_db
+def test_webhook_handler(benchmark):
+    """ The whole request cycle: parsing, signature verification, saving, and signals. """
+    client = Client()
+    url = reverse('datatrans_webhook')
+
+    posted = []
+
+    def post(xml):
+        response = client.post(url, content_type='text/xml', data=xml)
+        assert response.status_code == 200
+        posted.append(xml)
+
+    benchmark.pedantic(post, setup=lambda: ((notification(),), {}), rounds=200)
+    # Under --benchmark-disable the function runs once, not once per round.
+    assert AliasRegistration.objects.count() == len(posted)
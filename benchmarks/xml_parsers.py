@@ -0,0 +1,27 @@
+"""
+Compares the xml parser backends (see datatrans/gateway/xml_parsing.py) on the notifications that are the
+fixtures of tests/gateway/test_notification.py.
+"""
+import timeit
+
+from . import setup
+from .notification_parsing import load_fixtures
+
+
+def main(number: int = 2000) -> None:
+    setup()
+    from datatrans.gateway.xml_parsing import get_backend
+
+    fixtures = load_fixtures()
+    for name in ['defusedxml', 'lxml']:
+        try:
+            fromstring = get_backend(name)
+        except ImportError:
+            print('{:<30} not installed'.format(name))
+            continue
+        seconds = timeit.timeit(lambda: [fromstring(xml) for xml in fixtures], number=number)
+        print('{:<30} {:10.0f} documents per second'.format(name, number * len(fixtures) / seconds))
+
+
+if __name__ == '__main__':
+    main()
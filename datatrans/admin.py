@@ -1,14 +1,23 @@
+import re
+from functools import reduce
+from operator import or_
+from typing import Pattern, Sequence, Tuple
+
 from django.contrib import admin
+from django.db.models import Q
 from django.forms import CharField, TextInput, forms
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import re_path, reverse
 from django.utils.html import format_html
 from djmoney.forms import MoneyField
 from moneyed.localization import format_money
 
-from .gateway import pay_with_alias, refund
-from .models import AliasRegistration, Payment, Refund
+from . import gateway
+from .export import FORMATS, export
+from .facets import CachedValuesFieldListFilter
+from .models import AliasRegistration, InboxNotification, Payment, ReconciliationResult, Refund
+from .pagination import KeysetPaginator
 
 
 def expiry(obj):
@@ -20,6 +29,60 @@ def amount(obj):
     return format_money(obj.amount)
 
 
+def refundable(obj):
+    return format_money(obj.refundable_amount)
+
+
+def export_action(format):
+    def export_selected(modeladmin, request, queryset):
+        response = StreamingHttpResponse(export(queryset, format), content_type=FORMATS[format])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+            queryset.model._meta.verbose_name_plural.replace(' ', '_'), format)
+        return response
+
+    export_selected.__name__ = 'export_as_{}'.format(format)
+    export_selected.short_description = 'Export selected %(verbose_name_plural)s as {}'.format(  # type: ignore
+        format.upper())
+    return export_selected
+
+
+export_actions = [export_action('csv'), export_action('jsonl')]
+
+UUID_TERM = re.compile(r'^[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}$', re.IGNORECASE)
+TRANSACTION_ID_TERM = re.compile(r'^\d{18}$')
+CARD_TAIL_TERM = re.compile(r'^\d{4}$')
+
+
+class RoutedSearchMixin:
+    """
+    Routes the terms that look like an identifier to equality lookups on indexed columns, instead of
+    OR-ing an icontains over every column (which scans the whole table).
+
+    - search_routes: for each kind of term, the lookups to OR together. The first matching kind wins.
+    - exact_search_fields: indexed columns tried for equality on any other single word (a refno, a card alias).
+    - search_fields: the columns scanned with icontains, only when nothing above matched.
+    """
+    search_routes: Sequence[Tuple[Pattern, Sequence[str]]] = ()
+    exact_search_fields: Sequence[str] = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        for pattern, lookups in self.search_routes:
+            if pattern.match(term):
+                return queryset.filter(_any(lookups, term)), False
+        if self.exact_search_fields and ' ' not in term:
+            exact = queryset.filter(_any(self.exact_search_fields, term))
+            if exact.exists():
+                return exact, False
+        return super().get_search_results(request, queryset, search_term)  # type: ignore
+
+
+def _any(lookups: Sequence[str], value: str) -> Q:
+    return reduce(or_, (Q(**{lookup: value}) for lookup in lookups))
+
+
 class PayWithAliasForm(forms.Form):
     amount = MoneyField(min_value=0, default_currency='CHF')
     client_ref = CharField(required=True, max_length=18, widget=TextInput(attrs={'size': 18}))
@@ -29,7 +92,7 @@ def pay_with_alias_form(request, alias_registration_id):
     if request.method == 'POST':
         form = PayWithAliasForm(request.POST)
         if form.is_valid():
-            result = pay_with_alias(
+            result = gateway.pay_with_alias(
                 amount=form.cleaned_data['amount'],
                 alias_registration_id=alias_registration_id,
                 client_ref=form.cleaned_data['client_ref'],
@@ -53,19 +116,26 @@ def pay_with_alias_form(request, alias_registration_id):
 
 
 @admin.register(AliasRegistration)
-class AliasRegistrationAdmin(admin.ModelAdmin):
+class AliasRegistrationAdmin(RoutedSearchMixin, admin.ModelAdmin):
     date_hierarchy = 'created'
-    readonly_fields = ['created', 'modified', 'expiry_date', 'pay_with_alias_button']
+    readonly_fields = ['created', 'modified', 'expiry_date', 'card_tail', 'pay_with_alias_button']
     list_display = [
         'transaction_id', 'created', 'success', 'client_ref', amount, 'payment_method', 'card_alias',
         'masked_card_number', expiry,
         'credit_card_country', 'error_code', 'pay_with_alias_button']
-    search_fields = [
-        'transaction_id', 'created', 'expiry_date', 'payment_method', 'card_alias', 'masked_card_number',
-        'expiry_month', 'expiry_year', 'credit_card_country', 'client_ref', 'response_code',
-        'authorization_code', 'acquirer_authorization_code', 'error_code', 'error_message', 'error_detail']
-    list_filter = ['success', 'payment_method', 'credit_card_country']
-    ordering = ['-created']
+    search_routes = [
+        (UUID_TERM, ['id']),
+        (TRANSACTION_ID_TERM, ['transaction_id', 'client_ref']),
+        (CARD_TAIL_TERM, ['card_tail', 'client_ref']),
+    ]
+    exact_search_fields = ['client_ref', 'card_alias']
+    search_fields = ['client_ref', 'masked_card_number', 'error_message', 'error_detail']
+    list_filter = ['success', ('payment_method', CachedValuesFieldListFilter),
+                   ('credit_card_country', CachedValuesFieldListFilter)]
+    ordering = ['-created', '-id']
+    paginator = KeysetPaginator
+    show_full_result_count = False
+    actions = export_actions
 
     def get_urls(self):
         urls = super().get_urls()
@@ -97,13 +167,13 @@ def refund_payment_form(request, payment_id):
     if request.method == 'POST':
         form = RefundPaymentForm(request.POST)
         if form.is_valid():
-            result = refund(
+            result = gateway.refund(
                 amount=form.cleaned_data['amount'],
                 payment_id=payment_id)
             # As confirmation we take the user to the edit page of the refund.
             return HttpResponseRedirect(reverse('admin:datatrans_refund_change', args=[result.id]))
     else:
-        form = RefundPaymentForm(initial={'amount': payment.amount})
+        form = RefundPaymentForm(initial={'amount': payment.refundable_amount})
 
     return render(
         request,
@@ -118,27 +188,28 @@ def refund_payment_form(request, payment_id):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(RoutedSearchMixin, admin.ModelAdmin):
     date_hierarchy = 'created'
     list_display = [
-        'transaction_id', 'created', 'success', 'client_ref', amount, 'payment_method', 'card_alias',
+        'transaction_id', 'created', 'success', 'client_ref', amount, refundable, 'payment_method', 'card_alias',
         'masked_card_number', expiry,
         'credit_card_country', 'error_code', 'refund_button']
-    search_fields = [
-        'id', 'transaction_id', 'created', 'expiry_date', 'payment_method', 'card_alias', 'masked_card_number',
-        'amount',
-        'expiry_month', 'expiry_year', 'credit_card_country', 'client_ref', 'response_code',
-        'authorization_code', 'acquirer_authorization_code', 'error_code', 'error_message', 'error_detail']
-    list_filter = ['success', 'payment_method', 'credit_card_country',
-                   ('amount_currency', admin.AllValuesFieldListFilter)]
-    ordering = ['-created']
-
-    readonly_fields = ['created', 'modified', 'refund_button']
-
-    def get_search_results(self, request, queryset, search_term):
-        """ Allow searching by hyphenated uuid. """
-        search_term = search_term.replace('-', '')
-        return super().get_search_results(request, queryset, search_term)
+    search_routes = [
+        (UUID_TERM, ['id']),
+        (TRANSACTION_ID_TERM, ['transaction_id', 'client_ref']),
+        (CARD_TAIL_TERM, ['card_tail', 'client_ref']),
+    ]
+    exact_search_fields = ['client_ref', 'card_alias']
+    search_fields = ['client_ref', 'masked_card_number', 'error_message', 'error_detail']
+    list_filter = ['success', ('payment_method', CachedValuesFieldListFilter),
+                   ('credit_card_country', CachedValuesFieldListFilter),
+                   ('amount_currency', CachedValuesFieldListFilter)]
+    ordering = ['-created', '-id']
+    paginator = KeysetPaginator
+    show_full_result_count = False
+    actions = export_actions
+
+    readonly_fields = ['created', 'modified', 'refunded_total', 'card_tail', 'refund_button']
 
     def get_urls(self):
         urls = super().get_urls()
@@ -152,7 +223,7 @@ class PaymentAdmin(admin.ModelAdmin):
         return my_urls + urls
 
     def refund_button(self, obj):
-        if obj.success:
+        if obj.success and obj.refundable_amount.amount > 0:
             return format_html('<a class="button" href="{}">Refund</a>',
                                reverse('admin:datatrans_payment_refund', args=[obj.pk]))
         else:
@@ -171,7 +242,7 @@ link_to_payment.short_description = 'Original payment'  # type: ignore
 
 
 @admin.register(Refund)
-class RefundAdmin(admin.ModelAdmin):
+class RefundAdmin(RoutedSearchMixin, admin.ModelAdmin):
     date_hierarchy = 'created'
     readonly_fields = ['created', 'modified']
     list_display = [
@@ -179,8 +250,34 @@ class RefundAdmin(admin.ModelAdmin):
         'error_message']
     list_display_links = ['transaction_id']
 
-    search_fields = [
-        'transaction_id', 'payment_transaction_id', 'created', 'client_ref', 'amount', 'response_code',
-        'authorization_code', 'acquirer_authorization_code', 'error_code', 'error_message', 'error_detail']
-    list_filter = ['success', ('amount_currency', admin.AllValuesFieldListFilter)]
-    ordering = ['-created']
+    search_routes = [
+        (UUID_TERM, ['id']),
+        (TRANSACTION_ID_TERM, ['transaction_id', 'payment_transaction_id', 'client_ref']),
+    ]
+    exact_search_fields = ['client_ref']
+    search_fields = ['client_ref', 'error_message', 'error_detail']
+    list_filter = ['success', ('amount_currency', CachedValuesFieldListFilter)]
+    ordering = ['-created', '-id']
+    paginator = KeysetPaginator
+    show_full_result_count = False
+    actions = export_actions
+
+
+@admin.register(InboxNotification)
+class InboxNotificationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'received', 'attempts', 'last_error']
+    readonly_fields = ['received', 'body', 'attempts', 'last_error', 'claimed_until']
+    ordering = ['id']
+
+
+@admin.register(ReconciliationResult)
+class ReconciliationResultAdmin(admin.ModelAdmin):
+    list_display = ['transaction_id', 'created', 'report', 'line', 'status', 'transaction_type',
+                    'reported_amount', 'reported_currency', 'recorded_amount', 'recorded_currency']
+    list_filter = ['status', 'transaction_type', 'report']
+    search_fields = ['=transaction_id', '=run']
+    ordering = ['-created', 'line']
+    actions = export_actions
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
@@ -5,3 +5,7 @@ class DatatransConfig(AppConfig):
     name = 'datatrans'
     verbose_name = 'Datatrans'
     default_auto_field = 'django.db.models.AutoField'
+
+    def ready(self):
+        from .facets import connect_signals
+        connect_signals()
@@ -0,0 +1,89 @@
+"""
+Logging of the xml documents exchanged with datatrans (and of the notifications), at a controlled cost.
+
+The bodies are wrapped in a LoggedBody, which is only rendered if the log event is actually rendered.
+How it is rendered is configured in the settings:
+
+    DATATRANS = {
+        ...
+        # 'full' (the default): the whole body, 'hash': its sha256 and size, 'size': only its size.
+        'BODY_LOGGING': 'hash',
+        # In 'full' mode, the number of bytes kept (unlimited by default).
+        'BODY_LOG_MAX_SIZE': 4096,
+        # The proportion of the events, by event name, that log their body in the mode above.
+        # The body of the other events is only logged by size.
+        'BODY_LOG_SAMPLING': {'sending-pay-with-alias-request': 0.01},
+    }
+
+The complete bodies can be logged on demand, whatever the settings, within `with full_body_logging():`.
+"""
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from .config import config
+
+_override = threading.local()
+
+
+class LoggedBody:
+    __slots__ = ('event', 'body', 'mode', 'max_size', 'sampled', '_rendered')
+
+    def __init__(self, event: str, body: Any) -> None:
+        self.event = event
+        self.body = body
+        # The mode in force when the event happened, not when it's rendered.
+        if getattr(_override, 'full', False):
+            self.mode: str = 'full'
+            self.max_size: Optional[int] = None
+            self.sampled = False
+        else:
+            self.mode = config.body_logging
+            self.max_size = config.body_log_max_size
+            self.sampled = event in config.body_log_sampling
+        self._rendered: Optional[str] = None
+
+    def __repr__(self) -> str:
+        # Rendered at most once, so that all the renderers of an event agree on the sampling.
+        if self._rendered is None:
+            self._rendered = self._render()
+        return self._rendered
+
+    __str__ = __repr__
+
+    def _render(self) -> str:
+        mode = self.mode
+        if self.sampled and mode != 'size' and random.random() >= config.body_log_sampling[self.event]:
+            mode = 'size'
+        is_document = isinstance(self.body, (bytes, str))
+        data = self.body if is_document else repr(self.body)
+        encoded = data.encode('utf-8') if isinstance(data, str) else data
+        if mode == 'full':
+            render = repr if is_document else str
+            if self.max_size is not None and len(encoded) > self.max_size:
+                return '{}... ({} bytes)'.format(render(data[:self.max_size]), len(encoded))
+            return render(data)
+        if mode == 'hash':
+            return 'sha256:{} ({} bytes)'.format(hashlib.sha256(encoded).hexdigest(), len(encoded))
+        return '({} bytes)'.format(len(encoded))
+
+
+def log_body(event: str, body: Any) -> LoggedBody:
+    """
+    :param event: The name of the log event, for the sampling
+    :param body: The xml document (bytes or str), or any object whose repr is to be logged
+    """
+    return LoggedBody(event, body)
+
+
+@contextmanager
+def full_body_logging() -> Iterator[None]:
+    """ Logs the complete bodies of the events of the current thread, whatever the settings. """
+    previous = getattr(_override, 'full', False)
+    _override.full = True
+    try:
+        yield
+    finally:
+        _override.full = previous
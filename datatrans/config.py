@@ -1,39 +1,263 @@
+"""
+The configuration of the gateway, from settings.DATATRANS.
+
+The settings are read on first use, not when the module is imported (except on python 3.6, see the end of the
+module), and cached in the `config` object.
+The cache is dropped when the DATATRANS setting changes (for instance with override_settings in tests).
+
+Besides the web and mpo merchants, more merchants can be served by the same deployment, each with its key, the mpo
+merchant that charges the aliases it registers (a merchant of the registry too), and its environment:
+
+    DATATRANS = {
+        ...
+        'MERCHANTS': {
+            '3333333333': {'HMAC_KEY': 'CCCC...', 'MPO_MERCHANT_ID': '4444444444'},
+            '4444444444': {'HMAC_KEY': 'DDDD...', 'ENVIRONMENT': 'PRODUCTION'},
+        },
+    }
+"""
 import hashlib
 import hmac
 import os
-from typing import Any, Sequence
+import sys
+from collections import namedtuple
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.utils.functional import cached_property
 
-web_merchant_id = settings.DATATRANS['WEB_MERCHANT_ID']
-_web_hmac_key = bytearray.fromhex(settings.DATATRANS['WEB_HMAC_KEY'])
-mpo_merchant_id = settings.DATATRANS['MPO_MERCHANT_ID']
-_mpo_hmac_key = bytearray.fromhex(settings.DATATRANS['MPO_HMAC_KEY'])
+_REQUIRED = object()
 
-if settings.DATATRANS.get('ENVIRONMENT') == 'PRODUCTION':
-    _pay_base_url = 'https://pay.datatrans.com/'
-    _api_base_url = 'https://api.datatrans.com/'
-else:
-    _pay_base_url = 'https://pay.sandbox.datatrans.com/'
-    _api_base_url = 'https://api.sandbox.datatrans.com/'
 
-datatrans_js_url = os.path.join(_pay_base_url, 'upp/payment/js/datatrans-2.0.0.min.js')
-datatrans_authorize_url = os.path.join(_api_base_url, 'upp/jsp/XML_authorize.jsp')
-datatrans_processor_url = os.path.join(_api_base_url, 'upp/jsp/XML_processor.jsp')
+class Merchant(namedtuple('Merchant', 'merchant_id keyed_hmac mpo_merchant_id authorize_url processor_url js_url')):
+    """ A merchant account at datatrans: its pre-keyed hmac, and the urls of its environment. """
+    __slots__ = ()
+
+    def sign(self, *values: Any) -> str:
+        return _sign(values, self.keyed_hmac)
+
+
+class _Setting:
+    """ A key of settings.DATATRANS, read on first access and then cached in the instance. """
+
+    def __init__(self, key: str, default: Any = None) -> None:
+        self.key = key
+        self.default = default
+        self.name = ''
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        if instance is None:
+            return self
+        if self.default is _REQUIRED:
+            value = settings.DATATRANS[self.key]
+        else:
+            value = settings.DATATRANS.get(self.key, self.default)
+        instance.__dict__[self.name] = value
+        return value
+
+
+class Config:
+    web_merchant_id = _Setting('WEB_MERCHANT_ID', _REQUIRED)
+    mpo_merchant_id = _Setting('MPO_MERCHANT_ID', _REQUIRED)
+    environment = _Setting('ENVIRONMENT')
+
+    # Outbound HTTP: connections to datatrans are pooled and kept alive between calls.
+    http_pool_size = _Setting('HTTP_POOL_SIZE', 10)
+    http_keep_alive = _Setting('HTTP_KEEP_ALIVE', True)
+    http_connect_timeout = _Setting('HTTP_CONNECT_TIMEOUT', 5)
+    http_read_timeout = _Setting('HTTP_READ_TIMEOUT', 30)
+
+    # The calls to datatrans can be rate limited (calls per second, unlimited by default), and stop for
+    # CIRCUIT_BREAKER_RESET_TIMEOUT seconds after CIRCUIT_BREAKER_FAILURES consecutive failures (0 disables the
+    # breaker).
+    rate_limit = _Setting('RATE_LIMIT')
+    rate_limit_burst = _Setting('RATE_LIMIT_BURST')
+    rate_limit_max_wait = _Setting('RATE_LIMIT_MAX_WAIT', 10)
+    circuit_breaker_failures = _Setting('CIRCUIT_BREAKER_FAILURES', 5)
+    circuit_breaker_reset_timeout = _Setting('CIRCUIT_BREAKER_RESET_TIMEOUT', 30)
+
+    # 'inline': the webhook processes notifications before answering datatrans.
+    # 'inbox': the webhook only stores them, they are processed by the datatrans_process_inbox command.
+    webhook_mode = _Setting('WEBHOOK_MODE', 'inline')
+
+    # The number of recently recorded notifications remembered to detect retries without querying the database.
+    deduplication_cache_size = _Setting('DEDUPLICATION_CACHE_SIZE', 10000)
+
+    # The parser of the documents received from datatrans: 'defusedxml' or 'lxml' (see gateway/xml_parsing.py).
+    xml_parser = _Setting('XML_PARSER', 'defusedxml')
+
+    # The admin changelists count big tables from the planner statistics, unless exact counts are asked for.
+    admin_exact_counts = _Setting('ADMIN_EXACT_COUNTS', False)
+
+    # Metrics are collected in memory (see metrics.py). The view that exposes them is off unless METRICS_VIEW is set.
+    metrics_enabled = _Setting('METRICS', True)
+    metrics_view_enabled = _Setting('METRICS_VIEW', False)
+
+    # How the xml documents and notifications are logged (see body_logging.py).
+    body_logging = _Setting('BODY_LOGGING', 'full')
+    body_log_max_size = _Setting('BODY_LOG_MAX_SIZE')
+    body_log_sampling = _Setting('BODY_LOG_SAMPLING', {})
+
+    # The distinct values offered by the admin list filters are cached, and refreshed from the signals.
+    # The timeout (in seconds) bounds how long a value that disappeared from the database is still offered.
+    facet_cache_timeout = _Setting('FACET_CACHE_TIMEOUT', 24 * 60 * 60)
+
+    @cached_property
+    def web_hmac(self) -> hmac.HMAC:
+        # Keying an hmac hashes the key, so we do it once. Each signature is computed on a copy.
+        return hmac.new(key=bytearray.fromhex(settings.DATATRANS['WEB_HMAC_KEY']), digestmod=hashlib.sha256)
+
+    @cached_property
+    def mpo_hmac(self) -> hmac.HMAC:
+        return hmac.new(key=bytearray.fromhex(settings.DATATRANS['MPO_HMAC_KEY']), digestmod=hashlib.sha256)
+
+    @cached_property
+    def merchants(self) -> Dict[str, Merchant]:
+        """ All the merchants, by merchant id. Their keys are hashed once, here. """
+        merchants = {}
+        for merchant_id, options in settings.DATATRANS.get('MERCHANTS', {}).items():
+            keyed_hmac = hmac.new(key=bytearray.fromhex(options['HMAC_KEY']), digestmod=hashlib.sha256)
+            merchants[merchant_id] = self._merchant(merchant_id, keyed_hmac, options)
+        merchants.setdefault(self.mpo_merchant_id, self._merchant(self.mpo_merchant_id, self.mpo_hmac))
+        merchants.setdefault(self.web_merchant_id, self._merchant(self.web_merchant_id, self.web_hmac))
+        for merchant in merchants.values():
+            # Unknown merchants fall back to the web merchant (see merchant()), which must not happen silently here.
+            if merchant.mpo_merchant_id not in merchants:
+                raise ImproperlyConfigured('The MPO_MERCHANT_ID {} of the merchant {} is not a known merchant'.format(
+                    merchant.mpo_merchant_id, merchant.merchant_id))
+        return merchants
+
+    @cached_property
+    def declared_merchant_ids(self) -> FrozenSet[str]:
+        """ The merchants of DATATRANS['MERCHANTS'], the web and mpo merchants are registered even if not declared. """
+        return frozenset(settings.DATATRANS.get('MERCHANTS', {}))
+
+    def merchant(self, merchant_id: Optional[str]) -> Merchant:
+        """
+        :return: The merchant with this id. Documents of unknown merchants are signed and verified with the key of
+        the web merchant, as when there was a single web merchant.
+        """
+        merchant = self.merchants.get(merchant_id)  # type: ignore
+        if merchant is None:
+            merchant = self.merchants[self.web_merchant_id]
+        return merchant
+
+    def _merchant(self, merchant_id: str, keyed_hmac: hmac.HMAC,
+                  options: Optional[Mapping[str, Any]] = None) -> Merchant:
+        options = options or {}
+        if 'ENVIRONMENT' in options or 'API_BASE_URL' in options:
+            api_base_url = _api_base_url(options.get('ENVIRONMENT', self.environment), options.get('API_BASE_URL'))
+        else:
+            api_base_url = self.api_base_url
+        pay_base_url = _pay_base_url(options.get('ENVIRONMENT', self.environment))
+        return Merchant(
+            merchant_id=merchant_id,
+            keyed_hmac=keyed_hmac,
+            mpo_merchant_id=options.get('MPO_MERCHANT_ID', self.mpo_merchant_id),
+            authorize_url=os.path.join(api_base_url, 'upp/jsp/XML_authorize.jsp'),
+            processor_url=os.path.join(api_base_url, 'upp/jsp/XML_processor.jsp'),
+            js_url=os.path.join(pay_base_url, 'upp/payment/js/datatrans-2.0.0.min.js'),
+        )
+
+    @cached_property
+    def pay_base_url(self) -> str:
+        return _pay_base_url(self.environment)
+
+    @cached_property
+    def api_base_url(self) -> str:
+        return _api_base_url(self.environment, settings.DATATRANS.get('API_BASE_URL'))
+
+    @cached_property
+    def datatrans_js_url(self) -> str:
+        return os.path.join(self.pay_base_url, 'upp/payment/js/datatrans-2.0.0.min.js')
+
+    @cached_property
+    def datatrans_authorize_url(self) -> str:
+        return os.path.join(self.api_base_url, 'upp/jsp/XML_authorize.jsp')
+
+    @cached_property
+    def datatrans_processor_url(self) -> str:
+        return os.path.join(self.api_base_url, 'upp/jsp/XML_processor.jsp')
+
+    def reset(self) -> None:
+        """ Forgets the values read so far, they are read again from the settings on next access. """
+        self.__dict__.clear()
+
+
+def _pay_base_url(environment: Optional[str]) -> str:
+    if environment == 'PRODUCTION':
+        return 'https://pay.datatrans.com/'
+    return 'https://pay.sandbox.datatrans.com/'
+
+
+def _api_base_url(environment: Optional[str], api_base_url: Optional[str]) -> str:
+    # API_BASE_URL for instance points to the local simulator (see the datatrans_simulator command).
+    if api_base_url is not None:
+        return api_base_url
+    if environment == 'PRODUCTION':
+        return 'https://api.datatrans.com/'
+    return 'https://api.sandbox.datatrans.com/'
+
+
+config = Config()
+
+
+def _reset_config(setting: str, **kwargs: Any) -> None:
+    if setting == 'DATATRANS':
+        config.reset()
+
+
+setting_changed.connect(_reset_config, dispatch_uid='datatrans-config')
 
 
 def sign_web(*values: Any) -> str:
-    return _sign(values, _web_hmac_key)
+    return _sign(values, config.web_hmac)
 
 
 def sign_mpo(*values: Any) -> str:
-    return _sign(values, _mpo_hmac_key)
+    return _sign(values, config.mpo_hmac)
 
 
-def _sign(values: Sequence[Any], key: bytearray) -> str:
-    s = ''.join(map(str, values))
-    return hmac.new(
-        key=key,
-        msg=s.encode('utf-8'),
-        digestmod=hashlib.sha256
-    ).hexdigest()
+def sign_many(rows: Iterable[Sequence[Any]], use_mpo_key: bool = False) -> List[str]:
+    """
+    Signs many sequences of values at once, for bulk jobs.
+
+    :param rows: The values to sign, one sequence per signature
+    :param use_mpo_key: Sign with the mpo key instead of the web key
+    :return: The signatures, in the order of the rows
+    """
+    copy = (config.mpo_hmac if use_mpo_key else config.web_hmac).copy
+    signatures = []
+    for values in rows:
+        h = copy()
+        h.update(''.join(map(str, values)).encode('utf-8'))
+        signatures.append(h.hexdigest())
+    return signatures
+
+
+def _sign(values: Sequence[Any], keyed_hmac: hmac.HMAC) -> str:
+    h = keyed_hmac.copy()
+    h.update(''.join(map(str, values)).encode('utf-8'))
+    return h.hexdigest()
+
+
+if sys.version_info < (3, 7):
+    # Modules have no __getattr__ before python 3.7: the settings that used to be module attributes are read at
+    # import time, as they were, and do not follow later changes of the settings.
+    web_merchant_id = config.web_merchant_id
+    mpo_merchant_id = config.mpo_merchant_id
+    datatrans_js_url = config.datatrans_js_url
+    datatrans_authorize_url = config.datatrans_authorize_url
+    datatrans_processor_url = config.datatrans_processor_url
+else:
+    def __getattr__(name: str) -> Any:
+        # The settings used to be module attributes: `from datatrans.config import web_merchant_id` still works,
+        # but reads the settings at import time.
+        if not name.startswith('_') and hasattr(Config, name):
+            return getattr(config, name)
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
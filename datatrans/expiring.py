@@ -0,0 +1,69 @@
+"""
+Finds the registered credit cards that expire soon, for instance to ask their owners for a new card.
+
+The successful alias registrations are scanned in chunks, in (expiry_date, id) order, on the (success, expiry_date)
+index. Each chunk starts after the last row of the previous one, so no query is slower than the first.
+"""
+from datetime import date
+from typing import Iterator, List, Optional
+
+from django.db.models import Q
+
+from .models import AliasRegistration
+from .signals import alias_expiring
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def expiring_alias_registrations(until: date, since: Optional[date] = None, distinct_card_alias: bool = False,
+                                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[AliasRegistration]:
+    """
+    :param until: The last expiry date of the window (included)
+    :param since: The first expiry date of the window (included), today by default
+    :param distinct_card_alias: Yield a single alias registration for each card alias. The card aliases
+    already yielded are kept in memory.
+    :param chunk_size: The number of rows read per query
+    :return: The successful alias registrations whose card expires within the window, by expiry date
+    """
+    if since is None:
+        since = date.today()
+    queryset = (AliasRegistration.objects
+                .filter(success=True, expiry_date__gte=since, expiry_date__lte=until)
+                .order_by('expiry_date', 'id'))
+    seen_card_aliases = set()
+    after = Q()
+    while True:
+        chunk = list(queryset.filter(after)[:chunk_size])
+        for alias_registration in chunk:
+            card_alias = alias_registration.card_alias
+            if distinct_card_alias and card_alias:
+                if card_alias in seen_card_aliases:
+                    continue
+                seen_card_aliases.add(card_alias)
+            yield alias_registration
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+        after = Q(expiry_date__gt=last.expiry_date) | Q(expiry_date=last.expiry_date, id__gt=last.id)
+
+
+def send_alias_expiring(until: date, since: Optional[date] = None, distinct_card_alias: bool = False,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Sends the alias_expiring signal with the expiring alias registrations, a chunk at a time.
+    The parameters are those of expiring_alias_registrations.
+
+    :return: The number of alias registrations sent
+    """
+    count = 0
+    chunk: List[AliasRegistration] = []
+    for alias_registration in expiring_alias_registrations(until, since, distinct_card_alias, chunk_size):
+        chunk.append(alias_registration)
+        if len(chunk) == chunk_size:
+            alias_expiring.send(sender=None, instances=chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        alias_expiring.send(sender=None, instances=chunk)
+        count += len(chunk)
+    return count
@@ -0,0 +1,88 @@
+"""
+The distinct values of the columns the admin lists are filtered on, kept in django's cache.
+
+Without it, each render of a changelist runs a SELECT DISTINCT over the whole table for each filter.
+Here the values are read from the database on a cache miss only. A recorded transaction with a value that is not
+cached yet drops the cached values, through the signals, and the next read gets them all from the database again.
+"""
+from typing import Iterable, List, Optional, Type
+
+from django.contrib import admin
+from django.core.cache import cache
+
+from .config import config
+from .models import AliasRegistration, Payment, Refund, TransactionBase
+from .signals import (alias_registration_done, payment_by_user_done, payment_with_alias_done, refund_done,
+                      transactions_recorded)
+
+FACET_FIELDS = {
+    AliasRegistration: ['payment_method', 'credit_card_country'],
+    Payment: ['payment_method', 'credit_card_country', 'amount_currency'],
+    Refund: ['amount_currency'],
+}
+
+
+def facet_values(model: Type[TransactionBase], field_name: str) -> List[Optional[str]]:
+    key = _cache_key(model, field_name)
+    values = cache.get(key)
+    if values is None:
+        values = _sorted(model.objects.order_by().values_list(field_name, flat=True).distinct())
+        cache.set(key, values, config.facet_cache_timeout)
+    return values
+
+
+def add_facet_values(instances: Iterable[TransactionBase]) -> None:
+    """
+    Makes the values of these transactions offered, if they are not already cached.
+
+    The cached values are dropped rather than updated: two processes that add different values at the same time
+    would each write the list they read plus their own value, and one of the values would be lost.
+    """
+    stale = set()
+    for instance in instances:
+        for field_name in FACET_FIELDS.get(instance.__class__, []):
+            key = _cache_key(instance.__class__, field_name)
+            if key in stale:
+                continue
+            values = cache.get(key)
+            # On a miss there is nothing to drop: the next read gets all the values from the database.
+            if values is not None and getattr(instance, field_name) not in values:
+                stale.add(key)
+    if stale:
+        cache.delete_many(list(stale))
+
+
+def clear_facet_values() -> None:
+    cache.delete_many([_cache_key(model, field_name)
+                       for model, field_names in FACET_FIELDS.items() for field_name in field_names])
+
+
+def connect_signals() -> None:
+    for signal in [alias_registration_done, payment_by_user_done, payment_with_alias_done, refund_done]:
+        signal.connect(_on_done, dispatch_uid='datatrans.facets')
+    transactions_recorded.connect(_on_recorded, dispatch_uid='datatrans.facets')
+
+
+class CachedValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    """ An AllValuesFieldListFilter that offers the cached values instead of selecting them on each render. """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        # The queryset built by the parent class is lazy, it is never run.
+        self.lookup_choices = facet_values(model, field.attname)
+
+
+def _on_done(sender, instance, **kwargs):
+    add_facet_values([instance])
+
+
+def _on_recorded(sender, instances, **kwargs):
+    add_facet_values(instances)
+
+
+def _cache_key(model: Type[TransactionBase], field_name: str) -> str:
+    return 'datatrans:facets:{}:{}'.format(model._meta.model_name, field_name)
+
+
+def _sorted(values: Iterable[Optional[str]]) -> List[Optional[str]]:
+    return sorted(values, key=lambda value: (value is None, value or ''))
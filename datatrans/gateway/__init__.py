@@ -1,9 +1,51 @@
-from .notification import handle_notification
-from .payment_parameters import PaymentParameters, build_payment_parameters, build_register_credit_card_parameters
-from .payment_with_alias import pay_with_alias
-from .refunding import refund
+"""
+The exchanges with datatrans.
+
+The submodules are imported on first use of their names (on python 3.7 and later), so that importing the package,
+for instance from the admin or a management command, does not import requests and the xml parsers.
+"""
+import sys
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+_EXPORTS = {
+    'PayWithAliasItem': 'bulk_charging',
+    'PayWithAliasResult': 'bulk_charging',
+    'pay_with_alias_many': 'bulk_charging',
+    'enqueue_notification': 'inbox',
+    'process_inbox': 'inbox',
+    'handle_notification': 'notification',
+    'PaymentParameters': 'payment_parameters',
+    'build_payment_parameters': 'payment_parameters',
+    'build_register_credit_card_parameters': 'payment_parameters',
+    'pay_with_alias': 'payment_with_alias',
+    'refund': 'refunding',
+    'CircuitOpenError': 'resilience',
+    'RateLimitError': 'resilience',
+    'get_outbound_state': 'resilience',
+    'close_session': 'transport',
+}
 
 __all__ = [
     'pay_with_alias', 'PaymentParameters', 'build_register_credit_card_parameters', 'build_payment_parameters',
-    'handle_notification', 'refund'
+    'handle_notification', 'refund', 'close_session', 'pay_with_alias_many', 'PayWithAliasItem', 'PayWithAliasResult',
+    'enqueue_notification', 'process_inbox', 'CircuitOpenError', 'RateLimitError', 'get_outbound_state'
 ]
+
+if TYPE_CHECKING or sys.version_info < (3, 7):
+    from .bulk_charging import PayWithAliasItem, PayWithAliasResult, pay_with_alias_many  # noqa: F401
+    from .inbox import enqueue_notification, process_inbox  # noqa: F401
+    from .notification import handle_notification  # noqa: F401
+    from .payment_parameters import (PaymentParameters, build_payment_parameters,  # noqa: F401
+                                     build_register_credit_card_parameters)
+    from .payment_with_alias import pay_with_alias  # noqa: F401
+    from .refunding import refund  # noqa: F401
+    from .resilience import CircuitOpenError, RateLimitError, get_outbound_state  # noqa: F401
+    from .transport import close_session  # noqa: F401
+else:
+    def __getattr__(name: str) -> Any:
+        if name not in _EXPORTS:
+            raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+        value = getattr(import_module('.' + _EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
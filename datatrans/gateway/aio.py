@@ -0,0 +1,157 @@
+"""
+Asyncio versions of the exchanges with datatrans, for use under ASGI.
+
+The xml documents are built and parsed exactly as in the synchronous gateway. Only the calls to datatrans
+are non-blocking: they go through httpx (install with `pip install django-datatrans-gateway[async]`).
+The database accesses and the signals run in django's thread-sensitive executor.
+
+Requires python 3.7 and django 3.1 (for asgiref and async views).
+"""
+import asyncio
+from typing import Any, Union
+from weakref import WeakKeyDictionary
+
+from asgiref.sync import sync_to_async
+from moneyed import Money
+from structlog import get_logger
+
+from .notification import parse_notification_record, record_notification
+from .payment_with_alias import build_pay_with_alias_request_xml, mpo_merchant_of, parse_pay_with_alias_response_xml
+from .refunding import (parse_refund_response_xml, prepare_refund_request_xml, record_refund, release_refund,
+                        reserve_refund)
+from .resilience import abandon_call, after_call, before_call
+from ..body_logging import log_body
+from ..config import config
+from ..metrics import endpoint_of, outbound_request_seconds, webhook_seconds
+from ..models import AliasRegistration, Payment, Refund
+
+logger = get_logger()
+
+# An httpx client can only be used from the event loop that created it.
+_clients: Any = WeakKeyDictionary()
+
+
+def get_client():
+    """
+    Returns the pooled httpx.AsyncClient of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        import httpx
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.http_pool_size,
+                max_keepalive_connections=config.http_pool_size if config.http_keep_alive else 0),
+            timeout=httpx.Timeout(config.http_read_timeout, connect=config.http_connect_timeout))
+        _clients[loop] = client
+    return client
+
+
+async def close_client() -> None:
+    """
+    Closes the pooled connections of the running event loop.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def post_xml(url: str, data: bytes):
+    wait = before_call()
+    try:
+        if wait:
+            await asyncio.sleep(wait)
+        with outbound_request_seconds.time(endpoint=endpoint_of(url)):
+            response = await get_client().post(url, headers={'Content-Type': 'application/xml'}, content=data)
+    except asyncio.CancelledError:
+        # Not an Exception since python 3.8, but it was before.
+        abandon_call()
+        raise
+    except Exception:
+        after_call(success=False)
+        raise
+    except BaseException:
+        abandon_call()
+        raise
+    after_call(success=response.status_code < 500)
+    return response
+
+
+async def pay_with_alias(amount: Money, alias_registration_id: str, client_ref: str) -> Payment:
+    """
+    Charges money using datatrans, given a previously registered credit card alias.
+
+    :param amount: The amount and currency we want to charge
+    :param alias_registration_id: The alias registration to use
+    :param client_ref: A unique reference for this charge
+    :return: a Payment (either successful or not)
+    """
+    if amount.amount <= 0:
+        raise ValueError('Pay with alias takes a strictly positive amount')
+
+    alias_registration = await sync_to_async(AliasRegistration.objects.get)(pk=alias_registration_id)
+
+    logger.info('paying-with-alias', amount=amount, client_ref=client_ref,
+                alias_registration=alias_registration)
+
+    request_xml = build_pay_with_alias_request_xml(amount, client_ref, alias_registration)
+    url = mpo_merchant_of(alias_registration).authorize_url
+
+    logger.info('sending-pay-with-alias-request', url=url,
+                data=log_body('sending-pay-with-alias-request', request_xml))
+
+    response = await post_xml(url, request_xml)
+
+    logger.info('processing-pay-with-alias-response',
+                response=log_body('processing-pay-with-alias-response', response.content))
+
+    charge_response = parse_pay_with_alias_response_xml(response.content)
+    await _save_and_send_signal(charge_response)
+
+    return charge_response
+
+
+async def refund(amount: Money, payment_id: str) -> Refund:
+    """
+    Refunds (partially or completely) a previously authorized and settled payment.
+    :param amount: The amount and currency we want to refund. Must be positive, in the same currency
+    as the original payment, and not exceed what remains of the original payment after its previous refunds.
+    :param payment_id: The id of the payment to refund.
+    :return: a Refund (either successful or not).
+    """
+    if amount.amount <= 0:
+        raise ValueError('Refund takes a strictly positive amount')
+    payment = await sync_to_async(Payment.objects.get)(pk=payment_id)
+
+    request_xml = prepare_refund_request_xml(amount, payment)
+    url = config.merchant(payment.merchant_id).processor_url
+
+    await sync_to_async(reserve_refund)(amount, payment)
+    try:
+        logger.info('sending-refund-request', url=url, data=log_body('sending-refund-request', request_xml))
+
+        response = await post_xml(url, request_xml)
+
+        logger.info('processing-refund-response', response=log_body('processing-refund-response', response.content))
+
+        refund_response = parse_refund_response_xml(response.content)
+    except BaseException:
+        await sync_to_async(release_refund)(amount, payment)
+        raise
+    await sync_to_async(record_refund)(refund_response, amount, payment)
+    await sync_to_async(refund_response.send_signal)()
+
+    return refund_response
+
+
+async def handle_notification(xml: str) -> None:
+    with webhook_seconds.time(stage='parse'):
+        notification = parse_notification_record(xml)
+    await sync_to_async(record_notification)(notification)
+
+
+@sync_to_async
+def _save_and_send_signal(instance: Union[AliasRegistration, Payment, Refund]) -> None:
+    instance.save()
+    instance.send_signal()
@@ -0,0 +1,159 @@
+import uuid
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from structlog import get_logger
+
+from .payment_with_alias import send_pay_with_alias_request
+from ..models import AliasRegistration, SignalError, bulk_record
+
+logger = get_logger()
+
+PayWithAliasItem = namedtuple('PayWithAliasItem', 'amount alias_registration_id client_ref')
+
+PayWithAliasResult = namedtuple('PayWithAliasResult', 'item payment error')
+
+
+def pay_with_alias_many(items: Iterable, max_workers: int = 8, max_in_flight: Optional[int] = None,
+                        batch_size: int = 100) -> Iterator[PayWithAliasResult]:
+    """
+    Charges many previously registered credit card aliases, with a bounded number of concurrent calls to datatrans.
+
+    Only the exchanges with datatrans happen in the worker threads: the alias registrations are loaded, and the
+    resulting payments saved, in the calling thread. Payments are saved in batches with bulk_record, which sends
+    the signals once each batch is committed.
+
+    :param items: PayWithAliasItems (or tuples of amount, alias_registration_id, client_ref)
+    :param max_workers: The number of threads sending requests to datatrans
+    :param max_in_flight: The maximum number of charges submitted but not yet completed (default: 2 * max_workers)
+    :param batch_size: The number of items loaded, and payments saved, at once
+    :return: An iterator of PayWithAliasResults, in completion order. Each result has either a payment
+    (be it successful or not) or an error (the exception that prevented the charge). If the payment was
+    charged but saving it failed (or a signal receiver raised), the result has both the payment and the error.
+    If the caller stops iterating, the charges already sent are still saved, but their results are not returned.
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    in_flight: Dict[Future, PayWithAliasItem] = {}
+    charged: List[PayWithAliasResult] = []
+
+    def collect(futures) -> Iterator[PayWithAliasResult]:
+        for future in futures:
+            item = in_flight.pop(future)
+            error = future.exception()
+            if error is not None:
+                logger.warning('pay-with-alias-many-item-failed', item=item, error=repr(error))
+                yield PayWithAliasResult(item=item, payment=None, error=error)
+            else:
+                charged.append(PayWithAliasResult(item=item, payment=future.result(), error=None))
+        if len(charged) >= batch_size:
+            yield from save_charged()
+
+    def save_charged() -> List[PayWithAliasResult]:
+        # The batch leaves `charged` before it is saved, so that it is not saved again if the caller stops
+        # iterating while its results are being yielded.
+        batch = charged[:]
+        charged.clear()
+        return _save(batch)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for chunk in _chunks((PayWithAliasItem(*item) for item in items), batch_size):
+            alias_registrations = _load_alias_registrations(chunk)
+            for item in chunk:
+                alias_registration = alias_registrations.get(item.alias_registration_id)
+                error = _validate(item, alias_registration)
+                if error is not None:
+                    yield PayWithAliasResult(item=item, payment=None, error=error)
+                    continue
+                assert alias_registration is not None
+                while len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    yield from collect(done)
+                future = executor.submit(send_pay_with_alias_request, item.amount, item.client_ref, alias_registration)
+                in_flight[future] = item
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from collect(done)
+        if charged:
+            yield from save_charged()
+    finally:
+        # If the caller stops iterating, the charges that were not sent yet are abandoned. Those already sent
+        # are waited for, and everything charged is still recorded: datatrans has taken the money.
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=True)
+        for future, item in in_flight.items():
+            if not future.cancelled() and future.exception() is None:
+                charged.append(PayWithAliasResult(item=item, payment=future.result(), error=None))
+        if charged:
+            logger.warning('pay-with-alias-many-interrupted', saving=len(charged))
+            save_charged()
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _load_alias_registrations(items: List[PayWithAliasItem]) -> Dict:
+    ids = {}
+    for item in items:
+        try:
+            ids[item.alias_registration_id] = uuid.UUID(str(item.alias_registration_id))
+        except ValueError:
+            pass
+    by_uuid = AliasRegistration.objects.in_bulk(list(ids.values()))
+    return {alias_registration_id: by_uuid[pk] for alias_registration_id, pk in ids.items() if pk in by_uuid}
+
+
+def _validate(item: PayWithAliasItem, alias_registration: Optional[AliasRegistration]) -> Optional[Exception]:
+    if item.amount.amount <= 0:
+        return ValueError('Pay with alias takes a strictly positive amount')
+    if alias_registration is None:
+        return AliasRegistration.DoesNotExist(
+            'AliasRegistration {} does not exist'.format(item.alias_registration_id))
+    return None
+
+
+def _save(results: List[PayWithAliasResult]) -> List[PayWithAliasResult]:
+    try:
+        bulk_record([result.payment for result in results])
+    except SignalError as e:
+        return _signal_failed(results, e)
+    except Exception as e:
+        # One bad row fails the whole batch: the others are real charges, so they are saved one by one.
+        logger.warning('pay-with-alias-many-batch-save-failed', count=len(results), error=repr(e))
+        return [_save_one(result) for result in results]
+    return results
+
+
+def _save_one(result: PayWithAliasResult) -> PayWithAliasResult:
+    try:
+        bulk_record([result.payment])
+    except SignalError as e:
+        return _signal_failed([result], e)[0]
+    except Exception as e:
+        logger.error('pay-with-alias-many-save-failed', item=result.item, error=repr(e))
+        return result._replace(error=e)
+    return result
+
+
+def _signal_failed(results: List[PayWithAliasResult], e: SignalError) -> List[PayWithAliasResult]:
+    # The payments are committed: only the results whose receivers raised get the error.
+    failed = []
+    for result in results:
+        error = e.errors.get(result.payment)
+        if error is not None:
+            logger.error('pay-with-alias-many-signal-failed', item=result.item, error=repr(error))
+            result = result._replace(error=error)
+        failed.append(result)
+    return failed
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+from django.db import transaction
+
+from .records import NotificationRecord
+from ..config import config
+from ..models import AliasRegistration, Payment
+
+Notification = Union[NotificationRecord, AliasRegistration, Payment]
+
+
+class Deduplicator:
+    """
+    Detects notifications that were already recorded, for instance because datatrans retried the webhook.
+
+    The transaction ids of the most recently recorded notifications are kept in memory, in front of the
+    unique index on transaction_id. Only committed notifications are remembered.
+    Unless a max_size is given, DATATRANS['DEDUPLICATION_CACHE_SIZE'] of them are kept.
+    """
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        self.max_size = max_size
+        self.duplicates = 0
+        self._recent: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, notification: Notification) -> bool:
+        key = self._key(notification)
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                self.duplicates += 1
+                return True
+        if _model(notification).objects.filter(transaction_id=notification.transaction_id).exists():
+            self.count_duplicate(notification)
+            return True
+        return False
+
+    def count_duplicate(self, notification: Notification) -> None:
+        with self._lock:
+            self.duplicates += 1
+        self.remember(notification)
+
+    def remember(self, notification: Notification) -> None:
+        key = self._key(notification)
+        if key is not None:
+            transaction.on_commit(lambda: self._add(key))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self.duplicates = 0
+
+    def _add(self, key) -> None:
+        with self._lock:
+            self._recent[key] = True
+            self._recent.move_to_end(key)
+            max_size = config.deduplication_cache_size if self.max_size is None else self.max_size
+            if len(self._recent) > max_size:
+                self._recent.popitem(last=False)
+
+    @staticmethod
+    def _key(notification: Notification):
+        if notification.transaction_id is None:
+            return None
+        return _model(notification), notification.transaction_id
+
+
+def _model(notification: Notification):
+    # Records are deduplicated like the models they would become.
+    if isinstance(notification, NotificationRecord):
+        return notification.model
+    return notification.__class__
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from typing import List, Tuple, Union
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from structlog import get_logger
+
+from .notification import handle_notification, verify_notification_signature
+from ..models import InboxNotification
+
+logger = get_logger()
+
+
+def enqueue_notification(xml: Union[str, bytes]) -> InboxNotification:
+    """
+    Verifies the signature of a notification and stores it in the inbox, for later processing.
+    """
+    verify_notification_signature(xml)
+    if isinstance(xml, bytes):
+        xml = xml.decode('utf-8')
+    return InboxNotification.objects.create(body=xml)
+
+
+def process_inbox(batch_size: int = 100, max_attempts: int = 5, claim_seconds: int = 300) -> Tuple[int, int]:
+    """
+    Processes the notifications in the inbox, oldest first, exactly as the webhook would have in 'inline' mode:
+    each notification is saved in its own transaction, and its signal is sent once it is committed.
+
+    Every notification is considered once per call. The ones that fail are kept in the inbox with their error,
+    and retried by the next calls until they reach max_attempts.
+    Several workers can drain the inbox concurrently: each claims a batch of notifications in a short transaction,
+    and the others skip them for claim_seconds (after which a notification whose worker died is processed again).
+
+    :return: The number of notifications processed, and the number that failed.
+    """
+    processed = failed = 0
+    last_id = 0
+    while True:
+        batch = _claim(last_id, batch_size, max_attempts, claim_seconds)
+        if not batch:
+            return processed, failed
+
+        for notification in batch:
+            try:
+                handle_notification(notification.body)
+            except Exception as e:
+                logger.warning('inbox-notification-failed', id=notification.id, error=repr(e))
+                InboxNotification.objects.filter(id=notification.id).update(
+                    attempts=F('attempts') + 1, last_error=repr(e), claimed_until=None)
+                failed += 1
+            else:
+                InboxNotification.objects.filter(id=notification.id).delete()
+                processed += 1
+        last_id = batch[-1].id
+
+
+def _claim(last_id: int, batch_size: int, max_attempts: int, claim_seconds: int) -> List[InboxNotification]:
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            InboxNotification.objects
+            .select_for_update(skip_locked=True)
+            .filter(id__gt=last_id, attempts__lt=max_attempts)
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+            .order_by('id')[:batch_size])
+        InboxNotification.objects.filter(id__in=[notification.id for notification in batch]).update(
+            claimed_until=now + timedelta(seconds=claim_seconds))
+    return batch
@@ -1,49 +1,110 @@
-from defusedxml.ElementTree import fromstring
+from django.db import IntegrityError, transaction
 from structlog import get_logger
-from typing import Union
+from typing import Optional, Union
 
+from .deduplication import Deduplicator
 from .money_xml_converters import parse_money
+from .records import NotificationRecord
 from .utils import text_or_else
-from ..config import sign_web
+from .xml_parsing import Xml, fromstring
+from ..body_logging import log_body
+from ..config import config
+from ..metrics import webhook_seconds
 from ..models import AliasRegistration, Payment
 
 logger = get_logger()
 
 
+deduplicator = Deduplicator()
+
+
 def handle_notification(xml: str) -> None:
-    notification = parse_notification_xml(xml)
-    logger.debug('processing-notification', notification=notification)
-    notification.save()
+    with webhook_seconds.time(stage='parse'):
+        notification = parse_notification_record(xml)
+    record_notification(notification)
+
+
+def record_notification(notification: Union[NotificationRecord, AliasRegistration, Payment]) -> bool:
+    """
+    Saves the notification and sends the signal, unless the notification was already recorded.
+    Datatrans retries notifications, so duplicates are expected: they are counted and otherwise ignored.
+    A record only becomes a model once it is known not to be a duplicate.
+
+    :return: False if the notification is a duplicate.
+    """
+    if deduplicator.is_duplicate(notification):
+        logger.info('duplicate-notification', transaction_id=notification.transaction_id,
+                    duplicates=deduplicator.duplicates)
+        return False
+    if isinstance(notification, NotificationRecord):
+        notification = notification.to_model()
+    logger.debug('processing-notification', notification=log_body('processing-notification', notification))
+    try:
+        with webhook_seconds.time(stage='save'), transaction.atomic():
+            notification.save()
+    except IntegrityError:
+        # Another process recorded the same notification since we checked.
+        if not notification.__class__.objects.filter(transaction_id=notification.transaction_id).exists():
+            raise
+        deduplicator.count_duplicate(notification)
+        logger.info('duplicate-notification', transaction_id=notification.transaction_id,
+                    duplicates=deduplicator.duplicates)
+        return False
+    deduplicator.remember(notification)
     notification.send_signal()
+    return True
+
+
+def verify_notification_signature(xml: Xml) -> None:
+    """
+    Verifies the signature of a notification without parsing the rest of it.
+    Raises a ValueError if the signature does not match.
+    """
+    body = fromstring(xml).find('body')
+    transaction = body.find('transaction')
+    # From the spec: sign2 is only returned in the success case
+    if transaction.get('status') == 'success':
+        sign2 = transaction.find("userParameters/parameter[@name='sign2']")
+        _verify_sign2(body.get('merchantId'), transaction.find('amount').text, transaction.find('currency').text,
+                      transaction.find('uppTransactionId').text, text_or_else(sign2, None))
+
+
+def _verify_sign2(merchant_id: str, amount: str, currency: str, transaction_id: str, sign2: Optional[str]) -> None:
+    with webhook_seconds.time(stage='verify'):
+        computed_signature = config.merchant(merchant_id).sign(merchant_id, amount, currency, transaction_id)
+    if computed_signature != sign2:
+        raise ValueError('sign2 did not match computed signature')
 
 
 def parse_notification_xml(xml: str) -> Union[AliasRegistration, Payment]:
+    return parse_notification_record(xml).to_model()
+
+
+def parse_notification_record(xml: str) -> NotificationRecord:
     """"
     Both alias registration and payments are received here.
     We can differentiate them by looking at the use-alias user-parameter (and verifying the amount is 0).
 
+    The transaction is indexed in a single pass (its children by tag, its user parameters by name),
+    all the lookups below are then dictionary lookups.
     """
     body = fromstring(xml).find('body')
     transaction = body.find('transaction')
-    _user_parameters = transaction.find('userParameters')
+    elements = {child.tag: child for child in transaction}
+    parameters = {p.get('name'): p.text for p in transaction.iterfind('userParameters/parameter')}
 
-    def get_named_parameter(name):
-        return _user_parameters.find("parameter[@name='" + name + "']")
+    def text(tag):
+        return elements[tag].text
 
     def success():
         return transaction.get('status') == 'success'
 
     def parse_success():
         # From the spec: sign2 is only returned in the success case
-        computed_signature = sign_web(body.get('merchantId'), transaction.find('amount').text,
-                                      transaction.find('currency').text,
-                                      transaction.find('uppTransactionId').text)
-
-        sign2 = get_named_parameter('sign2').text
-        if computed_signature != sign2:
-            raise ValueError('sign2 did not match computed signature')
+        _verify_sign2(body.get('merchantId'), text('amount'), text('currency'), text('uppTransactionId'),
+                      parameters.get('sign2'))
 
-        success = transaction.find('success')
+        success = elements['success']
         d = dict(
             response_code=success.find('responseCode').text,
             response_message=success.find('responseMessage').text,
@@ -53,62 +114,53 @@ def parse_notification_xml(xml: str) -> Union[AliasRegistration, Payment]:
         return {k: v for k, v in d.items() if v is not None}
 
     def parse_error():
-        error = transaction.find('error')
+        error = elements['error']
         d = dict(
             error_code=error.find('errorCode').text,
             error_message=error.find('errorMessage').text,
             error_detail=error.find('errorDetail').text)
 
-        acquirer_error_code = get_named_parameter('acqErrorCode')
-        if acquirer_error_code is not None:
-            d['acquirer_error_code'] = acquirer_error_code.text
+        if 'acqErrorCode' in parameters:
+            d['acquirer_error_code'] = parameters['acqErrorCode']
 
         return {k: v for k, v in d.items() if v is not None}
 
     def parse_common_attributes():
         d = dict(
-            transaction_id=transaction.find('uppTransactionId').text,
+            transaction_id=text('uppTransactionId'),
             merchant_id=body.get('merchantId'),
             client_ref=transaction.get('refno'),
             amount=parse_money(transaction))
 
-        payment_method = transaction.find('pmethod')
-        if payment_method is not None:
-            d['payment_method'] = payment_method.text
+        if 'pmethod' in elements:
+            d['payment_method'] = text('pmethod')
 
-        request_type = transaction.find('reqtype')
-        if request_type is not None:
-            d['request_type'] = request_type.text
+        if 'reqtype' in elements:
+            d['request_type'] = text('reqtype')
 
-        credit_card_country = get_named_parameter('returnCustomerCountry')
-        if credit_card_country is not None:
-            d['credit_card_country'] = credit_card_country.text
+        if 'returnCustomerCountry' in parameters:
+            d['credit_card_country'] = parameters['returnCustomerCountry']
 
-        expiry_month = get_named_parameter('expm')
-        if expiry_month is not None:
-            d['expiry_month'] = int(expiry_month.text)
+        if 'expm' in parameters:
+            d['expiry_month'] = int(parameters['expm'])
 
-        expiry_year = get_named_parameter('expy')
-        if expiry_year is not None:
-            d['expiry_year'] = int(expiry_year.text)
+        if 'expy' in parameters:
+            d['expiry_year'] = int(parameters['expy'])
 
         return d
 
-    # End of inner helper functions, we're back inside parse_notification_xml
+    # End of inner helper functions, we're back inside parse_notification_record
 
-    use_alias_parameter = get_named_parameter('useAlias')
-    if use_alias_parameter is not None and use_alias_parameter.text == 'true':
+    if parameters.get('useAlias') == 'true':
         # It's an alias registration
 
         d = dict(parse_common_attributes())
 
-        masked_card_number = get_named_parameter('maskedCC')
-        if masked_card_number is not None:
-            d['masked_card_number'] = masked_card_number.text
+        if 'maskedCC' in parameters:
+            d['masked_card_number'] = parameters['maskedCC']
 
-        card_alias = get_named_parameter('aliasCC')
-        if card_alias is not None:
-            d['card_alias'] = card_alias.text
+        if 'aliasCC' in parameters:
+            d['card_alias'] = parameters['aliasCC']
 
         if success():
             d['success'] = True
@@ -117,19 +169,18 @@ def parse_notification_xml(xml: str) -> Union[AliasRegistration, Payment]:
             d['success'] = False
             d.update(parse_error())
 
-        return AliasRegistration(**d)
+        return NotificationRecord(is_alias_registration=True, **d)
     else:
         # It's a payment or a charge
         if success():
             d = dict(success=True)
-            cardno = get_named_parameter('cardno')
-            if cardno is not None:
-                d['masked_card_number'] = cardno.text
+            if 'cardno' in parameters:
+                d['masked_card_number'] = parameters['cardno']
             d.update(parse_common_attributes())
             d.update(parse_success())
-            return Payment(**d)
+            return NotificationRecord(**d)
         else:
             d = dict(success=False)
             d.update(parse_common_attributes())
             d.update(parse_error())
-            return Payment(**d)
+            return NotificationRecord(**d)
@@ -1,28 +1,31 @@
 from collections import namedtuple
+from typing import Optional
 
 from moneyed import Money
 from structlog import get_logger
 
 from .money_xml_converters import money_to_amount_and_currency
-from ..config import sign_web, web_merchant_id
+from ..config import Merchant, config
 
 logger = get_logger()
 
 PaymentParameters = namedtuple('PaymentParameters', 'merchant_id amount currency refno sign use_alias')
 
 
-def build_payment_parameters(amount: Money, client_ref: str) -> PaymentParameters:
+def build_payment_parameters(amount: Money, client_ref: str, merchant_id: Optional[str] = None) -> PaymentParameters:
     """
     Builds the parameters needed to present the user with a datatrans payment form.
 
     :param amount: The amount and currency we want the user to pay
     :param client_ref: A unique reference for this payment
+    :param merchant_id: The merchant the user pays, by default the web merchant
     :return: The parameters needed to display the datatrans form
     """
-    merchant_id = web_merchant_id
+    merchant = _web_merchant(merchant_id)
+    merchant_id = merchant.merchant_id
     amount, currency = money_to_amount_and_currency(amount)
     refno = client_ref
-    sign = sign_web(merchant_id, amount, currency, refno)
+    sign = merchant.sign(merchant_id, amount, currency, refno)
 
     parameters = PaymentParameters(
         merchant_id=merchant_id,
@@ -38,20 +41,22 @@ def build_payment_parameters(amount: Money, client_ref: str) -> PaymentParameter
     return parameters
 
 
-def build_register_credit_card_parameters(client_ref: str) -> PaymentParameters:
+def build_register_credit_card_parameters(client_ref: str, merchant_id: Optional[str] = None) -> PaymentParameters:
     """
     Builds the parameters needed to present the user with a datatrans form to register a credit card.
     Contrary to a payment form, datatrans will not show an amount.
 
     :param client_ref: A unique reference for this alias capture.
+    :param merchant_id: The merchant that registers the card, by default the web merchant
     :return: The parameters needed to display the datatrans form
     """
 
     amount = 0
     currency = 'CHF'  # Datatrans requires this value to be filled, so we use this arbitrary currency.
-    merchant_id = web_merchant_id
+    merchant = _web_merchant(merchant_id)
+    merchant_id = merchant.merchant_id
     refno = client_ref
-    sign = sign_web(merchant_id, amount, currency, refno)
+    sign = merchant.sign(merchant_id, amount, currency, refno)
 
     parameters = PaymentParameters(
         merchant_id=merchant_id,
@@ -65,3 +70,11 @@ def build_register_credit_card_parameters(client_ref: str) -> PaymentParameters:
     logger.info('building-payment-parameters', parameters=parameters)
 
     return parameters
+
+
+def _web_merchant(merchant_id: Optional[str]) -> Merchant:
+    if merchant_id is None:
+        merchant_id = config.web_merchant_id
+    elif merchant_id not in config.merchants:
+        raise ValueError('Unknown merchant: {}'.format(merchant_id))
+    return config.merchants[merchant_id]
@@ -1,13 +1,17 @@
+from typing import Optional
 from xml.etree.ElementTree import Element, SubElement, tostring
 
-import requests
-from defusedxml.ElementTree import fromstring
 from moneyed import Money
 from structlog import get_logger
 
 from .money_xml_converters import money_to_amount_and_currency, parse_money
+from .records import AuthorizeResponseRecord
+from .transport import post_xml
 from .utils import text_or_else
-from ..config import datatrans_authorize_url, mpo_merchant_id, sign_mpo
+from .xml_parsing import fromstring
+from .xml_templates import XmlTemplate
+from ..body_logging import log_body
+from ..config import Merchant, config
 from ..models import AliasRegistration, Payment
 
 logger = get_logger()
@@ -30,28 +34,66 @@ def pay_with_alias(amount: Money, alias_registration_id: str, client_ref: str) -
     logger.info('paying-with-alias', amount=amount, client_ref=client_ref,
                 alias_registration=alias_registration)
 
+    charge_response = send_pay_with_alias_request(amount, client_ref, alias_registration)
+    charge_response.save()
+    charge_response.send_signal()
+
+    return charge_response
+
+
+def send_pay_with_alias_request(amount: Money, client_ref: str, alias_registration: AliasRegistration) -> Payment:
+    """
+    Sends the charge to datatrans and parses the response. The resulting payment is neither saved nor signaled.
+    Does not touch the database, so it can safely be called from worker threads.
+    """
     request_xml = build_pay_with_alias_request_xml(amount, client_ref, alias_registration)
+    url = mpo_merchant_of(alias_registration).authorize_url
 
-    logger.info('sending-pay-with-alias-request', url=datatrans_authorize_url, data=request_xml)
+    logger.info('sending-pay-with-alias-request', url=url,
+                data=log_body('sending-pay-with-alias-request', request_xml))
 
-    response = requests.post(
-        url=datatrans_authorize_url,
-        headers={'Content-Type': 'application/xml'},
-        data=request_xml)
+    response = post_xml(url, request_xml)
 
-    logger.info('processing-pay-with-alias-response', response=response.content)
+    logger.info('processing-pay-with-alias-response',
+                response=log_body('processing-pay-with-alias-response', response.content))
 
-    charge_response = parse_pay_with_alias_response_xml(response.content)
-    charge_response.save()
-    charge_response.send_signal()
+    return parse_pay_with_alias_response_xml(response.content)
 
-    return charge_response
+
+def mpo_merchant_of(alias_registration: AliasRegistration) -> Merchant:
+    """ The merchant that charges the aliases registered by the merchant of the alias registration. """
+    return config.merchant(config.merchant(alias_registration.merchant_id).mpo_merchant_id)
 
 
 def build_pay_with_alias_request_xml(amount: Money, client_ref: str, alias_registration: AliasRegistration) -> bytes:
-    merchant_id = mpo_merchant_id
-    client_ref = client_ref
+    merchant = mpo_merchant_of(alias_registration)
+    merchant_id = merchant.merchant_id
+
+    amount, currency = money_to_amount_and_currency(amount)
+    values = dict(
+        merchant_id=merchant_id,
+        client_ref=client_ref,
+        amount=str(amount),
+        currency=currency,
+        card_alias=alias_registration.card_alias,
+        expiry_month=str(alias_registration.expiry_month),
+        expiry_year=str(alias_registration.expiry_year),
+        sign=merchant.sign(merchant_id, amount, currency, client_ref),
+    )
+
+    # For non credit card payment methods who support the creation of an alias
+    # the <pmethod> attribute needs to be submitted
+    # https://api-reference.datatrans.ch/xml/#authorization-with-an-existing-alias
+    if alias_registration.payment_method in ('REK',):
+        return pay_with_alias_and_payment_method_template.render(
+            payment_method=alias_registration.payment_method, **values)
+    return pay_with_alias_template.render(**values)
 
+
+def build_pay_with_alias_request_tree_xml(merchant_id: str, client_ref: str, amount: str, currency: str,
+                                          card_alias: str, expiry_month: str, expiry_year: str, sign: str,
+                                          payment_method: Optional[str] = None) -> bytes:
+    """ Builds the request with ElementTree. See pay_with_alias_template for the faster way. """
     root = Element('authorizationService')
     root.set('version', '3')
 
@@ -63,25 +105,34 @@ def build_pay_with_alias_request_xml(amount: Money, client_ref: str, alias_regis
 
     request = SubElement(transaction, 'request')
 
-    amount, currency = money_to_amount_and_currency(amount)
-    SubElement(request, 'amount').text = str(amount)
+    SubElement(request, 'amount').text = amount
     SubElement(request, 'currency').text = currency
-    SubElement(request, 'aliasCC').text = alias_registration.card_alias
-    SubElement(request, 'expm').text = str(alias_registration.expiry_month)
-    SubElement(request, 'expy').text = str(alias_registration.expiry_year)
+    SubElement(request, 'aliasCC').text = card_alias
+    SubElement(request, 'expm').text = expiry_month
+    SubElement(request, 'expy').text = expiry_year
     SubElement(request, 'reqtype').text = 'CAA'
-    SubElement(request, 'sign').text = sign_mpo(merchant_id, amount, currency, client_ref)
+    SubElement(request, 'sign').text = sign
 
-    # For non credit card payment methods who support the creation of an alias
-    # the <pmethod> attribute needs to be submitted
-    # https://api-reference.datatrans.ch/xml/#authorization-with-an-existing-alias
-    if alias_registration.payment_method in ('REK',):
-        SubElement(request, 'pmethod').text = alias_registration.payment_method
+    if payment_method is not None:
+        SubElement(request, 'pmethod').text = payment_method
 
     return tostring(root, encoding='utf8')
 
 
+_PAY_WITH_ALIAS_VALUES = ['merchant_id', 'client_ref', 'amount', 'currency', 'card_alias', 'expiry_month',
+                          'expiry_year', 'sign']
+
+pay_with_alias_template = XmlTemplate(build_pay_with_alias_request_tree_xml, _PAY_WITH_ALIAS_VALUES)
+
+pay_with_alias_and_payment_method_template = XmlTemplate(
+    build_pay_with_alias_request_tree_xml, _PAY_WITH_ALIAS_VALUES + ['payment_method'])
+
+
 def parse_pay_with_alias_response_xml(xml: bytes) -> Payment:
+    return parse_pay_with_alias_response_record(xml).to_model()
+
+
+def parse_pay_with_alias_response_record(xml: bytes) -> AuthorizeResponseRecord:
     body = fromstring(xml).find('body')
     status = body.get('status')
     transaction = body.find('transaction')
@@ -134,4 +185,4 @@ def parse_pay_with_alias_response_xml(xml: bytes) -> Payment:
             credit_card_country=text_or_else(error.find('returnCustomerCountry')),
         )
         d.update(**common_attributes)
-    return Payment(**d)
+    return AuthorizeResponseRecord(**d)
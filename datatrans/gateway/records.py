@@ -0,0 +1,125 @@
+"""
+The records the parsers return: the fields read from a document of datatrans, before they become a model.
+
+A record is a plain object with slots, cheap to build and to inspect. Deduplication, validation and metrics can
+work on records, and only the records that are actually saved need to become models, with `to_model()`.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple, Type
+
+from moneyed import Money
+
+from ..models import AliasRegistration, Payment, Refund, TransactionBase
+
+
+class TransactionRecord(ABC):
+    # The fields of the model. Those that are None are left to the defaults of the model.
+    fields: Tuple[str, ...] = (
+        'success', 'transaction_id', 'merchant_id', 'client_ref', 'amount', 'request_type', 'expiry_month',
+        'expiry_year', 'credit_card_country', 'response_code', 'response_message', 'authorization_code',
+        'acquirer_authorization_code', 'error_code', 'error_message', 'error_detail', 'acquirer_error_code',
+    )
+    __slots__ = fields
+
+    success: Optional[bool]
+    transaction_id: Optional[str]
+    merchant_id: Optional[str]
+    client_ref: Optional[str]
+    amount: Optional[Money]
+    request_type: Optional[str]
+    expiry_month: Optional[int]
+    expiry_year: Optional[int]
+    credit_card_country: Optional[str]
+    response_code: Optional[str]
+    response_message: Optional[str]
+    authorization_code: Optional[str]
+    acquirer_authorization_code: Optional[str]
+    error_code: Optional[str]
+    error_message: Optional[str]
+    error_detail: Optional[str]
+    acquirer_error_code: Optional[str]
+
+    def __init__(self, **values: Any) -> None:
+        for name in self.fields:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError('Unexpected fields for {}: {}'.format(self.__class__.__name__, ', '.join(values)))
+
+    @property
+    @abstractmethod
+    def model(self) -> Type[TransactionBase]:
+        """ The model the record becomes. """
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        :return: The fields that were read, by name
+        """
+        values = {}
+        for name in self.fields:
+            value = getattr(self, name)
+            if value is not None:
+                values[name] = value
+        return values
+
+    def to_model(self) -> TransactionBase:
+        """
+        :return: An unsaved model instance
+        """
+        return self.model(**self.as_dict())
+
+    def __eq__(self, other: object) -> bool:
+        return self.__class__ is other.__class__ and self._values() == other._values()  # type: ignore
+
+    def __repr__(self) -> str:
+        return '{}({})'.format(
+            self.__class__.__name__, ', '.join('{}={!r}'.format(k, v) for k, v in self.as_dict().items()))
+
+    def _values(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self.__class__.fields)
+
+
+class NotificationRecord(TransactionRecord):
+    """ An alias registration or a payment, received by the webhook. """
+    fields = TransactionRecord.fields + ('payment_method', 'card_alias', 'masked_card_number')
+    __slots__ = ('payment_method', 'card_alias', 'masked_card_number', 'is_alias_registration')
+
+    payment_method: Optional[str]
+    card_alias: Optional[str]
+    masked_card_number: Optional[str]
+    is_alias_registration: bool
+
+    def __init__(self, is_alias_registration: bool = False, **values: Any) -> None:
+        super().__init__(**values)
+        self.is_alias_registration = is_alias_registration
+
+    @property
+    def model(self) -> Type[TransactionBase]:
+        return AliasRegistration if self.is_alias_registration else Payment
+
+    def __eq__(self, other: object) -> bool:
+        return super().__eq__(other) and self.is_alias_registration == other.is_alias_registration  # type: ignore
+
+
+class AuthorizeResponseRecord(TransactionRecord):
+    """ The response to a payment with a registered alias. """
+    fields = TransactionRecord.fields + ('card_alias', 'masked_card_number')
+    __slots__ = ('card_alias', 'masked_card_number')
+
+    card_alias: Optional[str]
+    masked_card_number: Optional[str]
+
+    @property
+    def model(self) -> Type[TransactionBase]:
+        return Payment
+
+
+class RefundResponseRecord(TransactionRecord):
+    """ The response to a refund request. """
+    fields = TransactionRecord.fields + ('payment_transaction_id',)
+    __slots__ = ('payment_transaction_id',)
+
+    payment_transaction_id: Optional[str]
+
+    @property
+    def model(self) -> Type[TransactionBase]:
+        return Refund
@@ -1,12 +1,17 @@
 from xml.etree.ElementTree import Element, SubElement, tostring
 
-import requests
-from defusedxml.ElementTree import fromstring
+from django.db import transaction
+from django.db.models import F
 from moneyed import Money
 from structlog import get_logger
 
 from .money_xml_converters import money_to_amount_and_currency, parse_money
-from ..config import datatrans_processor_url, sign_web
+from .records import RefundResponseRecord
+from .transport import post_xml
+from .xml_parsing import fromstring
+from .xml_templates import XmlTemplate
+from ..body_logging import log_body
+from ..config import Merchant, config
 from ..models import Payment, Refund
 
 logger = get_logger()
@@ -16,19 +21,47 @@ def refund(amount: Money, payment_id: str) -> Refund:
     """
     Refunds (partially or completely) a previously authorized and settled payment.
     :param amount: The amount and currency we want to refund. Must be positive, in the same currency
-    as the original payment, and not exceed the amount of the original payment.
+    as the original payment, and not exceed what remains of the original payment after its previous refunds.
     :param payment_id: The id of the payment to refund.
     :return: a Refund (either successful or not).
     """
     if amount.amount <= 0:
         raise ValueError('Refund takes a strictly positive amount')
     payment = Payment.objects.get(pk=payment_id)
+
+    request_xml = prepare_refund_request_xml(amount, payment)
+    url = config.merchant(payment.merchant_id).processor_url
+
+    reserve_refund(amount, payment)
+    try:
+        logger.info('sending-refund-request', url=url, data=log_body('sending-refund-request', request_xml))
+
+        response = post_xml(url, request_xml)
+
+        logger.info('processing-refund-response', response=log_body('processing-refund-response', response.content))
+
+        refund_response = parse_refund_response_xml(response.content)
+    except BaseException:
+        release_refund(amount, payment)
+        raise
+    record_refund(refund_response, amount, payment)
+    refund_response.send_signal()
+
+    return refund_response
+
+
+def prepare_refund_request_xml(amount: Money, payment: Payment) -> bytes:
+    """
+    Verifies the payment can be refunded with the given amount, and builds the refund request.
+    """
     if not payment.success:
         raise ValueError('Only successful payments can be refunded')
     if payment.amount.currency != amount.currency:
         raise ValueError('Refund currency must be identical to original payment currency')
     if amount.amount > payment.amount.amount:
         raise ValueError('Refund amount exceeds original payment amount')
+    if amount.amount > payment.refundable_amount.amount:
+        raise ValueError('Refund amount exceeds the amount not yet refunded')
 
     logger.info('refunding-payment', amount=str(amount),
                 payment=dict(amount=str(payment.amount), transaction_id=payment.transaction_id,
@@ -36,30 +69,65 @@ def refund(amount: Money, payment_id: str) -> Refund:
 
     client_ref = '{}-r'.format(payment.client_ref)
 
-    request_xml = build_refund_request_xml(amount=amount,
-                                           original_transaction_id=payment.transaction_id,
-                                           client_ref=client_ref,
-                                           merchant_id=payment.merchant_id)
+    return build_refund_request_xml(amount=amount,
+                                    original_transaction_id=payment.transaction_id,
+                                    client_ref=client_ref,
+                                    merchant_id=payment.merchant_id)
 
-    logger.info('sending-refund-request', url=datatrans_processor_url, data=request_xml)
 
-    response = requests.post(
-        url=datatrans_processor_url,
-        headers={'Content-Type': 'application/xml'},
-        data=request_xml)
+def reserve_refund(amount: Money, payment: Payment) -> None:
+    """
+    Adds the amount to the refunded total of the payment before the refund is sent, unless it exceeds what remains
+    to be refunded. The check and the increment are a single update, so concurrent refunds of the same payment cannot
+    refund more than its amount.
+    """
+    reserved = Payment.objects.filter(
+        pk=payment.pk, refunded_total__lte=payment.amount.amount - amount.amount,
+    ).update(refunded_total=F('refunded_total') + amount.amount)
+    if not reserved:
+        raise ValueError('Refund amount exceeds the amount not yet refunded')
 
-    logger.info('processing-refund-response', response=response.content)
 
-    refund_response = parse_refund_response_xml(response.content)
-    refund_response.save()
-    refund_response.send_signal()
+def release_refund(amount: Money, payment: Payment) -> None:
+    """ Gives back an amount reserved by reserve_refund, when the refund could not be sent. """
+    Payment.objects.filter(pk=payment.pk).update(refunded_total=F('refunded_total') - amount.amount)
 
-    return refund_response
+
+def record_refund(refund_response: Refund, reserved: Money, payment: Payment) -> None:
+    """
+    Saves the response to a refund request in place of its reservation (a successful refund adds its amount to the
+    refunded total of the payment when it is saved).
+    """
+    with transaction.atomic():
+        release_refund(reserved, payment)
+        refund_response.save()
 
 
 def build_refund_request_xml(amount: Money, client_ref: str, original_transaction_id: str, merchant_id: str) -> bytes:
-    client_ref = client_ref
+    amount, currency = money_to_amount_and_currency(amount)
+    return refund_template.render(
+        merchant_id=merchant_id,
+        client_ref=client_ref,
+        amount=str(amount),
+        currency=currency,
+        original_transaction_id=original_transaction_id,
+        sign=refund_signing_merchant(merchant_id).sign(merchant_id, amount, currency, client_ref),
+    )
+
 
+def refund_signing_merchant(merchant_id: str) -> Merchant:
+    """
+    Refunds are signed with the web key, whatever the merchant of the payment (the mpo merchant for payments with an
+    alias). Only the merchants declared in DATATRANS['MERCHANTS'] sign their refunds with their own key.
+    """
+    if merchant_id in config.declared_merchant_ids:
+        return config.merchant(merchant_id)
+    return config.merchant(config.web_merchant_id)
+
+
+def build_refund_request_tree_xml(merchant_id: str, client_ref: str, amount: str, currency: str,
+                                  original_transaction_id: str, sign: str) -> bytes:
+    """ Builds the request with ElementTree. See refund_template for the faster way. """
     root = Element('paymentService')
     root.set('version', '1')
 
@@ -71,17 +139,25 @@ def build_refund_request_xml(amount: Money, client_ref: str, original_transactio
 
     request = SubElement(transaction, 'request')
 
-    amount, currency = money_to_amount_and_currency(amount)
-    SubElement(request, 'amount').text = str(amount)
+    SubElement(request, 'amount').text = amount
     SubElement(request, 'currency').text = currency
     SubElement(request, 'uppTransactionId').text = original_transaction_id
     SubElement(request, 'transtype').text = '06'
-    SubElement(request, 'sign').text = sign_web(merchant_id, amount, currency, client_ref)
+    SubElement(request, 'sign').text = sign
 
     return tostring(root, encoding='utf8')
 
 
+refund_template = XmlTemplate(
+    build_refund_request_tree_xml,
+    ['merchant_id', 'client_ref', 'amount', 'currency', 'original_transaction_id', 'sign'])
+
+
 def parse_refund_response_xml(xml: bytes) -> Refund:
+    return parse_refund_response_record(xml).to_model()
+
+
+def parse_refund_response_record(xml: bytes) -> RefundResponseRecord:
     body = fromstring(xml).find('body')
     status = body.get('status')
     transaction = body.find('transaction')
@@ -117,7 +193,7 @@ def parse_refund_response_xml(xml: bytes) -> Refund:
             acquirer_authorization_code=acquirer_authorization_code,
         )
         d.update(common_attributes)
-        return Refund(**d)
+        return RefundResponseRecord(**d)
     else:
         error = transaction.find('error')
 
@@ -131,4 +207,4 @@ def parse_refund_response_xml(xml: bytes) -> Refund:
             acquirer_error_code=acquirer_error_code_element.text if acquirer_error_code_element is not None else '',
         )
         d.update(**common_attributes)
-        return Refund(**d)
+        return RefundResponseRecord(**d)
@@ -0,0 +1,230 @@
+"""
+Protects both datatrans and us when datatrans degrades.
+
+- A token bucket limits the rate of the calls to datatrans. A call waits for a token, unless the wait would
+  exceed a maximum: then it fails at once with RateLimitError.
+- A circuit breaker opens after consecutive failures (network errors and 5xx responses). While it is open, calls
+  fail at once with CircuitOpenError instead of piling up on timeouts. After a while a single trial call is let
+  through: its success closes the circuit, its failure opens it again. A trial that never completes (its thread
+  was killed, for instance) is replaced by a new one after the same while.
+
+Both are shared by all the calls of the process (pay with alias and refunds, synchronous and async).
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.core.signals import setting_changed
+from structlog import get_logger
+
+from ..config import config
+
+logger = get_logger()
+
+
+class CircuitOpenError(Exception):
+    """ Datatrans was not called, because it failed repeatedly in the last moments. """
+
+
+class RateLimitError(Exception):
+    """ Datatrans was not called, because too many calls are already waiting for their turn. """
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, max_wait: float,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param rate: The number of calls allowed per second, on average
+        :param burst: The number of calls allowed at once, after a quiet period
+        :param max_wait: The longest time, in seconds, a call may wait for its turn
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token.
+
+        :return: The time to wait, in seconds, before making the call
+        :raises RateLimitError: If the wait would be longer than max_wait
+        """
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > self.max_wait:
+                raise RateLimitError('Rate limit of {} calls per second exceeded'.format(self.rate))
+            # The token is taken now, even if it's only available later: tokens go negative under load.
+            self._tokens -= 1
+            return wait
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param failure_threshold: The number of consecutive failures that opens the circuit
+        :param reset_timeout: The time, in seconds, the circuit stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def consecutive_failures(self) -> int:
+        return self._failures
+
+    def before_call(self) -> None:
+        """
+        :raises CircuitOpenError: If the call must not be made
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            now = self._clock()
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                # This call is the trial, the others keep failing fast until it completes.
+                self._state = self.HALF_OPEN
+                self._trial_started_at = now
+                logger.info('datatrans-circuit-half-open')
+                return
+            if self._state == self.HALF_OPEN and now - self._trial_started_at >= self.reset_timeout:
+                # The trial was lost without reporting its outcome: this call is the new trial.
+                self._trial_started_at = now
+                logger.warning('datatrans-circuit-trial-expired')
+                return
+        raise CircuitOpenError('Datatrans is not called after {} consecutive failures'.format(self._failures))
+
+    def abandon_call(self) -> None:
+        """ The call allowed by before_call was not made. """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                # The next call is the trial.
+                self._state = self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info('datatrans-circuit-closed')
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning('datatrans-circuit-open', consecutive_failures=self._failures)
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+rate_limiter: Optional[TokenBucket] = None
+circuit_breaker: Optional[CircuitBreaker] = None
+
+
+def configure() -> None:
+    """
+    Builds the rate limiter and the circuit breaker from the settings. Done on import, and again when the
+    DATATRANS setting changes (which also forgets the past calls).
+    """
+    global rate_limiter, circuit_breaker
+    rate_limiter = None
+    rate = config.rate_limit
+    if rate:
+        rate_limiter = TokenBucket(rate=rate, burst=config.rate_limit_burst or max(1, int(rate)),
+                                   max_wait=config.rate_limit_max_wait)
+    circuit_breaker = None
+    if config.circuit_breaker_failures:
+        circuit_breaker = CircuitBreaker(failure_threshold=config.circuit_breaker_failures,
+                                         reset_timeout=config.circuit_breaker_reset_timeout)
+
+
+def _reconfigure(setting: str, **kwargs) -> None:
+    if setting == 'DATATRANS':
+        configure()
+
+
+configure()
+setting_changed.connect(_reconfigure, dispatch_uid='datatrans-resilience')
+
+
+def before_call() -> float:
+    """
+    To be called before each call to datatrans.
+
+    :return: The time to wait, in seconds, before making the call
+    :raises CircuitOpenError: If the circuit breaker is open
+    :raises RateLimitError: If the wait for the rate limiter would be too long
+    """
+    if circuit_breaker is not None:
+        circuit_breaker.before_call()
+    if rate_limiter is not None:
+        try:
+            return rate_limiter.reserve()
+        except RateLimitError:
+            if circuit_breaker is not None:
+                circuit_breaker.abandon_call()
+            raise
+    return 0.0
+
+
+def abandon_call() -> None:
+    """
+    To be called when a call allowed by before_call was not made, or not completed (for instance cancelled).
+    """
+    if circuit_breaker is not None:
+        circuit_breaker.abandon_call()
+
+
+def after_call(success: bool) -> None:
+    """
+    To be called after each call to datatrans, successful unless there was no response or a 5xx response.
+    """
+    if circuit_breaker is not None:
+        if success:
+            circuit_breaker.record_success()
+        else:
+            circuit_breaker.record_failure()
+
+
+def get_outbound_state() -> Dict:
+    """
+    :return: The state of the rate limiter and of the circuit breaker, for monitoring
+    """
+    state: Dict = {}
+    if rate_limiter is not None:
+        state['rate_limit'] = rate_limiter.rate
+        state['rate_limit_tokens'] = rate_limiter.tokens
+    if circuit_breaker is not None:
+        state['circuit'] = circuit_breaker.state
+        state['consecutive_failures'] = circuit_breaker.consecutive_failures
+    return state
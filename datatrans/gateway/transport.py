@@ -0,0 +1,96 @@
+import atexit
+import threading
+import time
+from typing import Optional
+
+import requests
+from django.core.signals import setting_changed
+from requests.adapters import HTTPAdapter
+from structlog import get_logger
+
+from .resilience import abandon_call, after_call, before_call
+from ..metrics import endpoint_of, outbound_request_seconds
+from ..config import config
+
+logger = get_logger()
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide session used for all the calls to datatrans.
+    The session keeps a pool of connections alive, so consecutive calls don't pay for a new TCP and TLS handshake.
+    """
+    global _session
+    session = _session
+    if session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+            session = _session
+    return session
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=config.http_pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not config.http_keep_alive:
+        session.headers['Connection'] = 'close'
+    logger.debug('datatrans-session-created', pool_size=config.http_pool_size, keep_alive=config.http_keep_alive)
+    return session
+
+
+def post_xml(url: str, data: bytes) -> requests.Response:
+    """
+    Posts an xml document to datatrans, through the shared session.
+
+    :param url: The datatrans endpoint
+    :param data: The xml document
+    :return: The response of datatrans
+    :raises CircuitOpenError: If datatrans is failing, see resilience.py
+    :raises RateLimitError: If the rate of calls is too high, see resilience.py
+    """
+    wait = before_call()
+    try:
+        if wait:
+            time.sleep(wait)
+        with outbound_request_seconds.time(endpoint=endpoint_of(url)):
+            response = get_session().post(
+                url=url,
+                headers={'Content-Type': 'application/xml'},
+                data=data,
+                timeout=(config.http_connect_timeout, config.http_read_timeout))
+    except Exception:
+        after_call(success=False)
+        raise
+    except BaseException:
+        # Interrupted (KeyboardInterrupt, a gevent timeout...): the call did not complete.
+        abandon_call()
+        raise
+    after_call(success=response.status_code < 500)
+    return response
+
+
+def close_session() -> None:
+    """
+    Closes the pooled connections. A new session is transparently created by the next call to datatrans.
+    """
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+def _close_session_on_setting_change(setting: str, **kwargs) -> None:
+    # The next session is built with the new settings.
+    if setting == 'DATATRANS':
+        close_session()
+
+
+atexit.register(close_session)
+setting_changed.connect(_close_session_on_setting_change, dispatch_uid='datatrans-transport')
@@ -0,0 +1,90 @@
+"""
+Parses the xml documents received from datatrans (responses and notifications), with the backend selected by
+DATATRANS['XML_PARSER']:
+
+- 'defusedxml' (the default): the standard library ElementTree, protected by defusedxml.
+- 'lxml': lxml, which parses several times faster (install with `pip install django-datatrans-gateway[lxml]`).
+  Entities are not resolved, and nothing is loaded from the network.
+
+Datatrans never sends a DTD: both backends refuse documents with one, with defusedxml's DTDForbidden.
+
+Both backends return elements with the ElementTree api, so the parsers work the same with either.
+"""
+import threading
+from typing import Any, Callable, Optional, Union
+
+from django.core.signals import setting_changed
+
+from ..config import config
+
+Xml = Union[str, bytes]
+
+
+def defusedxml_fromstring_factory() -> Callable[[Xml], Any]:
+    from defusedxml.ElementTree import fromstring as defusedxml_fromstring
+
+    def fromstring(xml: Xml) -> Any:
+        return defusedxml_fromstring(xml, forbid_dtd=True)
+
+    return fromstring
+
+
+def lxml_fromstring_factory() -> Callable[[Xml], Any]:
+    from defusedxml import DTDForbidden
+    from lxml import etree
+
+    # lxml parsers can't be shared between threads.
+    parsers = threading.local()
+
+    def lxml_fromstring(xml: Xml) -> Any:
+        parser = getattr(parsers, 'parser', None)
+        if parser is None:
+            parser = parsers.parser = etree.XMLParser(
+                resolve_entities=False, no_network=True, load_dtd=False, huge_tree=False,
+                remove_comments=True, remove_pis=True)
+        if isinstance(xml, str):
+            # lxml refuses strings with an encoding declaration.
+            xml = xml.encode('utf-8')
+        root = etree.fromstring(xml, parser)
+        docinfo = root.getroottree().docinfo
+        if docinfo.doctype:
+            raise DTDForbidden(docinfo.root_name, docinfo.system_url, docinfo.public_id)
+        return root
+
+    return lxml_fromstring
+
+
+BACKENDS = {
+    'defusedxml': defusedxml_fromstring_factory,
+    'lxml': lxml_fromstring_factory,
+}
+
+
+def get_backend(name: str) -> Callable[[Xml], Any]:
+    if name not in BACKENDS:
+        raise ValueError('Unknown xml parser: {} (choose among {})'.format(name, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[name]()
+
+
+# Chosen on first use, and again after a change of the DATATRANS setting.
+_backend: Optional[Callable[[Xml], Any]] = None
+
+
+def fromstring(xml: Xml) -> Any:
+    """
+    :return: The root element of the document
+    """
+    global _backend
+    backend = _backend
+    if backend is None:
+        backend = _backend = get_backend(config.xml_parser)
+    return backend(xml)
+
+
+def _forget_backend(setting: str, **kwargs) -> None:
+    global _backend
+    if setting == 'DATATRANS':
+        _backend = None
+
+
+setting_changed.connect(_forget_backend, dispatch_uid='datatrans-xml-parsing')
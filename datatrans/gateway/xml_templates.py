@@ -0,0 +1,37 @@
+"""
+Serializes the requests to datatrans by filling a byte template, instead of building an ElementTree and
+serializing it for each request.
+
+A template is compiled once, by running the ElementTree builder with placeholders as values: it is byte for byte
+what the builder produces. Values that the builder would escape or encode differently (markup characters, control
+characters, non ascii characters), empty values, and values that are not strings are unusual: the document is then
+built by the builder itself.
+"""
+import re
+from typing import Callable, Sequence
+
+# None of these characters is escaped by ElementTree, in text or in attributes.
+_PLAIN_VALUE = re.compile(r'[A-Za-z0-9 _.,:;/@+=()#*~$%!?-]+\Z')
+
+
+class XmlTemplate:
+    def __init__(self, build: Callable[..., bytes], names: Sequence[str]) -> None:
+        """
+        :param build: Builds the document with ElementTree, given the values as string keyword arguments
+        :param names: The names of the values, each must appear exactly once in the document
+        """
+        self.build = build
+        self.names = tuple(names)
+        # The keys of a bytes template are bytes.
+        self._keys = {name: name.encode('ascii') for name in self.names}
+        self.template = build(**{name: '%({})s'.format(name) for name in self.names})
+        if self.template.count(b'%') != len(self.names):
+            raise ValueError('Each value must appear exactly once in the document')
+
+    def render(self, **values) -> bytes:
+        plain_values = {}
+        for name, value in values.items():
+            if not isinstance(value, str) or not _PLAIN_VALUE.match(value):
+                return self.build(**values)
+            plain_values[self._keys[name]] = value.encode('ascii')
+        return self.template % plain_values
@@ -0,0 +1,36 @@
+import csv
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from ...expiring import DEFAULT_CHUNK_SIZE, expiring_alias_registrations, send_alias_expiring
+
+
+class Command(BaseCommand):
+    help = 'Lists (as csv) the registered credit cards that expire within the coming days, or signals them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='The length of the window, from --since.')
+        parser.add_argument('--since', type=parse_date, help='The start of the window (default: today).')
+        parser.add_argument('--distinct-card-alias', action='store_true',
+                            help='Only output one alias registration per card alias.')
+        parser.add_argument('--signal', action='store_true',
+                            help='Send the alias_expiring signal, a chunk at a time, instead of listing.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = options['since'] or date.today()
+        until = since + timedelta(days=options['days'])
+        if options['signal']:
+            count = send_alias_expiring(until, since, options['distinct_card_alias'], options['chunk_size'])
+            self.stdout.write('Signaled {} expiring alias registrations'.format(count))
+            return
+
+        writer = csv.writer(self.stdout)
+        writer.writerow(['id', 'card_alias', 'masked_card_number', 'payment_method', 'expiry_date', 'client_ref'])
+        for alias_registration in expiring_alias_registrations(
+                until, since, options['distinct_card_alias'], options['chunk_size']):
+            writer.writerow([alias_registration.id, alias_registration.card_alias,
+                             alias_registration.masked_card_number, alias_registration.payment_method,
+                             alias_registration.expiry_date, alias_registration.client_ref])
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from ...export import DEFAULT_CHUNK_SIZE, FORMATS, export
+from ...models import AliasRegistration, Payment, Refund
+
+MODELS = {
+    'alias_registration': AliasRegistration,
+    'payment': Payment,
+    'refund': Refund,
+}
+
+
+class Command(BaseCommand):
+    help = 'Streams alias registrations, payments, or refunds as csv or json lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help='The file to write to (default: the standard output).')
+        parser.add_argument('--since', type=parse_datetime, help='Only export rows created at or after this time.')
+        parser.add_argument('--until', type=parse_datetime, help='Only export rows created before this time.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = MODELS[options['model']].objects.all()
+        if options['since']:
+            queryset = queryset.filter(created__gte=options['since'])
+        if options['until']:
+            queryset = queryset.filter(created__lt=options['until'])
+
+        lines = export(queryset, options['format'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,115 @@
+import math
+import threading
+import time
+from decimal import Decimal
+from itertools import count
+from typing import List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from moneyed import Money
+
+from ...gateway import pay_with_alias, refund
+from ...gateway.payment_with_alias import mpo_merchant_of
+from ...models import AliasRegistration
+
+
+FAKE_MERCHANT_ID = 'loadtest'
+
+
+class Command(BaseCommand):
+    help = ('Charges (and optionally refunds) a registered alias many times concurrently, and reports the latency '
+            'and throughput. Meant to run against the datatrans_simulator: the payments are saved in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='The number of charges.')
+        parser.add_argument('--concurrency', type=int, default=8, help='The number of concurrent clients.')
+        parser.add_argument('--alias-registration', help='The id of the alias registration to charge. '
+                                                         'By default a fake alias registration is created.')
+        parser.add_argument('--amount', type=Decimal, default=Decimal('1.00'))
+        parser.add_argument('--currency', default='CHF')
+        parser.add_argument('--refund', action='store_true', help='Also refund each successful charge.')
+
+    def handle(self, *args, **options):
+        if options['alias_registration']:
+            alias_registration = AliasRegistration.objects.get(pk=options['alias_registration'])
+        else:
+            alias_registration = AliasRegistration(merchant_id=FAKE_MERCHANT_ID)
+
+        # The charges, and their refunds, go to the endpoints of the mpo merchant of the alias registration.
+        merchant = mpo_merchant_of(alias_registration)
+        if any('datatrans.com' in url for url in (merchant.authorize_url, merchant.processor_url)):
+            raise CommandError('Refusing to load test datatrans itself (merchant {}), set API_BASE_URL to the url '
+                               'of the datatrans_simulator.'.format(merchant.merchant_id))
+
+        if not options['alias_registration']:
+            alias_registration = create_fake_alias_registration()
+        alias_registration_id = alias_registration.pk
+
+        amount = Money(options['amount'], options['currency'])
+        run = int(time.time())
+        numbers = count()
+        lock = threading.Lock()
+        latencies: List[float] = []
+        outcomes = {'success': 0, 'declined': 0, 'error': 0}
+
+        def client():
+            try:
+                while True:
+                    with lock:
+                        n = next(numbers)
+                    if n >= options['requests']:
+                        return
+                    start = time.perf_counter()
+                    try:
+                        payment = pay_with_alias(amount=amount, alias_registration_id=alias_registration_id,
+                                                 client_ref='{}-{}'.format(run, n))
+                        if payment.success and options['refund']:
+                            refund(amount=amount, payment_id=payment.pk)
+                        outcome = 'success' if payment.success else 'declined'
+                    except Exception as e:
+                        self.stderr.write(repr(e))
+                        outcome = 'error'
+                    latency = time.perf_counter() - start
+                    with lock:
+                        latencies.append(latency)
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        self.stdout.write('{} requests in {:.2f}s: {:.1f} requests/s'.format(
+            len(latencies), elapsed, len(latencies) / elapsed))
+        self.stdout.write('success: {success}, declined: {declined}, error: {error}'.format(**outcomes))
+        self.stdout.write('latency p50: {:.1f}ms, p95: {:.1f}ms, p99: {:.1f}ms'.format(
+            *(percentile(latencies, p) * 1000 for p in (50, 95, 99))))
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """ Nearest-rank percentile. """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def create_fake_alias_registration() -> AliasRegistration:
+    return AliasRegistration.objects.create(
+        success=True,
+        merchant_id=FAKE_MERCHANT_ID,
+        client_ref='loadtest',
+        amount=Money(0, 'CHF'),
+        payment_method='VIS',
+        card_alias='70119122433810042',
+        masked_card_number='424242xxxxxx4242',
+        expiry_month=12,
+        expiry_year=99,
+    )
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...gateway.inbox import process_inbox
+
+
+class Command(BaseCommand):
+    help = "Processes the notifications stored by the webhook in 'inbox' mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='The number of notifications claimed at once.')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Notifications that failed this many times are no longer retried.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the inbox instead of exiting once it is drained.')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='With --loop, the number of seconds to wait when the inbox is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = process_inbox(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+            if processed or failed:
+                self.stdout.write('Processed {} notifications, {} failed'.format(processed, failed))
+            if not options['loop']:
+                return
+            if not processed:
+                time.sleep(options['sleep'])
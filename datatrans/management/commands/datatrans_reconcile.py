@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...reconciliation import DEFAULT_BATCH_SIZE, read_settlement_report, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Matches a csv settlement report with the recorded payments and refunds, and saves the results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='The number of rows matched and saved at once.')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--transaction-id-column', default='transaction_id')
+        parser.add_argument('--amount-column', default='amount', help='The amounts are in major units (12.50).')
+        parser.add_argument('--currency-column', default='currency')
+
+    def handle(self, *args, **options):
+        # utf-8-sig skips the byte order mark that spreadsheets add.
+        with open(options['file'], newline='', encoding='utf-8-sig') as f:
+            rows = read_settlement_report(
+                f,
+                transaction_id_column=options['transaction_id_column'],
+                amount_column=options['amount_column'],
+                currency_column=options['currency_column'],
+                delimiter=options['delimiter'],
+            )
+            try:
+                summary = reconcile(rows, report=os.path.basename(options['file']),
+                                    batch_size=options['batch_size'])
+            except ValueError as e:
+                raise CommandError(e)
+
+        self.stdout.write('Run {}: {} matched, {} missing, {} amount mismatch'.format(
+            summary.run, summary.matched, summary.missing, summary.amount_mismatch))
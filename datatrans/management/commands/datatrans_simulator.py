@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from ...simulator import DatatransSimulator, simulator_behavior
+
+
+class Command(BaseCommand):
+    help = 'Runs a local stand-in for the datatrans api, for load tests. Never use it in production.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='The mean time, in seconds, before answering.')
+        parser.add_argument('--jitter', type=float, default=0.0,
+                            help='The latency is uniformly distributed in latency +/- jitter.')
+        parser.add_argument('--error-ratio', type=float, default=0.0,
+                            help='The proportion of declined requests, between 0 and 1.')
+        parser.add_argument('--acq-error-codes', default='50',
+                            help='Comma separated acquirer error codes of declined charges (may be empty).')
+        parser.add_argument('--webhook-url',
+                            help='Send a notification to this url for each charge, '
+                                 'for instance http://localhost:8000/datatrans/webhook')
+        parser.add_argument('--seed', type=int, help='Seed the random generator, for reproducible runs.')
+
+    def handle(self, *args, **options):
+        behavior = simulator_behavior(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_ratio=options['error_ratio'],
+            acquirer_error_codes=[code for code in options['acq_error_codes'].split(',') if code],
+            webhook_url=options['webhook_url'],
+        )
+        simulator = DatatransSimulator(behavior, host=options['host'], port=options['port'], seed=options['seed'])
+        self.stdout.write('Simulating datatrans on {} with {}'.format(simulator.base_url, behavior))
+        try:
+            simulator.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            simulator.stop()
@@ -0,0 +1,180 @@
+"""
+Counters and histograms of the gateway, rendered in the prometheus text format by the metrics view.
+
+The metrics live in the memory of each process, so collecting them costs a dictionary update under a lock.
+Set DATATRANS['METRICS'] to False to turn the collection off.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from .config import config
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_registry: List['_Metric'] = []
+
+
+class _Metric(ABC):
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(labelname, '')) for labelname in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = '') -> str:
+        pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    @abstractmethod
+    def collect(self) -> Iterator[str]:
+        """ The samples of the metric, in the prometheus text format. """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """ Forgets the values collected so far. """
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not config.metrics_enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield '{}{} {}'.format(self.name, self._labels(key), _format(value))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # For each labels: the number of observations in each bucket (the last one is +Inf), and their sum.
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not config.metrics_enabled:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """ Observes the duration of the block, in seconds, even if it raises. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        values = self._values.get(self._key(labels))
+        return sum(values[0]) if values else 0
+
+    def collect(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="{}"'.format('+Inf' if bound == float('inf') else _format(bound))
+                yield '{}_bucket{} {}'.format(self.name, self._labels(key, le), cumulative)
+            yield '{}_sum{} {}'.format(self.name, self._labels(key), _format(total))
+            yield '{}_count{} {}'.format(self.name, self._labels(key), cumulative)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def render() -> str:
+    """
+    :return: All the metrics, in the prometheus text exposition format
+    """
+    lines = []
+    for metric in _registry:
+        lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def clear() -> None:
+    for metric in _registry:
+        metric.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    return repr(float(value))
+
+
+outbound_request_seconds = Histogram(
+    'datatrans_outbound_request_seconds', 'Duration of the calls to datatrans, by endpoint.', ['endpoint'])
+
+transactions = Counter(
+    'datatrans_transactions_total', 'Alias registrations, payments, and refunds recorded.',
+    ['type', 'success', 'error_code', 'payment_method', 'response_code'])
+
+webhook_seconds = Histogram(
+    'datatrans_webhook_seconds', 'Duration of the processing of notifications, by stage (parse includes verify).',
+    ['stage'], buckets=FAST_BUCKETS)
+
+signal_seconds = Histogram(
+    'datatrans_signal_seconds', 'Duration of the receivers of each signal.', ['signal'], buckets=FAST_BUCKETS)
+
+
+def count_transaction(instance) -> None:
+    transactions.inc(
+        type=instance.__class__.__name__,
+        success=instance.success,
+        error_code=instance.error_code,
+        payment_method=getattr(instance, 'payment_method', ''),
+        response_code=instance.response_code,
+    )
+
+
+def endpoint_of(url: str) -> str:
+    """ The label of a datatrans url, for instance XML_authorize.jsp. """
+    return url.rsplit('/', 1)[-1]
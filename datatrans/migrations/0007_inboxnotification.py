@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datatrans', '0006_no_more_default_value_for_amounts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received', models.DateTimeField(auto_now_add=True)),
+                ('body', models.TextField()),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+    ]
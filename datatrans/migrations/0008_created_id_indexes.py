@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datatrans', '0007_inboxnotification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aliasregistration',
+            index=models.Index(fields=['created', 'id'], name='datatrans_alias_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created', 'id'], name='datatrans_payment_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='refund',
+            index=models.Index(fields=['created', 'id'], name='datatrans_refund_created_id'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:22
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def compute_refunded_totals(apps, schema_editor):
+    Payment = apps.get_model('datatrans', 'Payment')
+    Refund = apps.get_model('datatrans', 'Refund')
+    totals = (Refund.objects.filter(success=True).order_by()
+              .values('payment_transaction_id').annotate(total=Sum('amount')))
+    for row in totals.iterator():
+        Payment.objects.filter(transaction_id=row['payment_transaction_id']).update(refunded_total=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datatrans', '0008_created_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='refunded_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(compute_refunded_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datatrans', '0009_payment_refunded_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run', models.UUIDField(db_index=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('report', models.CharField(blank=True, max_length=255)),
+                ('line', models.IntegerField()),
+                ('transaction_id', models.CharField(db_index=True, max_length=18)),
+                ('status', models.CharField(choices=[('matched', 'Matched'), ('missing', 'Missing'), ('amount_mismatch', 'Amount mismatch')], db_index=True, max_length=15)),
+                ('reported_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('reported_currency', models.CharField(max_length=3)),
+                ('transaction_type', models.CharField(blank=True, max_length=7)),
+                ('recorded_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('recorded_currency', models.CharField(blank=True, max_length=3)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datatrans', '0010_reconciliationresult'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aliasregistration',
+            index=models.Index(fields=['success', 'expiry_date', 'id'], name='datatrans_alias_expiry'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:51
+
+from django.db import migrations, models
+from django.db.models.functions import Length, Substr
+
+
+def compute_card_tails(apps, schema_editor):
+    # One UPDATE per table. Substr and Length rather than Right, which django 2.0 does not have.
+    for model_name in ['AliasRegistration', 'Payment']:
+        model = apps.get_model('datatrans', model_name)
+        model.objects.filter(masked_card_number__regex=r'[0-9]{4}$').update(
+            card_tail=Substr('masked_card_number', Length('masked_card_number') - 3, 4))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datatrans', '0011_alias_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aliasregistration',
+            name='card_tail',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='card_tail',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=4),
+        ),
+        migrations.RunPython(compute_card_tails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datatrans', '0012_card_tail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboxnotification',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
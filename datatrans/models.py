@@ -1,15 +1,29 @@
 import calendar
 import uuid
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Type
 
 from datetime import date
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from djmoney.models.fields import MoneyField
+from moneyed import Money
 
-from .signals import alias_registration_done, payment_by_user_done, payment_with_alias_done, refund_done
+from .metrics import count_transaction, signal_seconds
+from .signals import (alias_registration_done, payment_by_user_done, payment_with_alias_done, refund_done,
+                      transactions_recorded)
 
 CLIENT_REF_FIELD_SIZE = 18
 
+SIGNAL_NAMES = {
+    alias_registration_done: 'alias_registration_done',
+    payment_by_user_done: 'payment_by_user_done',
+    payment_with_alias_done: 'payment_with_alias_done',
+    refund_done: 'refund_done',
+}
+
 expiry_month_validators = [MinValueValidator(1), MaxValueValidator(12)]
 expiry_year_validators = [MinValueValidator(0), MaxValueValidator(99)]
 
@@ -20,6 +34,12 @@ def compute_expiry_date(two_digit_year: int, month: int) -> date:
     return date(year=year, month=month, day=last_day_of_month)
 
 
+def card_tail_of(masked_card_number: str) -> str:
+    """ The last 4 digits of a masked card number, such as 424242xxxxxx4242 (empty if there are none). """
+    tail = (masked_card_number or '')[-4:]
+    return tail if len(tail) == 4 and tail.isdigit() else ''
+
+
 class TransactionBase(models.Model):
     """"
     All the fields that are common to the different transaction types.
@@ -57,12 +77,24 @@ class TransactionBase(models.Model):
     acquirer_error_code = models.CharField(max_length=255, blank=True)
 
     def save(self, *args, **kwargs):
+        self.update_expiry_date()
+        self.update_card_tail()
+        super().save(*args, **kwargs)
+
+    def update_expiry_date(self):
+        """ save() does this automatically, but bulk inserts must call it explicitly. """
         if self.expiry_year is not None and self.expiry_month is not None:
             self.expiry_date = compute_expiry_date(two_digit_year=self.expiry_year, month=self.expiry_month)
-        super().save(*args, **kwargs)
+
+    def update_card_tail(self):
+        """ save() does this automatically, but bulk inserts must call it explicitly. Refunds have no card. """
+        if hasattr(self, 'card_tail'):
+            self.card_tail = card_tail_of(self.masked_card_number)
 
     def _send_signal(self, signal):
-        signal.send(sender=None, instance=self, success=self.success)
+        count_transaction(self)
+        with signal_seconds.time(signal=SIGNAL_NAMES[signal]):
+            signal.send(sender=None, instance=self, success=self.success)
 
     class Meta:
         abstract = True
@@ -82,6 +114,8 @@ class TransactionBase(models.Model):
 class AliasRegistration(TransactionBase):
     card_alias = models.CharField(db_index=True, max_length=20, blank=True)
     masked_card_number = models.CharField(max_length=255, blank=True)
+    # The last digits of the masked card number, so that the admin can search them with an indexed equality.
+    card_tail = models.CharField(db_index=True, max_length=4, blank=True, editable=False)
     payment_method = models.CharField(db_index=True, max_length=3)
     expiry_month = models.IntegerField(validators=expiry_month_validators)
     expiry_year = models.IntegerField(validators=expiry_year_validators)
@@ -92,12 +126,28 @@ class AliasRegistration(TransactionBase):
     def __str__(self):
         return 'Alias: {} {}'.format(self.payment_method, self.masked_card_number)
 
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination of the admin (see pagination.py).
+            models.Index(fields=['created', 'id'], name='datatrans_alias_created_id'),
+            # Backs the keyset scan of expiring cards (see expiring.py): all the cards of a month share their
+            # expiry_date, so the id is part of the index too.
+            models.Index(fields=['success', 'expiry_date', 'id'], name='datatrans_alias_expiry'),
+        ]
+
 
 class Payment(TransactionBase):
     transaction_id = models.CharField(unique=True, max_length=18)
     card_alias = models.CharField(db_index=True, max_length=20, blank=True)
     masked_card_number = models.CharField(max_length=255, blank=True)
+    card_tail = models.CharField(db_index=True, max_length=4, blank=True, editable=False)
     payment_method = models.CharField(db_index=True, max_length=3, blank=True)
+    # The sum of the successful refunds of this payment, in the currency of the payment.
+    refunded_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
+    @property
+    def refundable_amount(self) -> Money:
+        return Money(self.amount.amount - self.refunded_total, self.amount.currency)
 
     def send_signal(self):
         if self.card_alias:
@@ -105,9 +155,142 @@ class Payment(TransactionBase):
         else:
             self._send_signal(payment_by_user_done)
 
+    class Meta:
+        # Backs the keyset pagination of the admin (see pagination.py).
+        indexes = [models.Index(fields=['created', 'id'], name='datatrans_payment_created_id')]
+
 
 class Refund(TransactionBase):
     payment_transaction_id = models.CharField(db_index=True, max_length=18)
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            add_to_refunded_totals([self])
+
     def send_signal(self):
         self._send_signal(refund_done)
+
+    class Meta:
+        # Backs the keyset pagination of the admin (see pagination.py).
+        indexes = [models.Index(fields=['created', 'id'], name='datatrans_refund_created_id')]
+
+
+def add_to_refunded_totals(refunds: Sequence[Refund]) -> None:
+    """
+    Adds newly recorded successful refunds to the refunded_total of their payments, with one update per payment.
+    """
+    totals: Dict[str, Decimal] = OrderedDict()
+    for refund in refunds:
+        if refund.success:
+            totals[refund.payment_transaction_id] = (
+                totals.get(refund.payment_transaction_id, Decimal(0)) + refund.amount.amount)
+    for payment_transaction_id, total in totals.items():
+        Payment.objects.filter(transaction_id=payment_transaction_id).update(
+            refunded_total=F('refunded_total') + total)
+
+
+class SignalError(Exception):
+    """
+    Raised by bulk_record when signal receivers raised. The instances are committed, and all the signals were sent.
+    """
+
+    def __init__(self, errors: Dict[TransactionBase, Exception]) -> None:
+        super().__init__('{} signal receivers raised, the first: {!r}'.format(
+            len(errors), next(iter(errors.values()))))
+        # The first error of each instance whose signals failed.
+        self.errors = errors
+
+
+def bulk_record(instances: Sequence[TransactionBase], batch_size: Optional[int] = None,
+                per_row_signals: bool = True) -> None:
+    """
+    Saves many alias registrations, payments, or refunds with bulk inserts.
+
+    Once the database transaction commits, transactions_recorded is sent once per model with all its instances.
+    Unless per_row_signals is False, the usual signal is then also sent for each instance, as if it had
+    been saved on its own. A receiver that raises does not stop the other signals: SignalError is raised once
+    they are all sent.
+    """
+    by_model: Dict[Type[TransactionBase], List[TransactionBase]] = OrderedDict()
+    for instance in instances:
+        instance.update_expiry_date()
+        instance.update_card_tail()
+        by_model.setdefault(instance.__class__, []).append(instance)
+
+    def send_signals() -> None:
+        errors: Dict[TransactionBase, Exception] = OrderedDict()
+        for model, group in by_model.items():
+            try:
+                with signal_seconds.time(signal='transactions_recorded'):
+                    transactions_recorded.send(sender=model, instances=group)
+            except Exception as e:
+                errors.update((instance, e) for instance in group)
+            for instance in group:
+                if per_row_signals:
+                    try:
+                        instance.send_signal()
+                    except Exception as e:
+                        errors.setdefault(instance, e)
+                else:
+                    count_transaction(instance)
+        if errors:
+            raise SignalError(errors)
+
+    with transaction.atomic():
+        for model, group in by_model.items():
+            model.objects.bulk_create(group, batch_size=batch_size)
+            if model is Refund:
+                add_to_refunded_totals(group)
+        transaction.on_commit(send_signals)
+
+
+class InboxNotification(models.Model):
+    """
+    A notification received by the webhook in 'inbox' mode, waiting to be processed.
+    Successfully processed notifications are deleted from the inbox.
+    """
+    received = models.DateTimeField(auto_now_add=True)
+    body = models.TextField()
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Set while a worker processes the notification (see process_inbox).
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return 'Notification received {}'.format(self.received)
+
+
+class ReconciliationResult(models.Model):
+    """
+    The outcome of matching one row of a settlement report against the recorded payments and refunds.
+    All the rows imported together share the same run.
+    """
+    MATCHED = 'matched'
+    MISSING = 'missing'
+    AMOUNT_MISMATCH = 'amount_mismatch'
+    STATUS_CHOICES = [
+        (MATCHED, 'Matched'),
+        (MISSING, 'Missing'),
+        (AMOUNT_MISMATCH, 'Amount mismatch'),
+    ]
+
+    run = models.UUIDField(db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+    report = models.CharField(max_length=255, blank=True)
+    line = models.IntegerField()
+    transaction_id = models.CharField(db_index=True, max_length=18)
+    status = models.CharField(db_index=True, max_length=15, choices=STATUS_CHOICES)
+    # What the report says.
+    reported_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    reported_currency = models.CharField(max_length=3)
+    # What we recorded, unless missing.
+    transaction_type = models.CharField(max_length=7, blank=True)
+    recorded_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    recorded_currency = models.CharField(max_length=3, blank=True)
+
+    def __str__(self):
+        return 'Reconciliation of {}: {}'.format(self.transaction_id, self.status)
@@ -0,0 +1,91 @@
+"""
+A paginator for the admin changelists of big tables.
+
+- Counts: an unfiltered list is counted from the planner statistics (postgres and mysql), instead of a COUNT(*)
+  of the whole table. Small tables, filtered lists, and other databases are counted exactly.
+  Set DATATRANS['ADMIN_EXACT_COUNTS'] to always count exactly.
+- Pages: when the list is ordered on (created, id), a page is selected by seeking the (created, id) index from
+  the first row of the page, instead of an OFFSET over full rows. Only that first row is found with an offset,
+  which reads the narrow (created, id) index alone.
+"""
+from typing import Optional
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+from .config import config
+
+# Below this, the estimate is not worth its inaccuracy.
+EXACT_COUNT_THRESHOLD = 10000
+
+_KEYSET_ORDERINGS = {
+    ('-created', '-id'): True,
+    ('-created', '-pk'): True,
+    ('created', 'id'): False,
+    ('created', 'pk'): False,
+}
+
+
+class KeysetPaginator(Paginator):
+    @cached_property
+    def count(self) -> int:
+        if not config.admin_exact_counts and isinstance(self.object_list, QuerySet):
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= EXACT_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        descending = _keyset_descending(self.object_list)
+        if number == 1 or descending is None:
+            return super().page(number)
+
+        offset = (number - 1) * self.per_page
+        first = list(self.object_list.values_list('created', 'id')[offset:offset + 1])
+        if not first:
+            # The estimated count can be too high.
+            return self._get_page(self.object_list.none(), number, self)
+        created, id = first[0]
+        if descending:
+            seek = Q(created__lt=created) | Q(created=created, id__lte=id)
+        else:
+            seek = Q(created__gt=created) | Q(created=created, id__gte=id)
+        return self._get_page(self.object_list.filter(seek)[:self.per_page], number, self)
+
+
+def estimated_count(queryset: QuerySet) -> Optional[int]:
+    """
+    :return: The number of rows of the table according to the planner statistics, or None if unknown or if
+    the queryset is filtered.
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.low_mark or query.high_mark is not None:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    # Postgres reports -1 for a table that was never analyzed.
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def _keyset_descending(object_list) -> Optional[bool]:
+    """ Whether the list is ordered on (created, id) descending, ascending, or None if otherwise. """
+    if not isinstance(object_list, QuerySet) or object_list.query.distinct:
+        return None
+    ordering = tuple(object_list.query.order_by)
+    if not all(isinstance(field, str) for field in ordering):
+        return None
+    return _KEYSET_ORDERINGS.get(ordering)
@@ -0,0 +1,126 @@
+"""
+Reconciliation of datatrans settlement reports against the recorded payments and refunds.
+
+The report is read row by row, and matched in batches: one query per batch and per transaction type, on the
+unique transaction_id. The results are written with bulk inserts, so the memory used does not depend on the
+size of the report. They are written in a single transaction: a report that cannot be read to the end (for instance
+with an invalid amount) leaves no results.
+"""
+import csv
+import uuid
+from collections import Counter, namedtuple
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+from django.db import transaction
+
+from .models import Payment, ReconciliationResult, Refund
+
+DEFAULT_BATCH_SIZE = 500
+
+SettlementRow = namedtuple('SettlementRow', 'line transaction_id amount currency')
+
+ReconciliationSummary = namedtuple('ReconciliationSummary', 'run matched missing amount_mismatch')
+
+
+def read_settlement_report(lines: Iterable[str], transaction_id_column: str = 'transaction_id',
+                           amount_column: str = 'amount', currency_column: str = 'currency',
+                           delimiter: str = ',') -> Iterator[SettlementRow]:
+    """
+    Parses a csv settlement report, lazily.
+
+    :param lines: The lines of the report, for instance an open file. The first line names the columns.
+    :param transaction_id_column: The column with the datatrans transaction id
+    :param amount_column: The column with the amount, in major units (for instance 12.50)
+    :param currency_column: The column with the currency code
+    """
+    reader = csv.DictReader(lines, delimiter=delimiter)
+    columns = [transaction_id_column, amount_column, currency_column]
+    missing_columns = [column for column in columns if column not in (reader.fieldnames or [])]
+    if missing_columns:
+        raise ValueError('The report has no column {}'.format(', '.join(missing_columns)))
+
+    for row in reader:
+        try:
+            amount = Decimal(row[amount_column].strip())
+        except InvalidOperation:
+            raise ValueError('Invalid amount on line {}: {!r}'.format(reader.line_num, row[amount_column]))
+        yield SettlementRow(
+            line=reader.line_num,
+            transaction_id=row[transaction_id_column].strip(),
+            amount=amount,
+            currency=row[currency_column].strip().upper(),
+        )
+
+
+def reconcile(rows: Iterable[SettlementRow], report: str = '',
+              batch_size: int = DEFAULT_BATCH_SIZE) -> ReconciliationSummary:
+    """
+    Matches the rows of a settlement report with the payments and refunds, and saves a ReconciliationResult
+    for each row.
+
+    Refunds are sometimes reported with a negative amount, so only the absolute amounts are compared.
+
+    :param rows: The rows of the report, see read_settlement_report
+    :param report: The name of the report, saved with each result
+    :param batch_size: The number of rows matched and saved at once
+    :return: The run shared by all the results, and the number of results of each status
+    :raise ValueError: If a row cannot be read, no result of the run is saved
+    """
+    run = uuid.uuid4()
+    counts: Counter = Counter()
+    with transaction.atomic():
+        for batch in _chunks(rows, batch_size):
+            results = _reconcile_batch(run, report, batch)
+            ReconciliationResult.objects.bulk_create(results)
+            counts.update(result.status for result in results)
+    return ReconciliationSummary(
+        run=run,
+        matched=counts[ReconciliationResult.MATCHED],
+        missing=counts[ReconciliationResult.MISSING],
+        amount_mismatch=counts[ReconciliationResult.AMOUNT_MISMATCH],
+    )
+
+
+def _reconcile_batch(run: uuid.UUID, report: str, batch: List[SettlementRow]) -> List[ReconciliationResult]:
+    recorded: Dict = {}
+    for model in [Payment, Refund]:
+        remaining = [row.transaction_id for row in batch if row.transaction_id not in recorded]
+        if remaining:
+            recorded.update(model.objects
+                            .only('transaction_id', 'amount', 'amount_currency')
+                            .in_bulk(remaining, field_name='transaction_id'))
+
+    results = []
+    for row in batch:
+        result = ReconciliationResult(
+            run=run,
+            report=report,
+            line=row.line,
+            transaction_id=row.transaction_id,
+            reported_amount=row.amount,
+            reported_currency=row.currency,
+        )
+        instance = recorded.get(row.transaction_id)
+        if instance is None:
+            result.status = ReconciliationResult.MISSING
+        else:
+            result.transaction_type = instance.__class__.__name__.lower()
+            result.recorded_amount = instance.amount.amount
+            result.recorded_currency = str(instance.amount.currency)
+            if abs(row.amount) == instance.amount.amount and row.currency == result.recorded_currency:
+                result.status = ReconciliationResult.MATCHED
+            else:
+                result.status = ReconciliationResult.AMOUNT_MISMATCH
+        results.append(result)
+    return results
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -4,3 +4,9 @@ alias_registration_done = Signal()
 payment_by_user_done = Signal()
 payment_with_alias_done = Signal()
 refund_done = Signal()
+
+# Sent once per bulk_record, per model, with all the recorded instances (sender is the model class).
+transactions_recorded = Signal()
+
+# Sent by send_alias_expiring, with a chunk of alias registrations whose card expires soon (sender is None).
+alias_expiring = Signal()
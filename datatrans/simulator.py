@@ -0,0 +1,231 @@
+"""
+A local stand-in for the datatrans api, for load tests and offline benchmarks. Never use it in production.
+
+It speaks the XML_authorize.jsp (pay with alias) and XML_processor.jsp (refund) protocols, with a configurable
+latency, error ratio and acquirer error codes. It can also send a notification to the webhook for each
+charge, the way datatrans would for a payment.
+
+Start it with the datatrans_simulator command, and point the gateway to it in the settings:
+
+    DATATRANS = {
+        ...
+        'API_BASE_URL': 'http://localhost:8765/',
+    }
+"""
+import random
+import socketserver
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from itertools import count
+from typing import Any, Optional, Sequence
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+import requests
+from defusedxml.ElementTree import fromstring
+from structlog import get_logger
+
+from .config import config
+
+logger = get_logger()
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ http.server.ThreadingHTTPServer, which only exists from python 3.7. """
+    daemon_threads = True
+
+
+SimulatorBehavior = namedtuple('SimulatorBehavior', 'latency jitter error_ratio acquirer_error_codes webhook_url')
+
+
+def simulator_behavior(latency: float = 0.0, jitter: float = 0.0, error_ratio: float = 0.0,
+                       acquirer_error_codes: Sequence[str] = ('50',),
+                       webhook_url: Optional[str] = None) -> SimulatorBehavior:
+    """
+    :param latency: The mean time, in seconds, before the simulator answers
+    :param jitter: The latency is uniformly distributed in latency +/- jitter
+    :param error_ratio: The proportion of requests that are declined
+    :param acquirer_error_codes: The acqErrorCode of a declined charge is picked among these (none if empty)
+    :param webhook_url: If set, a notification is sent to this url for each charge
+    """
+    return SimulatorBehavior(latency=latency, jitter=jitter, error_ratio=error_ratio,
+                             acquirer_error_codes=tuple(acquirer_error_codes), webhook_url=webhook_url)
+
+
+class DatatransSimulator:
+    def __init__(self, behavior: SimulatorBehavior, host: str = 'localhost', port: int = 8765,
+                 seed: Optional[int] = None) -> None:
+        self.behavior = behavior
+        self.server = _ThreadingHTTPServer((host, port), _Handler)
+        self.server.simulator = self  # type: ignore
+        self._random = random.Random(seed)
+        self._transaction_ids = count(int(datetime.now().strftime('%y%m%d%H%M%S')) * 1000000)
+        self._notifier = ThreadPoolExecutor(max_workers=4)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.socket.getsockname()[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def start(self) -> None:
+        """ Serves from a background thread. """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self._notifier.shutdown(wait=True)
+
+    def respond(self, path: str, request_xml: bytes) -> Optional[bytes]:
+        behavior = self.behavior
+        delay = behavior.latency + self._random.uniform(-behavior.jitter, behavior.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        declined = self._random.random() < behavior.error_ratio
+        if path.endswith('XML_authorize.jsp'):
+            return self.authorize(fromstring(request_xml), declined)
+        if path.endswith('XML_processor.jsp'):
+            return self.process(fromstring(request_xml), declined)
+        return None
+
+    def authorize(self, root: Any, declined: bool) -> bytes:
+        body = root.find('body')
+        transaction = body.find('transaction')
+        request = transaction.find('request')
+        transaction_id = str(next(self._transaction_ids))
+
+        response_root, response_transaction = _response_skeleton('authorizationService', '3', root, declined)
+        if declined:
+            error = SubElement(response_transaction, 'error')
+            SubElement(error, 'errorCode').text = '1403'
+            SubElement(error, 'errorMessage').text = 'declined'
+            SubElement(error, 'errorDetail').text = 'Declined'
+            SubElement(error, 'uppTransactionId').text = transaction_id
+            if self.behavior.acquirer_error_codes:
+                SubElement(error, 'acqErrorCode').text = self._random.choice(self.behavior.acquirer_error_codes)
+            SubElement(error, 'returnCustomerCountry').text = 'CHE'
+        else:
+            response = SubElement(response_transaction, 'response')
+            SubElement(response, 'responseCode').text = '01'
+            SubElement(response, 'responseMessage').text = 'Authorized'
+            SubElement(response, 'uppTransactionId').text = transaction_id
+            SubElement(response, 'authorizationCode').text = transaction_id[-9:]
+            SubElement(response, 'acqAuthorizationCode').text = transaction_id[-6:]
+            SubElement(response, 'maskedCC').text = '424242xxxxxx4242'
+            SubElement(response, 'returnCustomerCountry').text = 'CHE'
+
+        if self.behavior.webhook_url:
+            notification = build_notification_xml(
+                merchant_id=body.get('merchantId'), client_ref=transaction.get('refno'),
+                transaction_id=transaction_id, amount=request.find('amount').text,
+                currency=request.find('currency').text, declined=declined)
+            self._notifier.submit(self.send_notification, notification)
+
+        return tostring(response_root, encoding='utf8')
+
+    def process(self, root: Any, declined: bool) -> bytes:
+        response_root, response_transaction = _response_skeleton('paymentService', '1', root, declined)
+        SubElement(response_transaction.find('request'), 'reqtype').text = 'COA'
+        if declined:
+            error = SubElement(response_transaction, 'error')
+            SubElement(error, 'errorCode').text = '1403'
+            SubElement(error, 'errorMessage').text = 'declined'
+            SubElement(error, 'errorDetail').text = 'Declined'
+        else:
+            transaction_id = str(next(self._transaction_ids))
+            response = SubElement(response_transaction, 'response')
+            SubElement(response, 'responseCode').text = '01'
+            SubElement(response, 'responseMessage').text = 'credit succeeded'
+            SubElement(response, 'uppTransactionId').text = transaction_id
+            SubElement(response, 'authorizationCode').text = transaction_id[-9:]
+            SubElement(response, 'acqAuthorizationCode').text = transaction_id[-6:]
+        return tostring(response_root, encoding='utf8')
+
+    def send_notification(self, xml: bytes) -> None:
+        try:
+            requests.post(self.behavior.webhook_url, headers={'Content-Type': 'text/xml'}, data=xml, timeout=10)
+        except requests.RequestException as e:
+            logger.warning('simulator-notification-failed', url=self.behavior.webhook_url, error=repr(e))
+
+
+def _response_skeleton(service: str, version: str, request_root: Any, declined: bool):
+    """ The response echoes the merchant, the reference, and the request. """
+    request_body = request_root.find('body')
+    request_transaction = request_body.find('transaction')
+
+    root = Element(service)
+    root.set('version', version)
+    body = SubElement(root, 'body')
+    body.set('merchantId', request_body.get('merchantId'))
+    body.set('status', 'accepted')
+    transaction = SubElement(body, 'transaction')
+    transaction.set('refno', request_transaction.get('refno'))
+    transaction.set('trxStatus', 'error' if declined else 'response')
+    transaction.append(request_transaction.find('request'))
+    return root, transaction
+
+
+def build_notification_xml(merchant_id: str, client_ref: str, transaction_id: str, amount: str, currency: str,
+                           declined: bool) -> bytes:
+    root = Element('uppTransactionService')
+    root.set('version', '1')
+    body = SubElement(root, 'body')
+    body.set('merchantId', merchant_id)
+    body.set('testOnly', 'yes')
+    transaction = SubElement(body, 'transaction')
+    transaction.set('refno', client_ref)
+    transaction.set('status', 'error' if declined else 'success')
+    SubElement(transaction, 'uppTransactionId').text = transaction_id
+    SubElement(transaction, 'amount').text = amount
+    SubElement(transaction, 'currency').text = currency
+    SubElement(transaction, 'pmethod').text = 'VIS'
+    SubElement(transaction, 'reqtype').text = 'CAA'
+    parameters = Element('userParameters')
+    if declined:
+        error = SubElement(transaction, 'error')
+        SubElement(error, 'errorCode').text = '1403'
+        SubElement(error, 'errorMessage').text = 'declined'
+        SubElement(error, 'errorDetail').text = 'Declined'
+    else:
+        success = SubElement(transaction, 'success')
+        SubElement(success, 'authorizationCode').text = transaction_id[-9:]
+        SubElement(success, 'acqAuthorizationCode').text = transaction_id[-6:]
+        SubElement(success, 'responseMessage').text = 'Authorized'
+        SubElement(success, 'responseCode').text = '01'
+        sign2 = config.merchant(merchant_id).sign(merchant_id, amount, currency, transaction_id)
+        SubElement(parameters, 'parameter', name='sign2').text = sign2
+    SubElement(parameters, 'parameter', name='cardno').text = '424242xxxxxx4242'
+    transaction.append(parameters)
+    return tostring(root, encoding='utf8')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # So that clients can keep their connections alive.
+
+    def do_POST(self):
+        request_xml = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            response_xml = self.server.simulator.respond(self.path, request_xml)  # type: ignore
+        except Exception as e:
+            logger.warning('simulator-bad-request', path=self.path, error=repr(e))
+            self.send_error(400)
+            return
+        if response_xml is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(response_xml)))
+        self.end_headers()
+        self.wfile.write(response_xml)
+
+    def log_message(self, format, *args):
+        pass
@@ -1,7 +1,8 @@
 from django.urls import path
 
-from .views import webhook
+from .views import metrics, webhook
 
 urlpatterns = [
     path(r'webhook', webhook.webhook_handler, name='datatrans_webhook'),
+    path(r'metrics', metrics.metrics_view, name='datatrans_metrics'),
 ]
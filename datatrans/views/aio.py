@@ -0,0 +1,32 @@
+"""
+Asynchronous version of the webhook, for projects served by ASGI (requires django 3.1 or over).
+
+To use it, route the datatrans callback to this view instead of the one in datatrans.urls:
+
+    path('datatrans/webhook', datatrans.views.aio.webhook_handler, name='datatrans_webhook'),
+"""
+import structlog
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed
+
+from ..body_logging import log_body
+from ..config import config
+from ..gateway.aio import handle_notification
+from ..gateway.inbox import enqueue_notification
+
+logger = structlog.get_logger()
+
+
+async def webhook_handler(request: HttpRequest) -> HttpResponse:
+    # The view decorators of django < 5 don't support coroutines, so the method is checked by hand.
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    logger.info('datatrans-webhook', body=log_body('datatrans-webhook', request.body))
+    if config.webhook_mode == 'inbox':
+        await sync_to_async(enqueue_notification)(request.body)
+    else:
+        await handle_notification(request.body)
+    return HttpResponse()  # If we were able to digest the notification (be it a success or an error), we are happy.
+
+
+webhook_handler.csrf_exempt = True  # type: ignore
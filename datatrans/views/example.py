@@ -9,7 +9,7 @@ from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 from djmoney.forms import MoneyField
 
-from ..config import datatrans_js_url
+from ..config import config
 from ..gateway import build_payment_parameters, build_register_credit_card_parameters
 from ..models import CLIENT_REF_FIELD_SIZE
 
@@ -34,7 +34,7 @@ def pay(request: HttpRequest) -> HttpResponse:
             )
             context = {
                 'title': 'Pay {}'.format(amount),
-                'datatrans_js_url': datatrans_js_url,
+                'datatrans_js_url': config.merchant(parameters.merchant_id).js_url,
             }
             context.update(parameters._asdict())
 
@@ -65,7 +65,7 @@ def register_credit_card(request: HttpRequest) -> HttpResponse:
             parameters = build_register_credit_card_parameters(client_ref=form.cleaned_data['client_ref'])
             context = {
                 'title': 'Register credit card',
-                'datatrans_js_url': datatrans_js_url,
+                'datatrans_js_url': config.merchant(parameters.merchant_id).js_url,
             }
             context.update(parameters._asdict())
 
@@ -0,0 +1,14 @@
+from django.http import Http404, HttpRequest, HttpResponse
+
+from .. import metrics
+from ..config import config
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    The metrics of this process, for prometheus to scrape. Only available with DATATRANS['METRICS_VIEW'] set,
+    the url should then be protected (for instance by the reverse proxy).
+    """
+    if not config.metrics_view_enabled:
+        raise Http404()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -3,7 +3,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 import structlog
 
-from ..gateway import handle_notification
+from .. import gateway
+from ..body_logging import log_body
+from ..config import config
 
 logger = structlog.get_logger()
 
@@ -11,6 +13,9 @@ logger = structlog.get_logger()
 @require_POST
 @csrf_exempt
 def webhook_handler(request: HttpRequest) -> HttpResponse:
-    logger.info('datatrans-webhook', body=request.body)
-    handle_notification(request.body)
+    logger.info('datatrans-webhook', body=log_body('datatrans-webhook', request.body))
+    if config.webhook_mode == 'inbox':
+        gateway.enqueue_notification(request.body)
+    else:
+        gateway.handle_notification(request.body)
     return HttpResponse()  # If we were able to digest the notification (be it a success or an error), we are happy.
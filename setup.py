@@ -16,6 +16,8 @@ setup(
         'datatrans',
         'datatrans.gateway',
         'datatrans.views',
+        'datatrans.management',
+        'datatrans.management.commands',
         'datatrans.migrations',
     ],
     package_data={'datatrans': [
@@ -29,6 +31,10 @@ setup(
         'defusedxml',
         'structlog',
     ],
+    extras_require={
+        'async': ['httpx'],
+        'lxml': ['lxml'],
+    },
     license=datatrans.__licence__,
     classifiers=[
         'Development Status :: 5 - Production/Stable',
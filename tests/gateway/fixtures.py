@@ -0,0 +1,43 @@
+"""
+Documents of datatrans shared by the tests and the benchmarks.
+"""
+
+# A successful alias registration notification, signed with the web key of the test settings.
+ALIAS_REGISTRATION_NOTIFICATION = """<?xml version="1.0" encoding="UTF-8"?>
+<uppTransactionService version="1">
+  <body merchantId="1111111111" testOnly="yes">
+    <transaction refno="b0ca4cf0-7955-4eb3-978b-936194c8fe23" status="success">
+      <uppTransactionId>{transaction_id}</uppTransactionId>
+      <amount>0</amount>
+      <currency>CHF</currency>
+      <pmethod>VIS</pmethod>
+      <reqtype>CAA</reqtype>
+      <success>
+        <authorizationCode>953988933</authorizationCode>
+        <acqAuthorizationCode>111953</acqAuthorizationCode>
+        <responseMessage>check successful</responseMessage>
+        <responseCode>01</responseCode>
+      </success>
+      <userParameters>
+        <parameter name="maskedCC">424242xxxxxx4242</parameter>
+        <parameter name="sign">redacted</parameter>
+        <parameter name="aliasCC">70119122433810042</parameter>
+        <parameter name="responseCode">01</parameter>
+        <parameter name="mode">lightbox</parameter>
+        <parameter name="sign2">{sign2}</parameter>
+        <parameter name="expy">18</parameter>
+        <parameter name="returnCustomerCountry">CHE</parameter>
+        <parameter name="theme">DT2015</parameter>
+        <parameter name="uppReturnTarget">_top</parameter>
+        <parameter name="expm">12</parameter>
+        <parameter name="version">1.0.2</parameter>
+        <parameter name="cardno">424242xxxxxx4242</parameter>
+        <parameter name="useAlias">true</parameter>
+      </userParameters>
+    </transaction>
+  </body>
+</uppTransactionService>"""
+
+NOTIFICATION = ALIAS_REGISTRATION_NOTIFICATION.format(
+    transaction_id='170707111922838874',
+    sign2='6b8f6adfe37bf8ab331e7576563395647c59350270b4d38b60aa4903f9018030')
@@ -0,0 +1,158 @@
+import sys
+from unittest import mock
+
+import django
+import pytest
+
+# The async gateway needs python 3.7, async views need django 3.1, and the calls to datatrans go through httpx.
+if sys.version_info < (3, 7) or django.VERSION < (3, 1):
+    pytest.skip('The async gateway requires python 3.7 and django 3.1', allow_module_level=True)
+httpx = pytest.importorskip('httpx')
+
+from asgiref.sync import async_to_sync  # noqa: E402
+from django.test import Client, TestCase, override_settings  # noqa: E402
+from django.urls import path  # noqa: E402
+from moneyed import Money  # noqa: E402
+
+from datatrans.config import config  # noqa: E402
+from datatrans.gateway import aio  # noqa: E402
+from datatrans.models import AliasRegistration, InboxNotification, Payment, Refund  # noqa: E402
+from datatrans.views.aio import webhook_handler  # noqa: E402
+from .fixtures import NOTIFICATION  # noqa: E402
+
+urlpatterns = [
+    path('webhook', webhook_handler, name='datatrans_webhook'),
+]
+
+PAY_WITH_ALIAS_RESPONSE = b"""<?xml version='1.0' encoding='utf8'?>
+<authorizationService version='3'>
+  <body merchantId='2222222222' status='accepted'>
+    <transaction refno='1234' trxStatus='response'>
+      <request>
+        <amount>1000</amount>
+        <currency>CHF</currency>
+        <aliasCC>70119122433810042</aliasCC>
+        <expm>12</expm>
+        <expy>18</expy>
+        <reqtype>CAA</reqtype>
+        <sign>redacted</sign>
+      </request>
+      <response>
+        <responseCode>01</responseCode>
+        <responseMessage>Authorized</responseMessage>
+        <uppTransactionId>170717104749732144</uppTransactionId>
+        <authorizationCode>749762145</authorizationCode>
+        <acqAuthorizationCode>104749</acqAuthorizationCode>
+        <maskedCC>424242xxxxxx4242</maskedCC>
+        <returnCustomerCountry>CHE</returnCustomerCountry>
+      </response>
+    </transaction>
+  </body>
+</authorizationService>"""
+
+REFUND_RESPONSE = b"""<?xml version='1.0' encoding='utf8'?>
+<paymentService version='1'>
+  <body merchantId='2222222222' status='accepted'>
+    <transaction refno='1234-r' trxStatus='response'>
+      <request>
+        <amount>500</amount>
+        <currency>CHF</currency>
+        <uppTransactionId>170717104749732144</uppTransactionId>
+        <transtype>06</transtype>
+        <sign>redacted</sign>
+        <reqtype>COA</reqtype>
+      </request>
+      <response>
+        <responseCode>01</responseCode>
+        <responseMessage>credit succeeded</responseMessage>
+        <uppTransactionId>171015120225118036</uppTransactionId>
+        <authorizationCode>225128037</authorizationCode>
+        <acqAuthorizationCode>120225</acqAuthorizationCode>
+      </response>
+    </transaction>
+  </body>
+</paymentService>"""
+
+
+def mock_datatrans(content: bytes):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, content=content)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return mock.patch.object(aio, 'get_client', return_value=client), requests
+
+
+class AsyncGatewayTest(TestCase):
+    def test_pay_with_alias(self):
+        alias_registration = AliasRegistration.objects.create(
+            success=True,
+            transaction_id='170707111922838874',
+            merchant_id='1111111111',
+            request_type='CAA',
+            masked_card_number='424242xxxxxx4242',
+            card_alias='70119122433810042',
+            expiry_month=12,
+            expiry_year=18,
+            client_ref='1234',
+            amount=Money(0, 'CHF'),
+            payment_method='VIS',
+        )
+        patch, requests = mock_datatrans(PAY_WITH_ALIAS_RESPONSE)
+        with patch:
+            payment = async_to_sync(aio.pay_with_alias)(Money(10, 'CHF'), alias_registration.pk, '1234')
+
+        assert len(requests) == 1
+        assert b'<aliasCC>70119122433810042</aliasCC>' in requests[0].content
+        assert payment.success
+        assert Payment.objects.get(transaction_id='170717104749732144').pk == payment.pk
+
+    def test_refund(self):
+        payment = Payment.objects.create(
+            success=True,
+            transaction_id='170717104749732144',
+            merchant_id='2222222222',
+            client_ref='1234',
+            amount=Money(10, 'CHF'),
+        )
+        patch, requests = mock_datatrans(REFUND_RESPONSE)
+        with patch:
+            refund = async_to_sync(aio.refund)(Money(5, 'CHF'), payment.pk)
+
+        assert b'<uppTransactionId>170717104749732144</uppTransactionId>' in requests[0].content
+        assert refund.success
+        assert Refund.objects.get(transaction_id='171015120225118036').amount == Money(5, 'CHF')
+
+    def test_refund_validation(self):
+        payment = Payment.objects.create(
+            success=True,
+            transaction_id='170717104749732144',
+            merchant_id='2222222222',
+            client_ref='1234',
+            amount=Money(10, 'CHF'),
+        )
+        with self.assertRaises(ValueError):
+            async_to_sync(aio.refund)(Money(11, 'CHF'), payment.pk)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncWebhookViewTest(TestCase):
+    def test_it_should_process_a_webhook(self):
+        response = Client().post('/webhook', content_type='text/xml', data=NOTIFICATION)
+
+        assert response.status_code == 200
+        assert AliasRegistration.objects.filter(transaction_id='170707111922838874').exists()
+
+    def test_it_should_only_store_the_notification_in_inbox_mode(self):
+        with mock.patch.object(config, 'webhook_mode', 'inbox'):
+            response = Client().post('/webhook', content_type='text/xml', data=NOTIFICATION)
+
+        assert response.status_code == 200
+        assert InboxNotification.objects.count() == 1
+        assert not AliasRegistration.objects.exists()
+
+    def test_it_should_only_accept_post(self):
+        response = Client().get('/webhook')
+        assert response.status_code == 405
@@ -0,0 +1,140 @@
+import time
+import uuid
+from datetime import date
+from unittest import mock
+
+from django.test import TransactionTestCase
+from moneyed import Money
+
+from datatrans.gateway import PayWithAliasItem, bulk_charging, pay_with_alias_many
+from datatrans.models import AliasRegistration, Payment
+from datatrans.signals import payment_with_alias_done
+
+
+def charge(amount, client_ref, alias_registration):
+    return Payment(
+        success=True,
+        transaction_id=client_ref.rjust(18, '0'),
+        merchant_id='2222222222',
+        request_type='CAA',
+        masked_card_number=alias_registration.masked_card_number,
+        card_alias=alias_registration.card_alias,
+        expiry_month=alias_registration.expiry_month,
+        expiry_year=alias_registration.expiry_year,
+        client_ref=client_ref,
+        amount=amount,
+        response_code='01',
+        response_message='Authorized',
+    )
+
+
+class PayWithAliasManyTest(TransactionTestCase):
+    def setUp(self):
+        self.alias_registration = AliasRegistration.objects.create(
+            success=True,
+            transaction_id='170707111922838874',
+            merchant_id='1111111111',
+            request_type='CAA',
+            masked_card_number='424242xxxxxx4242',
+            card_alias='70119122433810042',
+            expiry_month=12,
+            expiry_year=18,
+            client_ref='1234',
+            amount=Money(0, 'CHF'),
+            payment_method='VIS',
+        )
+
+    def test_it_should_charge_and_save_all_items(self):
+        items = [PayWithAliasItem(Money(10, 'CHF'), self.alias_registration.pk, str(i)) for i in range(25)]
+        handler = mock.Mock()
+        payment_with_alias_done.connect(handler)
+        try:
+            with mock.patch('datatrans.gateway.bulk_charging.send_pay_with_alias_request', side_effect=charge):
+                results = list(pay_with_alias_many(items, max_workers=4, max_in_flight=5, batch_size=10))
+        finally:
+            payment_with_alias_done.disconnect(handler)
+
+        assert len(results) == 25
+        assert all(result.error is None for result in results)
+        assert {result.item for result in results} == set(items)
+        assert Payment.objects.count() == 25
+        assert Payment.objects.filter(expiry_date=date(2018, 12, 31)).count() == 25
+        assert handler.call_count == 25
+
+    def test_it_should_keep_errors_separate(self):
+        items = [
+            (Money(10, 'CHF'), str(self.alias_registration.pk), 'ok'),
+            (Money(0, 'CHF'), str(self.alias_registration.pk), 'zero'),
+            (Money(10, 'CHF'), str(uuid.uuid4()), 'unknown'),
+            (Money(10, 'CHF'), 'not-a-uuid', 'invalid'),
+            (Money(10, 'CHF'), str(self.alias_registration.pk), 'network'),
+        ]
+
+        def charge_or_fail(amount, client_ref, alias_registration):
+            if client_ref == 'network':
+                raise ConnectionError('datatrans is unreachable')
+            return charge(amount, client_ref, alias_registration)
+
+        with mock.patch('datatrans.gateway.bulk_charging.send_pay_with_alias_request', side_effect=charge_or_fail):
+            results = {result.item.client_ref: result for result in pay_with_alias_many(items)}
+
+        assert results['ok'].error is None
+        assert results['ok'].payment.client_ref == 'ok'
+        assert isinstance(results['zero'].error, ValueError)
+        assert isinstance(results['unknown'].error, AliasRegistration.DoesNotExist)
+        assert isinstance(results['invalid'].error, AliasRegistration.DoesNotExist)
+        assert isinstance(results['network'].error, ConnectionError)
+        assert Payment.objects.count() == 1
+
+    def test_charges_are_saved_when_the_caller_stops_iterating(self):
+        items = [PayWithAliasItem(Money(10, 'CHF'), self.alias_registration.pk, str(i)) for i in range(50)]
+
+        def slow_charge(amount, client_ref, alias_registration):
+            time.sleep(0.01)
+            return charge(amount, client_ref, alias_registration)
+
+        send = mock.Mock(side_effect=slow_charge)
+        with mock.patch('datatrans.gateway.bulk_charging.send_pay_with_alias_request', send), \
+                mock.patch.object(bulk_charging, 'logger') as logger:
+            results = pay_with_alias_many(items, max_workers=4, batch_size=10)
+            next(results)
+            results.close()
+
+        assert send.call_count > 10
+        assert Payment.objects.count() == send.call_count
+        # The batch whose results were being returned is not saved a second time.
+        logger.error.assert_not_called()
+        assert 'pay-with-alias-many-batch-save-failed' not in [c[0][0] for c in logger.warning.call_args_list]
+
+    def test_a_failing_receiver_does_not_save_the_payments_again(self):
+        items = [PayWithAliasItem(Money(10, 'CHF'), self.alias_registration.pk, str(i)) for i in range(5)]
+
+        def handler(sender, instance, **kwargs):
+            if instance.client_ref == '2':
+                raise ValueError('receiver failed')
+
+        received = mock.Mock(side_effect=handler)
+        payment_with_alias_done.connect(received)
+        try:
+            with mock.patch('datatrans.gateway.bulk_charging.send_pay_with_alias_request', side_effect=charge), \
+                    mock.patch.object(bulk_charging, 'logger') as logger:
+                results = {result.item.client_ref: result for result in pay_with_alias_many(items, batch_size=10)}
+        finally:
+            payment_with_alias_done.disconnect(received)
+
+        assert isinstance(results['2'].error, ValueError)
+        assert results['2'].payment.client_ref == '2'
+        assert all(results[str(i)].error is None for i in (0, 1, 3, 4))
+        assert received.call_count == 5
+        assert Payment.objects.count() == 5
+        assert [c[0][0] for c in logger.error.call_args_list] == ['pay-with-alias-many-signal-failed']
+
+    def test_one_bad_row_does_not_fail_its_batch(self):
+        charge(Money(10, 'CHF'), '3', self.alias_registration).save()
+        items = [PayWithAliasItem(Money(10, 'CHF'), self.alias_registration.pk, str(i)) for i in range(5)]
+        with mock.patch('datatrans.gateway.bulk_charging.send_pay_with_alias_request', side_effect=charge):
+            results = {result.item.client_ref: result for result in pay_with_alias_many(items, batch_size=10)}
+
+        assert results['3'].error is not None
+        assert all(results[str(i)].error is None for i in (0, 1, 2, 4))
+        assert Payment.objects.count() == 5
@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from datatrans.gateway.deduplication import Deduplicator
+from datatrans.gateway.notification import deduplicator, handle_notification, parse_notification_xml
+from datatrans.models import AliasRegistration
+from datatrans.signals import alias_registration_done
+from .fixtures import NOTIFICATION
+
+
+class DeduplicationTest(TestCase):
+    def test_retried_webhook_is_acknowledged_and_ignored(self):
+        duplicates = deduplicator.duplicates
+        handler = mock.Mock()
+        alias_registration_done.connect(handler)
+        try:
+            for _ in range(3):
+                response = Client().post(reverse('datatrans_webhook'), content_type='text/xml', data=NOTIFICATION)
+                assert response.status_code == 200
+        finally:
+            alias_registration_done.disconnect(handler)
+
+        assert AliasRegistration.objects.count() == 1
+        assert handler.call_count == 1
+        assert deduplicator.duplicates == duplicates + 2
+
+
+class DeduplicatorTest(TransactionTestCase):
+    def test_committed_notifications_are_remembered(self):
+        d = Deduplicator(max_size=1)
+        notification = parse_notification_xml(NOTIFICATION)
+        assert not d.is_duplicate(notification)
+        d.remember(notification)
+
+        with mock.patch.object(AliasRegistration.objects, 'filter') as query:
+            assert d.is_duplicate(notification)
+            query.assert_not_called()
+        assert d.duplicates == 1
+
+    def test_rolled_back_notifications_are_forgotten(self):
+        d = Deduplicator(max_size=10)
+        notification = parse_notification_xml(NOTIFICATION)
+        with transaction.atomic():
+            d.remember(notification)
+            transaction.set_rollback(True)
+        assert not d.is_duplicate(notification)
+
+    def test_oldest_notifications_are_evicted(self):
+        d = Deduplicator(max_size=1)
+        first = parse_notification_xml(NOTIFICATION)
+        second = parse_notification_xml(NOTIFICATION)
+        second.transaction_id = '170707111922838875'
+        d.remember(first)
+        d.remember(second)
+        assert not d.is_duplicate(first)
+        assert d.is_duplicate(second)
+
+    def test_handle_notification_twice(self):
+        d = Deduplicator(max_size=10)
+        with mock.patch('datatrans.gateway.notification.deduplicator', d):
+            handle_notification(NOTIFICATION)
+            handle_notification(NOTIFICATION)
+        assert AliasRegistration.objects.count() == 1
+        assert d.duplicates == 1
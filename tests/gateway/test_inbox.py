@@ -0,0 +1,79 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from datatrans.config import config
+from datatrans.gateway import enqueue_notification, process_inbox
+from datatrans.models import AliasRegistration, InboxNotification
+from datatrans.signals import alias_registration_done
+from .fixtures import NOTIFICATION
+
+
+class InboxTest(TestCase):
+    def test_enqueue_verifies_the_signature(self):
+        with self.assertRaises(ValueError):
+            enqueue_notification(NOTIFICATION.replace('6b8f6adfe37bf8ab', 'somethingelse'))
+        assert not InboxNotification.objects.exists()
+
+    def test_process_inbox(self):
+        enqueue_notification(NOTIFICATION.encode('utf-8'))
+        InboxNotification.objects.create(body='<not xml')
+
+        assert process_inbox() == (1, 1)
+
+        assert AliasRegistration.objects.filter(transaction_id='170707111922838874').exists()
+        failed = InboxNotification.objects.get()
+        assert failed.attempts == 1
+        assert 'ParseError' in failed.last_error
+
+    def test_failed_notifications_are_retried_up_to_max_attempts(self):
+        InboxNotification.objects.create(body='<not xml')
+        assert process_inbox(max_attempts=2) == (0, 1)
+        assert process_inbox(max_attempts=2) == (0, 1)
+        assert process_inbox(max_attempts=2) == (0, 0)
+
+    def test_claimed_notifications_are_skipped(self):
+        enqueue_notification(NOTIFICATION)
+        InboxNotification.objects.update(claimed_until=timezone.now() + timedelta(minutes=1))
+        assert process_inbox() == (0, 0)
+        InboxNotification.objects.update(claimed_until=timezone.now() - timedelta(minutes=1))
+        assert process_inbox() == (1, 0)
+
+    def test_command(self):
+        enqueue_notification(NOTIFICATION)
+        out = StringIO()
+        call_command('datatrans_process_inbox', '--batch-size=10', stdout=out)
+        assert 'Processed 1 notifications, 0 failed' in out.getvalue()
+        assert not InboxNotification.objects.exists()
+
+
+class InboxTransactionTest(TransactionTestCase):
+    def test_signals_are_sent_once_the_notification_is_committed(self):
+        enqueue_notification(NOTIFICATION)
+
+        def handler(sender, instance, **kwargs):
+            assert not transaction.get_connection().in_atomic_block
+
+        received = mock.Mock(side_effect=handler)
+        alias_registration_done.connect(received)
+        try:
+            assert process_inbox() == (1, 0)
+        finally:
+            alias_registration_done.disconnect(received)
+        received.assert_called_once()
+
+
+class InboxWebhookViewTest(TestCase):
+    def test_it_should_only_store_the_notification(self):
+        with mock.patch.object(config, 'webhook_mode', 'inbox'):
+            response = Client().post(reverse('datatrans_webhook'), content_type='text/xml', data=NOTIFICATION)
+
+        assert response.status_code == 200
+        assert InboxNotification.objects.count() == 1
+        assert not AliasRegistration.objects.exists()
@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.test import TestCase
+from moneyed import Money
+
+from datatrans.gateway.deduplication import Deduplicator
+from datatrans.gateway.notification import parse_notification_record, parse_notification_xml, record_notification
+from datatrans.gateway.records import (AuthorizeResponseRecord, NotificationRecord, RefundResponseRecord,
+                                       TransactionRecord)
+from datatrans.models import AliasRegistration, Payment, Refund
+from .assertions import assertModelEqual
+from .fixtures import NOTIFICATION
+
+
+class RecordTest(TestCase):
+    def test_notification_record(self):
+        record = parse_notification_record(NOTIFICATION)
+        assert isinstance(record, NotificationRecord)
+        assert record.is_alias_registration
+        assert record.model is AliasRegistration
+        assert record.transaction_id == '170707111922838874'
+        assert record.amount == Money(0, 'CHF')
+        assert record.card_alias == '70119122433810042'
+        assert not hasattr(record, '__dict__')
+
+    def test_to_model(self):
+        model = parse_notification_record(NOTIFICATION).to_model()
+        assert isinstance(model, AliasRegistration)
+        assert model._state.adding
+        assertModelEqual(parse_notification_xml(NOTIFICATION), model)
+
+    def test_missing_fields_are_left_to_the_model_defaults(self):
+        record = AuthorizeResponseRecord(success=False, error_code='1403', amount=Money(1, 'CHF'))
+        assert record.as_dict() == dict(success=False, error_code='1403', amount=Money(1, 'CHF'))
+        payment = record.to_model()
+        assert isinstance(payment, Payment)
+        assert payment.masked_card_number == ''
+        assert payment.error_message == ''
+
+    def test_refund_record(self):
+        refund = RefundResponseRecord(success=True, payment_transaction_id='170803184046388845').to_model()
+        assert isinstance(refund, Refund)
+        assert refund.payment_transaction_id == '170803184046388845'
+
+    def test_unexpected_fields_are_refused(self):
+        with self.assertRaisesRegex(TypeError, 'payment_transaction_id'):
+            AuthorizeResponseRecord(payment_transaction_id='170803184046388845')
+
+    def test_records_name_their_model(self):
+        with self.assertRaisesRegex(TypeError, 'abstract'):
+            TransactionRecord(success=True)
+
+    def test_equality(self):
+        assert parse_notification_record(NOTIFICATION) == parse_notification_record(NOTIFICATION)
+        assert NotificationRecord(transaction_id='1') != NotificationRecord(transaction_id='1',
+                                                                            is_alias_registration=True)
+        assert NotificationRecord(transaction_id='1') != AuthorizeResponseRecord(transaction_id='1')
+
+    def test_duplicates_are_not_instantiated(self):
+        d = Deduplicator(max_size=10)
+        with mock.patch('datatrans.gateway.notification.deduplicator', d):
+            assert record_notification(parse_notification_record(NOTIFICATION))
+            with mock.patch.object(NotificationRecord, 'to_model') as to_model:
+                assert not record_notification(parse_notification_record(NOTIFICATION))
+            to_model.assert_not_called()
+        assert AliasRegistration.objects.count() == 1
@@ -1,27 +1,14 @@
+from unittest import mock
+
 from django.test import TestCase
 from moneyed import Money
 
-from datatrans.gateway.refunding import build_refund_request_xml, parse_refund_response_xml
-from datatrans.models import Refund
+from datatrans.gateway.refunding import (build_refund_request_xml, parse_refund_response_xml,
+                                         prepare_refund_request_xml, refund, reserve_refund)
+from datatrans.models import Payment, Refund
 from .assertions import assertModelEqual
 
-
-class BuildRefundRequestTest(TestCase):
-    def test_build_request(self):
-        xml = build_refund_request_xml(
-            amount=Money(123, "CHF"),
-            client_ref='abcdef',
-            original_transaction_id='12345',
-            merchant_id='1234567'
-        )
-        expected = """<?xml version='1.0' encoding='utf8'?>
-<paymentService version="1"><body merchantId="1234567"><transaction refno="abcdef"><request><amount>12300</amount><currency>CHF</currency><uppTransactionId>12345</uppTransactionId><transtype>06</transtype><sign>cae361426f625bbe03a9ef0ef3c4daf27a7e16547191ec7b704cb1337d43fe22</sign></request></transaction></body></paymentService>"""  # noqa
-        assert xml.decode() == expected
-
-
-class ParseRefundResponseTest(TestCase):
-    def test_success(self):
-        response = """<?xml version='1.0' encoding='utf8'?>
+REFUND_RESPONSE = """<?xml version='1.0' encoding='utf8'?>
 <paymentService version='1'>
   <body merchantId='1111111111' status='accepted'>
     <transaction refno='nico-r' trxStatus='response'>
@@ -43,6 +30,71 @@ class ParseRefundResponseTest(TestCase):
     </transaction>
   </body>
 </paymentService>"""
+
+
+class BuildRefundRequestTest(TestCase):
+    def test_build_request(self):
+        xml = build_refund_request_xml(
+            amount=Money(123, "CHF"),
+            client_ref='abcdef',
+            original_transaction_id='12345',
+            merchant_id='1234567'
+        )
+        expected = """<?xml version='1.0' encoding='utf8'?>
+<paymentService version="1"><body merchantId="1234567"><transaction refno="abcdef"><request><amount>12300</amount><currency>CHF</currency><uppTransactionId>12345</uppTransactionId><transtype>06</transtype><sign>cae361426f625bbe03a9ef0ef3c4daf27a7e16547191ec7b704cb1337d43fe22</sign></request></transaction></body></paymentService>"""  # noqa
+        assert xml.decode() == expected
+
+
+class PrepareRefundRequestTest(TestCase):
+    def test_previous_refunds_are_deducted(self):
+        payment = Payment(
+            success=True,
+            transaction_id='170803184046388845',
+            merchant_id='1111111111',
+            client_ref='1234',
+            amount=Money(10, 'CHF'),
+            refunded_total=7,
+        )
+        assert prepare_refund_request_xml(Money(3, 'CHF'), payment)
+        with self.assertRaisesMessage(ValueError, 'not yet refunded'):
+            prepare_refund_request_xml(Money(4, 'CHF'), payment)
+
+
+class RefundTest(TestCase):
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            success=True,
+            transaction_id='170803184046388845',
+            merchant_id='1111111111',
+            client_ref='nico',
+            amount=Money(10, 'CHF'),
+        )
+
+    def test_success(self):
+        with mock.patch('datatrans.gateway.refunding.post_xml') as post_xml:
+            post_xml.return_value.content = REFUND_RESPONSE
+            assert refund(Money(1, 'CHF'), self.payment.pk).success
+        self.payment.refresh_from_db()
+        assert self.payment.refundable_amount == Money(9, 'CHF')
+
+    def test_concurrent_refunds_cannot_exceed_the_payment(self):
+        # Another refund of the payment is being sent: the check made on the payment that was read is not enough.
+        reserve_refund(Money(8, 'CHF'), self.payment)
+        with mock.patch('datatrans.gateway.refunding.post_xml') as post_xml:
+            with self.assertRaisesMessage(ValueError, 'not yet refunded'):
+                refund(Money(3, 'CHF'), self.payment.pk)
+        post_xml.assert_not_called()
+
+    def test_reservation_is_released_when_the_request_fails(self):
+        with mock.patch('datatrans.gateway.refunding.post_xml', side_effect=IOError):
+            with self.assertRaises(IOError):
+                refund(Money(3, 'CHF'), self.payment.pk)
+        self.payment.refresh_from_db()
+        assert self.payment.refundable_amount == Money(10, 'CHF')
+
+
+class ParseRefundResponseTest(TestCase):
+    def test_success(self):
         expected = Refund(
             success=True,
             transaction_id='171015120225118036',
@@ -56,7 +108,7 @@ class ParseRefundResponseTest(TestCase):
             authorization_code='225128037',
             acquirer_authorization_code='120225',
         )
-        assertModelEqual(expected, parse_refund_response_xml(response))
+        assertModelEqual(expected, parse_refund_response_xml(REFUND_RESPONSE))
 
     def test_incorrect_merchant_id(self):
         response = """<?xml version='1.0' encoding='utf8'?>
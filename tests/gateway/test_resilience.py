@@ -0,0 +1,110 @@
+from unittest import mock
+
+import requests
+from django.test import TestCase
+
+from datatrans.gateway import CircuitOpenError, RateLimitError, get_outbound_state, resilience, transport
+from datatrans.gateway.resilience import CircuitBreaker, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(TestCase):
+    def test_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, max_wait=1, clock=clock)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0.5
+        assert bucket.reserve() == 1
+        with self.assertRaises(RateLimitError):
+            bucket.reserve()
+        clock.now = 10
+        assert bucket.tokens == 2
+
+
+class CircuitBreakerTest(TestCase):
+    def test_open_and_close(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        clock.now = 30
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()  # Only one trial at a time
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        clock.now = 60
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.consecutive_failures == 0
+
+    def test_abandoned_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.abandon_call()
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    def test_lost_trial_expires(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        clock.now = 30
+        breaker.before_call()  # The trial never reports its outcome.
+        clock.now = 59
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        clock.now = 60
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TransportResilienceTest(TestCase):
+    def setUp(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        patcher = mock.patch.object(resilience, 'circuit_breaker', breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failures_open_the_circuit(self):
+        url = 'https://api.sandbox.datatrans.com/upp/jsp/XML_authorize.jsp'
+        session = transport.get_session()
+        with mock.patch.object(session, 'post', side_effect=requests.ConnectTimeout()):
+            with self.assertRaises(requests.ConnectTimeout):
+                transport.post_xml(url, b'<xml/>')
+        with mock.patch.object(session, 'post', return_value=mock.Mock(status_code=503)):
+            transport.post_xml(url, b'<xml/>')
+        assert get_outbound_state() == {'circuit': 'open', 'consecutive_failures': 2}
+
+        with mock.patch.object(session, 'post') as post:
+            with self.assertRaises(CircuitOpenError):
+                transport.post_xml(url, b'<xml/>')
+            post.assert_not_called()
+
+    def test_interrupted_trial_is_abandoned(self):
+        url = 'https://api.sandbox.datatrans.com/upp/jsp/XML_authorize.jsp'
+        resilience.circuit_breaker.record_failure()
+        resilience.circuit_breaker.record_failure()
+        resilience.circuit_breaker.reset_timeout = 0
+        with mock.patch.object(transport.get_session(), 'post', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                transport.post_xml(url, b'<xml/>')
+        assert get_outbound_state()['circuit'] == 'open'
@@ -0,0 +1,31 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from datatrans.gateway import transport
+
+
+class TransportTest(TestCase):
+    def tearDown(self):
+        transport.close_session()
+
+    def test_session_is_shared(self):
+        assert transport.get_session() is transport.get_session()
+
+    def test_session_is_pooled(self):
+        adapter = transport.get_session().get_adapter('https://api.sandbox.datatrans.com/')
+        assert adapter._pool_maxsize == 10
+
+    def test_close_session(self):
+        session = transport.get_session()
+        transport.close_session()
+        assert transport.get_session() is not session
+
+    def test_post_xml(self):
+        with mock.patch.object(transport.get_session(), 'post', return_value=mock.Mock(status_code=200)) as post:
+            transport.post_xml('https://api.sandbox.datatrans.com/upp/jsp/XML_authorize.jsp', b'<xml/>')
+            post.assert_called_once_with(
+                url='https://api.sandbox.datatrans.com/upp/jsp/XML_authorize.jsp',
+                headers={'Content-Type': 'application/xml'},
+                data=b'<xml/>',
+                timeout=(5, 30))
@@ -0,0 +1,76 @@
+"""
+The parsing tests, run again with the lxml backend.
+"""
+from unittest import mock, skipUnless
+
+from defusedxml import DTDForbidden
+from django.test import TestCase
+
+from datatrans.gateway import xml_parsing
+from . import test_notification, test_payment_with_aliasl, test_refunding
+
+try:
+    import lxml  # noqa: F401
+    has_lxml = True
+except ImportError:
+    has_lxml = False
+
+BILLION_LAUGHS = b"""<?xml version="1.0"?>
+<!DOCTYPE lolz [<!ENTITY lol "lol"><!ENTITY lol2 "&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;">]>
+<lolz>&lol2;</lolz>"""
+
+EXTERNAL_ENTITY = b"""<?xml version="1.0"?>
+<!DOCTYPE foo [<!ENTITY xxe SYSTEM "file:///etc/passwd">]>
+<foo>&xxe;</foo>"""
+
+DOCTYPE_ONLY = b"""<?xml version="1.0"?>
+<!DOCTYPE foo SYSTEM "foo.dtd">
+<foo/>"""
+
+
+class LxmlBackendMixin:
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(xml_parsing, '_backend', xml_parsing.get_backend('lxml'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@skipUnless(has_lxml, 'lxml is not installed')
+class LxmlParseRegisterAliasTest(LxmlBackendMixin, test_notification.ParseRegisterAliasTest):
+    pass
+
+
+@skipUnless(has_lxml, 'lxml is not installed')
+class LxmlParsePaymentTest(LxmlBackendMixin, test_notification.ParsePaymentTest):
+    pass
+
+
+@skipUnless(has_lxml, 'lxml is not installed')
+class LxmlParsePayWithAliasResponseTest(LxmlBackendMixin, test_payment_with_aliasl.ParsePayWithAliasResponseTest):
+    pass
+
+
+@skipUnless(has_lxml, 'lxml is not installed')
+class LxmlParseRefundResponseTest(LxmlBackendMixin, test_refunding.ParseRefundResponseTest):
+    pass
+
+
+class BackendTest(TestCase):
+    def test_unknown_backend(self):
+        with self.assertRaisesMessage(ValueError, 'Unknown xml parser: sax'):
+            xml_parsing.get_backend('sax')
+
+    def test_defusedxml_refuses_dtds(self):
+        fromstring = xml_parsing.get_backend('defusedxml')
+        for xml in [BILLION_LAUGHS, EXTERNAL_ENTITY, DOCTYPE_ONLY]:
+            with self.assertRaises(DTDForbidden):
+                fromstring(xml)
+
+    @skipUnless(has_lxml, 'lxml is not installed')
+    def test_lxml_refuses_dtds(self):
+        fromstring = xml_parsing.get_backend('lxml')
+        for xml in [BILLION_LAUGHS, EXTERNAL_ENTITY, DOCTYPE_ONLY]:
+            with self.assertRaises(DTDForbidden):
+                fromstring(xml)
+        assert fromstring("<?xml version='1.0' encoding='utf8'?><a b='c'/>").get('b') == 'c'
@@ -0,0 +1,46 @@
+from django.test import TestCase
+
+from datatrans.gateway.payment_with_alias import (build_pay_with_alias_request_tree_xml,
+                                                  pay_with_alias_and_payment_method_template, pay_with_alias_template)
+from datatrans.gateway.refunding import build_refund_request_tree_xml, refund_template
+from datatrans.gateway.xml_templates import XmlTemplate
+
+VALUES = dict(
+    merchant_id='1234567',
+    client_ref='abcdef',
+    amount='12300',
+    currency='CHF',
+    card_alias='70119122433810042',
+    expiry_month='12',
+    expiry_year='18',
+    sign='c8f5b9f2f3f8e5f3',
+)
+
+UNUSUAL_VALUES = ['', 'a&b', '<ref>', 'say "hi"', "it's", 'line\nbreak', 'tab\t', 'café', '€', '100%']
+
+
+class XmlTemplateTest(TestCase):
+    def test_same_bytes_as_element_tree(self):
+        assert pay_with_alias_template.render(**VALUES) == build_pay_with_alias_request_tree_xml(**VALUES)
+        assert (pay_with_alias_and_payment_method_template.render(payment_method='REK', **VALUES) ==
+                build_pay_with_alias_request_tree_xml(payment_method='REK', **VALUES))
+
+        refund_values = dict(merchant_id='1234567', client_ref='abcdef-r', amount='500', currency='CHF',
+                             original_transaction_id='12345', sign='cae361426f')
+        assert refund_template.render(**refund_values) == build_refund_request_tree_xml(**refund_values)
+
+    def test_unusual_values(self):
+        for value in UNUSUAL_VALUES:
+            for name in ['client_ref', 'card_alias']:
+                values = dict(VALUES, **{name: value})
+                assert pay_with_alias_template.render(**values) == build_pay_with_alias_request_tree_xml(**values)
+
+    def test_not_a_string(self):
+        values = dict(VALUES, card_alias=None)
+        assert b'<aliasCC />' in pay_with_alias_template.render(**values)
+
+    def test_each_value_once(self):
+        def build(a):
+            return '<a b="{0}">{0}</a>'.format(a).encode()
+        with self.assertRaises(ValueError):
+            XmlTemplate(build, ['a'])
@@ -0,0 +1,83 @@
+from django.contrib.admin.sites import site
+from django.test import RequestFactory, TestCase
+from moneyed import Money
+
+from datatrans.models import Payment, Refund
+
+
+class PaymentSearchTest(TestCase):
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            success=True,
+            transaction_id='170717104749732144',
+            merchant_id='2222222222',
+            client_ref='order-42',
+            amount=Money(10, 'CHF'),
+            masked_card_number='424242xxxxxx4242',
+            card_alias='70119122433810042',
+            expiry_month=12,
+            expiry_year=18,
+        )
+        Payment.objects.create(
+            success=False,
+            transaction_id='170717104749732145',
+            merchant_id='2222222222',
+            client_ref='order-43',
+            amount=Money(10, 'CHF'),
+            masked_card_number='510000xxxxxx0001',
+            expiry_month=12,
+            expiry_year=18,
+            error_message='declined',
+        )
+        self.admin = site._registry[Payment]
+        self.request = RequestFactory().get('/')
+
+    def search(self, term):
+        queryset, use_distinct = self.admin.get_search_results(self.request, Payment.objects.all(), term)
+        assert not use_distinct
+        return queryset
+
+    def test_transaction_id_uses_equality(self):
+        queryset = self.search('170717104749732144')
+        assert list(queryset) == [self.payment]
+        assert 'LIKE' not in str(queryset.query)
+
+    def test_uuid_with_or_without_hyphens(self):
+        assert list(self.search(str(self.payment.pk))) == [self.payment]
+        assert list(self.search(self.payment.pk.hex)) == [self.payment]
+
+    def test_card_tail(self):
+        queryset = self.search('4242')
+        assert list(queryset) == [self.payment]
+        assert 'LIKE' not in str(queryset.query)
+
+    def test_card_tail_is_stored(self):
+        assert self.payment.card_tail == '4242'
+        assert Payment.objects.get(transaction_id='170717104749732145').card_tail == '0001'
+        assert Payment.objects.filter(card_tail='4242').get() == self.payment
+
+    def test_refno_and_card_alias(self):
+        assert list(self.search('order-42')) == [self.payment]
+        assert list(self.search('70119122433810042')) == [self.payment]
+
+    def test_free_text(self):
+        queryset = self.search('declin')
+        assert [payment.client_ref for payment in queryset] == ['order-43']
+
+    def test_empty_term(self):
+        assert self.search(' ').count() == 2
+
+
+class RefundSearchTest(TestCase):
+    def test_original_payment_transaction_id(self):
+        refund = Refund.objects.create(
+            success=True,
+            transaction_id='170720154219386737',
+            merchant_id='2222222222',
+            payment_transaction_id='170719094930353253',
+            client_ref='1234',
+            amount=Money(5, 'CHF'),
+        )
+        queryset, _ = site._registry[Refund].get_search_results(
+            RequestFactory().get('/'), Refund.objects.all(), '170719094930353253')
+        assert list(queryset) == [refund]
@@ -0,0 +1,46 @@
+import hashlib
+from unittest import mock
+
+from django.test import TestCase
+
+from datatrans.body_logging import full_body_logging, log_body
+from datatrans.config import config
+
+XML = b'<paymentService version="1"><body merchantId="1234567"/></paymentService>'
+
+
+class BodyLoggingTest(TestCase):
+    def test_full_by_default(self):
+        assert repr(log_body('sending-refund-request', XML)) == repr(XML)
+
+    def test_max_size(self):
+        with mock.patch.object(config, 'body_log_max_size', 16):
+            assert repr(log_body('sending-refund-request', XML)) == "b'<paymentService '... (73 bytes)"
+
+    def test_hash(self):
+        with mock.patch.object(config, 'body_logging', 'hash'):
+            logged = log_body('sending-refund-request', XML)
+        assert repr(logged) == 'sha256:{} (73 bytes)'.format(hashlib.sha256(XML).hexdigest())
+
+    def test_sampling(self):
+        with mock.patch.object(config, 'body_log_sampling', {'datatrans-webhook': 0.5}):
+            with mock.patch('random.random', return_value=0.7):
+                assert repr(log_body('datatrans-webhook', XML)) == '(73 bytes)'
+                assert repr(log_body('sending-refund-request', XML)) == repr(XML)
+            with mock.patch('random.random', return_value=0.2):
+                assert repr(log_body('datatrans-webhook', XML)) == repr(XML)
+
+    def test_rendering_is_deferred_and_done_once(self):
+        body = mock.Mock()
+        body.__repr__ = mock.Mock(return_value='<Payment>')
+        logged = log_body('processing-notification', body)
+        body.__repr__.assert_not_called()
+        assert str(logged) == repr(logged) == '<Payment>'
+        assert body.__repr__.call_count == 1
+
+    def test_full_body_logging_on_demand(self):
+        with mock.patch.object(config, 'body_logging', 'size'):
+            with full_body_logging():
+                logged = log_body('datatrans-webhook', XML)
+            assert repr(log_body('datatrans-webhook', XML)) == '(73 bytes)'
+        assert repr(logged) == repr(XML)
@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from moneyed import Money
+
+from datatrans.config import config, sign_many, sign_mpo, sign_web
+from datatrans.gateway import build_payment_parameters, resilience, xml_parsing
+from datatrans.gateway.notification import parse_notification_xml
+from datatrans.gateway.payment_with_alias import build_pay_with_alias_request_xml, mpo_merchant_of
+from datatrans.gateway.refunding import build_refund_request_xml
+from datatrans.models import AliasRegistration
+from datatrans.simulator import build_notification_xml
+
+
+class SignTest(TestCase):
+    def test_sign_web(self):
+        assert sign_web('1111111111', 850, 'CHF', '91827364') == \
+            'afdd2eef36dd6f39222ee6c3bb641c9731817508068f3e807c21adb3fe483d04'
+
+    def test_signatures_do_not_leak_into_each_other(self):
+        first = sign_web('1111111111', 850, 'CHF', '91827364')
+        sign_web('something', 'else')
+        assert sign_web('1111111111', 850, 'CHF', '91827364') == first
+
+    def test_sign_many(self):
+        rows = [('1111111111', 850, 'CHF', '91827364'), ('2222222222', 12300, 'CHF', 'abcdef')]
+        assert sign_many(rows) == [sign_web(*row) for row in rows]
+        assert sign_many(rows, use_mpo_key=True) == [sign_mpo(*row) for row in rows]
+
+
+def datatrans_settings(**overrides):
+    return override_settings(DATATRANS=dict(settings.DATATRANS, **overrides))
+
+
+class ConfigTest(TestCase):
+    def test_defaults(self):
+        assert config.web_merchant_id == '1111111111'
+        assert config.webhook_mode == 'inline'
+        assert config.datatrans_authorize_url == 'https://api.sandbox.datatrans.com/upp/jsp/XML_authorize.jsp'
+
+    def test_values_are_cached(self):
+        assert config.http_pool_size == 10
+        assert config.__dict__['http_pool_size'] == 10
+
+    def test_settings_changes_are_followed(self):
+        signature = sign_web('1111111111', 850, 'CHF', '91827364')
+        with datatrans_settings(WEB_HMAC_KEY='CC' * 64, ENVIRONMENT='PRODUCTION', WEBHOOK_MODE='inbox'):
+            assert sign_web('1111111111', 850, 'CHF', '91827364') != signature
+            assert config.datatrans_authorize_url == 'https://api.datatrans.com/upp/jsp/XML_authorize.jsp'
+            assert config.datatrans_js_url.startswith('https://pay.datatrans.com/')
+            assert config.webhook_mode == 'inbox'
+        assert sign_web('1111111111', 850, 'CHF', '91827364') == signature
+        assert config.webhook_mode == 'inline'
+
+    def test_api_base_url(self):
+        with datatrans_settings(API_BASE_URL='http://127.0.0.1:8000/'):
+            assert config.datatrans_processor_url == 'http://127.0.0.1:8000/upp/jsp/XML_processor.jsp'
+
+    def test_dependent_objects_are_rebuilt(self):
+        with datatrans_settings(RATE_LIMIT=5, CIRCUIT_BREAKER_FAILURES=0, XML_PARSER='lxml'):
+            assert resilience.rate_limiter is not None and resilience.rate_limiter.rate == 5
+            assert resilience.circuit_breaker is None
+            assert type(xml_parsing.fromstring('<a/>')).__module__ == 'lxml.etree'
+        assert resilience.rate_limiter is None
+        assert resilience.circuit_breaker is not None
+        assert type(xml_parsing.fromstring('<a/>')).__module__ == 'xml.etree.ElementTree'
+
+    def test_module_attributes(self):
+        from datatrans.config import datatrans_js_url, datatrans_processor_url, mpo_merchant_id, web_merchant_id
+        assert (web_merchant_id, mpo_merchant_id) == ('1111111111', '2222222222')
+        assert datatrans_js_url == 'https://pay.sandbox.datatrans.com/upp/payment/js/datatrans-2.0.0.min.js'
+        assert datatrans_processor_url == 'https://api.sandbox.datatrans.com/upp/jsp/XML_processor.jsp'
+
+    def test_missing_required_setting(self):
+        with override_settings(DATATRANS={}):
+            with self.assertRaises(KeyError):
+                config.web_merchant_id
+
+
+SHOPS = {
+    '3333333333': {'HMAC_KEY': 'CC' * 64, 'MPO_MERCHANT_ID': '4444444444'},
+    '4444444444': {'HMAC_KEY': 'DD' * 64, 'ENVIRONMENT': 'PRODUCTION'},
+}
+
+
+def sign_with(key, *values):
+    return hmac.new(bytearray.fromhex(key), ''.join(map(str, values)).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class MerchantsTest(TestCase):
+    def test_default_merchants(self):
+        assert set(config.merchants) == {'1111111111', '2222222222'}
+        assert config.merchant('2222222222').sign('a', 1) == sign_mpo('a', 1)
+        assert config.merchant('1111111111').mpo_merchant_id == '2222222222'
+        # Unknown merchants get the key of the web merchant.
+        assert config.merchant('1234567').sign('a', 1) == sign_web('a', 1)
+
+    def test_unknown_mpo_merchant(self):
+        shops = dict(SHOPS, **{'3333333333': dict(SHOPS['3333333333'], MPO_MERCHANT_ID='4444444445')})
+        with datatrans_settings(MERCHANTS=shops):
+            with self.assertRaisesMessage(ImproperlyConfigured, '4444444445'):
+                config.merchant('3333333333')
+
+    def test_payment_parameters(self):
+        with datatrans_settings(MERCHANTS=SHOPS):
+            parameters = build_payment_parameters(Money(8.50, 'CHF'), '91827364', merchant_id='3333333333')
+            assert parameters.merchant_id == '3333333333'
+            assert parameters.sign == sign_with('CC' * 64, '3333333333', 850, 'CHF', '91827364')
+            assert build_payment_parameters(Money(8.50, 'CHF'), '91827364').merchant_id == '1111111111'
+            with self.assertRaisesRegex(ValueError, 'Unknown merchant'):
+                build_payment_parameters(Money(8.50, 'CHF'), '91827364', merchant_id='1234567')
+
+    def test_pay_with_alias_and_refund(self):
+        alias_registration = AliasRegistration(merchant_id='3333333333', card_alias='70119122433810042',
+                                               expiry_month=12, expiry_year=18, payment_method='VIS')
+        with datatrans_settings(MERCHANTS=SHOPS):
+            merchant = mpo_merchant_of(alias_registration)
+            assert merchant.authorize_url == 'https://api.datatrans.com/upp/jsp/XML_authorize.jsp'
+            xml = build_pay_with_alias_request_xml(Money(123, 'CHF'), 'abcdef', alias_registration)
+            refund_xml = build_refund_request_xml(Money(123, 'CHF'), 'abcdef-r', '170717104749732144', '4444444444')
+        assert b'merchantId="4444444444"' in xml
+        assert sign_with('DD' * 64, '4444444444', 12300, 'CHF', 'abcdef').encode() in xml
+        assert sign_with('DD' * 64, '4444444444', 12300, 'CHF', 'abcdef-r').encode() in refund_xml
+
+    def test_refunds_of_undeclared_merchants_are_signed_with_the_web_key(self):
+        xml = build_refund_request_xml(Money(123, 'CHF'), 'abcdef-r', '170717104749732144', '2222222222')
+        assert sign_web('2222222222', 12300, 'CHF', 'abcdef-r').encode() in xml
+
+    def test_payment_page_of_each_merchant(self):
+        with datatrans_settings(MERCHANTS=SHOPS):
+            assert config.merchant('4444444444').js_url.startswith('https://pay.datatrans.com/')
+            assert config.merchant('3333333333').js_url == config.datatrans_js_url
+            assert config.datatrans_js_url.startswith('https://pay.sandbox.datatrans.com/')
+
+    def test_notification_signatures(self):
+        with datatrans_settings(MERCHANTS=SHOPS):
+            xml = build_notification_xml('3333333333', 'abc', '170707111922838874', '1000', 'CHF', declined=False)
+            assert parse_notification_xml(xml).merchant_id == '3333333333'
+        with self.assertRaisesRegex(ValueError, 'sign2'):
+            parse_notification_xml(xml)
@@ -0,0 +1,68 @@
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from moneyed import Money
+
+from datatrans.expiring import expiring_alias_registrations, send_alias_expiring
+from datatrans.models import AliasRegistration
+from datatrans.signals import alias_expiring
+
+
+def register(transaction_id, card_alias, expiry_month, expiry_year, success=True):
+    return AliasRegistration.objects.create(
+        success=success,
+        transaction_id=transaction_id,
+        merchant_id='1111111111',
+        masked_card_number='424242xxxxxx4242',
+        card_alias=card_alias,
+        expiry_month=expiry_month,
+        expiry_year=expiry_year,
+        client_ref='1234',
+        amount=Money(0, 'CHF'),
+        payment_method='VIS',
+    )
+
+
+class ExpiringAliasRegistrationsTest(TestCase):
+    def setUp(self):
+        register('170707111922838870', '70119122433810040', 1, 18)  # Before the window
+        register('170707111922838871', '70119122433810041', 2, 18)
+        register('170707111922838872', '70119122433810042', 3, 18)
+        register('170707111922838873', '70119122433810042', 3, 18)  # The same card, registered again
+        register('170707111922838874', '70119122433810044', 3, 18, success=False)
+        register('170707111922838875', '70119122433810045', 5, 18)  # After the window
+
+    def transaction_ids(self, alias_registrations):
+        return [alias_registration.transaction_id for alias_registration in alias_registrations]
+
+    def test_window(self):
+        alias_registrations = expiring_alias_registrations(
+            until=date(2018, 4, 30), since=date(2018, 2, 1), chunk_size=1)
+        assert sorted(self.transaction_ids(alias_registrations)) == [
+            '170707111922838871', '170707111922838872', '170707111922838873']
+
+    def test_distinct_card_alias(self):
+        alias_registrations = expiring_alias_registrations(
+            until=date(2018, 4, 30), since=date(2018, 2, 1), distinct_card_alias=True, chunk_size=2)
+        assert len(self.transaction_ids(alias_registrations)) == 2
+
+    def test_signal(self):
+        handler = mock.Mock()
+        alias_expiring.connect(handler)
+        try:
+            count = send_alias_expiring(until=date(2018, 4, 30), since=date(2018, 2, 1), chunk_size=2)
+        finally:
+            alias_expiring.disconnect(handler)
+        assert count == 3
+        assert [len(call[1]['instances']) for call in handler.call_args_list] == [2, 1]
+
+    def test_command(self):
+        out = StringIO()
+        call_command('datatrans_expiring_aliases', '--since=2018-02-01', '--days=60', '--distinct-card-alias',
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        assert len(lines) == 3
+        assert lines[1].endswith(',70119122433810041,424242xxxxxx4242,VIS,2018-02-28,1234')
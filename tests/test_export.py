@@ -0,0 +1,55 @@
+import csv
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from moneyed import Money
+
+from datatrans.export import export_csv, export_jsonl
+from datatrans.models import Payment
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Payment.objects.create(
+                success=True,
+                transaction_id='17071710474973214{}'.format(i),
+                merchant_id='2222222222',
+                client_ref=str(i),
+                amount=Money(10, 'CHF'),
+                expiry_month=12,
+                expiry_year=18,
+            )
+
+    def test_export_csv(self):
+        rows = list(csv.DictReader(export_csv(Payment.objects.all(), chunk_size=2)))
+        assert len(rows) == 5
+        assert rows[0]['amount'] == '10.00'
+        assert rows[0]['amount_currency'] == 'CHF'
+        assert rows[0]['expiry_date'] == '2018-12-31'
+
+    def test_export_jsonl(self):
+        rows = [json.loads(line) for line in export_jsonl(Payment.objects.filter(client_ref='3'))]
+        assert len(rows) == 1
+        assert rows[0]['transaction_id'] == '170717104749732143'
+        assert rows[0]['success'] is True
+
+    def test_admin_action(self):
+        client = self.client
+        client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = client.post(reverse('admin:datatrans_payment_changelist'), {
+            'action': 'export_as_csv',
+            '_selected_action': [str(pk) for pk in Payment.objects.values_list('pk', flat=True)[:2]],
+        })
+        assert response.streaming
+        assert response['Content-Disposition'] == 'attachment; filename="payments.csv"'
+        assert len(b''.join(response.streaming_content).splitlines()) == 3
+
+    def test_command(self):
+        out = StringIO()
+        call_command('datatrans_export', 'payment', '--format=jsonl', stdout=out)
+        assert len(out.getvalue().splitlines()) == 5
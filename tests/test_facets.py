@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from moneyed import Money
+
+from datatrans.facets import clear_facet_values, facet_values
+from datatrans.models import Payment, bulk_record
+
+
+def payment(transaction_id, currency='CHF', country='CHE'):
+    return Payment(
+        success=True,
+        transaction_id=transaction_id,
+        merchant_id='2222222222',
+        client_ref=transaction_id[-4:],
+        amount=Money(10, currency),
+        payment_method='VIS',
+        credit_card_country=country,
+        expiry_month=12,
+        expiry_year=18,
+    )
+
+
+class FacetsTest(TestCase):
+    def setUp(self):
+        clear_facet_values()
+        payment('170717104749732140').save()
+
+    def tearDown(self):
+        clear_facet_values()
+
+    def test_values_are_cached(self):
+        with self.assertNumQueries(1):
+            assert facet_values(Payment, 'amount_currency') == ['CHF']
+            assert facet_values(Payment, 'amount_currency') == ['CHF']
+
+    def test_signals_add_values(self):
+        facet_values(Payment, 'credit_card_country')
+        new = payment('170717104749732141', country='DEU')
+        new.save()
+        new.send_signal()
+        with self.assertNumQueries(1):
+            assert facet_values(Payment, 'credit_card_country') == ['CHE', 'DEU']
+
+    def test_known_values_keep_the_cache(self):
+        facet_values(Payment, 'credit_card_country')
+        new = payment('170717104749732141')
+        new.save()
+        new.send_signal()
+        with self.assertNumQueries(0):
+            assert facet_values(Payment, 'credit_card_country') == ['CHE']
+
+    def test_admin_filter(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        facet_values(Payment, 'amount_currency')
+        payment('170717104749732142', currency='EUR').save()
+        response = self.client.get(reverse('admin:datatrans_payment_changelist'))
+        assert response.status_code == 200
+        # Without a signal the new currency is not offered yet, until the cache expires.
+        assert b'?amount_currency=CHF' in response.content
+        assert b'?amount_currency=EUR' not in response.content
+
+
+class FacetsBulkRecordTest(TransactionTestCase):
+    def test_bulk_record_adds_values(self):
+        clear_facet_values()
+        assert facet_values(Payment, 'amount_currency') == []
+        bulk_record([payment('170717104749732143', currency='USD')], per_row_signals=False)
+        assert facet_values(Payment, 'amount_currency') == ['USD']
+        clear_facet_values()
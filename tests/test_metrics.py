@@ -0,0 +1,59 @@
+from unittest import mock
+
+from django.test import Client, TestCase
+from django.urls import reverse
+from moneyed import Money
+
+from datatrans import metrics
+from datatrans.config import config
+from datatrans.models import Payment
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.clear()
+
+    def tearDown(self):
+        metrics.clear()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', 'A test.', ['stage'], buckets=(0.1, 1))
+        histogram.observe(0.1, stage='a')
+        histogram.observe(5, stage='a')
+        lines = list(histogram.collect())
+        metrics._registry.remove(histogram)
+        assert lines == [
+            'test_seconds_bucket{stage="a",le="0.1"} 1',
+            'test_seconds_bucket{stage="a",le="1.0"} 1',
+            'test_seconds_bucket{stage="a",le="+Inf"} 2',
+            'test_seconds_sum{stage="a"} 5.1',
+            'test_seconds_count{stage="a"} 2',
+        ]
+
+    def test_transactions_and_signals(self):
+        payment = Payment.objects.create(
+            success=False,
+            transaction_id='170802095839802669',
+            merchant_id='1111111111',
+            client_ref='5',
+            amount=Money(5, 'CHF'),
+            payment_method='VIS',
+            error_code='-999',
+        )
+        payment.send_signal()
+        assert metrics.transactions.value(
+            type='Payment', success=False, error_code='-999', payment_method='VIS', response_code='') == 1
+        assert metrics.signal_seconds.count(signal='payment_by_user_done') == 1
+
+    def test_view(self):
+        metrics.webhook_seconds.observe(0.002, stage='parse')
+        response = Client().get(reverse('datatrans_metrics'))
+        assert response.status_code == 404
+
+        with mock.patch.object(config, 'metrics_view_enabled', True):
+            response = Client().get(reverse('datatrans_metrics'))
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        content = response.content.decode()
+        assert '# TYPE datatrans_webhook_seconds histogram' in content
+        assert 'datatrans_webhook_seconds_count{stage="parse"} 1' in content
@@ -1,9 +1,12 @@
 from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from moneyed import Money
 
-from datatrans.models import AliasRegistration, Payment, Refund
+from datatrans.models import AliasRegistration, Payment, Refund, SignalError, bulk_record
+from datatrans.signals import payment_with_alias_done, refund_done, transactions_recorded
 
 
 class AliasRegistrationModelTest(TestCase):
@@ -29,6 +32,7 @@ class AliasRegistrationModelTest(TestCase):
         alias_registration.full_clean()
         alias_registration.save()
         assert alias_registration.expiry_date == date(2018, 12, 31)
+        assert alias_registration.card_tail == '4242'
 
     def test_minimal_fields(self):
         alias_registration = AliasRegistration(
@@ -158,3 +162,124 @@ class RefundModelTest(TestCase):
         )
         refund2.full_clean()
         refund2.save()
+
+
+class RefundedTotalTest(TestCase):
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            success=True,
+            transaction_id='170803184046388845',
+            merchant_id='1111111111',
+            client_ref='1234',
+            amount=Money(10, 'CHF'),
+        )
+
+    def refund(self, transaction_id, amount, success=True):
+        return Refund(
+            success=success,
+            transaction_id=transaction_id,
+            merchant_id='1111111111',
+            payment_transaction_id='170803184046388845',
+            client_ref='1234-r',
+            amount=Money(amount, 'CHF'),
+        )
+
+    def test_successful_refunds_are_added(self):
+        self.refund('171015120225118036', 3).save()
+        self.refund(None, 2, success=False).save()
+        refund = self.refund('171015120225118037', '1.50')
+        refund.save()
+        refund.save()  # Updating a refund does not count it twice.
+
+        payment = Payment.objects.get()
+        assert payment.refunded_total == Decimal('4.50')
+        assert payment.refundable_amount == Money('5.50', 'CHF')
+
+    def test_bulk_record(self):
+        bulk_record([self.refund('171015120225118036', 3), self.refund('171015120225118037', 4)])
+        assert Payment.objects.get().refundable_amount == Money(3, 'CHF')
+
+
+class BulkRecordTest(TransactionTestCase):
+    def test_bulk_record(self):
+        alias_registration = AliasRegistration(
+            success=True,
+            transaction_id='170707111922838874',
+            merchant_id='1111111111',
+            card_alias='70119122433810042',
+            masked_card_number='424242xxxxxx4242',
+            expiry_month=12,
+            expiry_year=18,
+            client_ref='1234',
+            amount=Money(0, 'CHF'),
+            payment_method='VIS',
+        )
+        payments = [
+            Payment(
+                success=True,
+                transaction_id='17071710474973214{}'.format(i),
+                merchant_id='2222222222',
+                card_alias='70119122433810042',
+                expiry_month=11,
+                expiry_year=19,
+                client_ref=str(i),
+                amount=Money(10, 'CHF'),
+            ) for i in range(3)]
+
+        recorded = mock.Mock()
+        charged = mock.Mock()
+        transactions_recorded.connect(recorded)
+        payment_with_alias_done.connect(charged)
+        try:
+            bulk_record([alias_registration] + payments)
+        finally:
+            transactions_recorded.disconnect(recorded)
+            payment_with_alias_done.disconnect(charged)
+
+        assert AliasRegistration.objects.get().expiry_date == date(2018, 12, 31)
+        assert AliasRegistration.objects.get().card_tail == '4242'
+        assert Payment.objects.filter(expiry_date=date(2019, 11, 30)).count() == 3
+        recorded.assert_any_call(sender=Payment, signal=transactions_recorded, instances=payments)
+        assert recorded.call_count == 2
+        assert charged.call_count == 3
+
+    def test_bulk_record_without_per_row_signals(self):
+        refund = Refund(
+            success=False,
+            merchant_id='1111111111',
+            payment_transaction_id='170803184046388845',
+            client_ref='1234-r',
+            amount=Money(1, 'CHF'),
+            error_code='2000',
+        )
+        handler = mock.Mock()
+        refund_done.connect(handler)
+        try:
+            bulk_record([refund], per_row_signals=False)
+        finally:
+            refund_done.disconnect(handler)
+
+        assert Refund.objects.count() == 1
+        handler.assert_not_called()
+
+    def test_a_failing_receiver_does_not_stop_the_other_signals(self):
+        refunds = [
+            Refund(
+                success=False,
+                merchant_id='1111111111',
+                payment_transaction_id='170803184046388845',
+                client_ref=client_ref,
+                amount=Money(1, 'CHF'),
+                error_code='2000',
+            ) for client_ref in ['1234-r', '1235-r']]
+        handler = mock.Mock(side_effect=[ValueError('receiver failed'), None])
+        refund_done.connect(handler)
+        try:
+            with self.assertRaises(SignalError) as cm:
+                bulk_record(refunds)
+        finally:
+            refund_done.disconnect(handler)
+
+        assert Refund.objects.count() == 2
+        assert handler.call_count == 2
+        assert list(cm.exception.errors) == [refunds[0]]
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from moneyed import Money
+
+from datatrans.models import Payment
+from datatrans.pagination import KeysetPaginator, estimated_count
+
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for i in range(7):
+            payment = Payment.objects.create(
+                success=True,
+                transaction_id='17071710474973214{}'.format(i),
+                merchant_id='2222222222',
+                client_ref=str(i),
+                amount=Money(10, 'CHF'),
+                expiry_month=12,
+                expiry_year=18,
+            )
+            # Two payments per second, so that pages are split between rows created at the same time.
+            Payment.objects.filter(pk=payment.pk).update(created=now - timedelta(seconds=i // 2))
+
+    def assert_same_pages(self, queryset):
+        paginator = KeysetPaginator(queryset, 3)
+        expected = list(queryset)
+        pages = [list(paginator.page(number).object_list) for number in paginator.page_range]
+        assert [payment for page in pages for payment in page] == expected
+        assert [len(page) for page in pages] == [3, 3, 1]
+
+    def test_descending(self):
+        self.assert_same_pages(Payment.objects.order_by('-created', '-id'))
+
+    def test_ascending(self):
+        self.assert_same_pages(Payment.objects.order_by('created', 'pk'))
+
+    def test_other_ordering_uses_offsets(self):
+        self.assert_same_pages(Payment.objects.order_by('client_ref'))
+
+    def test_count_is_exact_without_statistics(self):
+        assert estimated_count(Payment.objects.order_by('-created')) is None
+        assert KeysetPaginator(Payment.objects.order_by('-created'), 3).count == 7
+
+    def test_admin_changelist(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:datatrans_payment_changelist'))
+        assert response.status_code == 200
+        changelist = response.context['cl']
+        assert isinstance(changelist.paginator, KeysetPaginator)
+        assert list(changelist.result_list) == list(Payment.objects.order_by('-created', '-id'))
@@ -0,0 +1,69 @@
+from io import StringIO
+from tempfile import NamedTemporaryFile
+
+from django.core.management import call_command
+from django.test import TestCase
+from moneyed import Money
+
+from datatrans.models import Payment, ReconciliationResult, Refund
+from datatrans.reconciliation import read_settlement_report, reconcile
+
+REPORT = """transaction_id;amount;currency
+170803184046388845;10.00;CHF
+171015120225118036;-4.00;chf
+170803184046388846;12.00;CHF
+999999999999999999;1.00;CHF
+"""
+
+
+class ReconciliationTest(TestCase):
+    def setUp(self):
+        for transaction_id, amount in [('170803184046388845', 10), ('170803184046388846', 11)]:
+            Payment.objects.create(
+                success=True,
+                transaction_id=transaction_id,
+                merchant_id='1111111111',
+                client_ref='1234',
+                amount=Money(amount, 'CHF'),
+            )
+        Refund.objects.create(
+            success=True,
+            transaction_id='171015120225118036',
+            merchant_id='1111111111',
+            payment_transaction_id='170803184046388845',
+            client_ref='1234-r',
+            amount=Money(4, 'CHF'),
+        )
+
+    def test_reconcile(self):
+        rows = read_settlement_report(StringIO(REPORT), delimiter=';')
+        summary = reconcile(rows, report='report.csv', batch_size=3)
+        assert (summary.matched, summary.missing, summary.amount_mismatch) == (2, 1, 1)
+
+        results = {result.transaction_id: result for result in ReconciliationResult.objects.filter(run=summary.run)}
+        assert results['171015120225118036'].status == ReconciliationResult.MATCHED
+        assert results['171015120225118036'].transaction_type == 'refund'
+        mismatch = results['170803184046388846']
+        assert mismatch.status == ReconciliationResult.AMOUNT_MISMATCH
+        assert mismatch.line == 4
+        assert mismatch.recorded_amount == 11
+        assert results['999999999999999999'].status == ReconciliationResult.MISSING
+
+    def test_invalid_amount_leaves_no_results(self):
+        rows = read_settlement_report(StringIO(REPORT + '170803184046388847;ten;CHF\n'), delimiter=';')
+        with self.assertRaisesMessage(ValueError, 'Invalid amount on line 6'):
+            reconcile(rows, batch_size=2)
+        assert not ReconciliationResult.objects.exists()
+
+    def test_missing_column(self):
+        with self.assertRaisesMessage(ValueError, 'no column currency'):
+            list(read_settlement_report(StringIO('transaction_id,amount\n1,2\n')))
+
+    def test_command(self):
+        with NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(REPORT.replace(';', ','))
+            f.flush()
+            out = StringIO()
+            call_command('datatrans_reconcile', f.name, stdout=out)
+        assert '2 matched, 1 missing, 1 amount mismatch' in out.getvalue()
+        assert ReconciliationResult.objects.count() == 4
@@ -0,0 +1,92 @@
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from moneyed import Money
+
+from datatrans.gateway import pay_with_alias, refund
+from datatrans.gateway.notification import parse_notification_xml
+from datatrans.models import AliasRegistration, Payment
+from datatrans.simulator import DatatransSimulator, simulator_behavior
+
+
+def point_gateway_to(simulator):
+    return override_settings(DATATRANS=dict(settings.DATATRANS, API_BASE_URL=simulator.base_url))
+
+
+class SimulatorTestMixin:
+    behavior = simulator_behavior()
+
+    def setUp(self):
+        self.simulator = DatatransSimulator(self.behavior, port=0, seed=1)
+        self.simulator.start()
+        self.settings_override = point_gateway_to(self.simulator)
+        self.settings_override.enable()
+        self.alias_registration = AliasRegistration.objects.create(
+            success=True,
+            merchant_id='1111111111',
+            client_ref='1234',
+            amount=Money(0, 'CHF'),
+            payment_method='VIS',
+            card_alias='70119122433810042',
+            expiry_month=12,
+            expiry_year=18,
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.simulator.stop()
+
+
+class SimulatorTest(SimulatorTestMixin, TestCase):
+    def test_pay_with_alias_and_refund(self):
+        payment = pay_with_alias(Money(10, 'CHF'), self.alias_registration.pk, 'abc')
+        assert payment.success
+        assert payment.amount == Money(10, 'CHF')
+        assert len(payment.transaction_id) == 18
+
+        r = refund(Money(4, 'CHF'), payment.pk)
+        assert r.success
+        assert r.payment_transaction_id == payment.transaction_id
+
+    def test_notification(self):
+        with mock.patch.object(self.simulator, 'behavior', self.behavior._replace(webhook_url='http://webhook')), \
+                mock.patch.object(self.simulator, 'send_notification') as send_notification:
+            payment = pay_with_alias(Money(10, 'CHF'), self.alias_registration.pk, 'abc')
+            self.simulator._notifier.shutdown(wait=True)
+
+        notification = parse_notification_xml(send_notification.call_args[0][0])
+        assert notification.transaction_id == payment.transaction_id
+        assert notification.success
+
+
+class DecliningSimulatorTest(SimulatorTestMixin, TestCase):
+    behavior = simulator_behavior(error_ratio=1, acquirer_error_codes=['51'])
+
+    def test_declined(self):
+        payment = pay_with_alias(Money(10, 'CHF'), self.alias_registration.pk, 'abc')
+        assert not payment.success
+        assert payment.error_code == '1403'
+        assert payment.acquirer_error_code == '51'
+
+
+class LoadTestCommandTest(SimulatorTestMixin, TransactionTestCase):
+    def test_loadtest(self):
+        out = StringIO()
+        call_command('datatrans_loadtest', '--requests=20', '--concurrency=1',
+                     '--alias-registration={}'.format(self.alias_registration.pk), stdout=out)
+        assert '20 requests' in out.getvalue()
+        assert 'success: 20, declined: 0, error: 0' in out.getvalue()
+        assert 'p99' in out.getvalue()
+        assert Payment.objects.count() == 20
+
+    def test_refuses_to_charge_a_production_merchant(self):
+        merchants = {'1111111111': {'HMAC_KEY': 'CC' * 64, 'MPO_MERCHANT_ID': '4444444444'},
+                     '4444444444': {'HMAC_KEY': 'DD' * 64, 'ENVIRONMENT': 'PRODUCTION'}}
+        with override_settings(DATATRANS=dict(settings.DATATRANS, MERCHANTS=merchants)):
+            with self.assertRaisesRegex(CommandError, '4444444444'):
+                call_command('datatrans_loadtest', '--requests=1',
+                             '--alias-registration={}'.format(self.alias_registration.pk))
+        assert not Payment.objects.exists()
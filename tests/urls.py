@@ -1,8 +1,10 @@
+from django.contrib import admin
 from django.urls import include, path
 
 from datatrans.views import example
 
 urlpatterns = [
+    path('admin/', admin.site.urls),
     path(r'^datatrans/', include('datatrans.urls')),
     path(r'^example/register-credit-card$', example.register_credit_card, name='example_register_credit_card'),
     path(r'^example/pay$', example.pay, name='example_pay'),